@@ -1,8 +1,15 @@
 from flask import Flask,jsonify     
 from flask_cors import CORS
-from models import db
-from schemas import ma
 from routes import bp
+from cache import init_cache
+from querystats import init_query_stats
+from metrics import init_metrics
+from database import init_database, init_db_command, init_migrations
+from processing import init_processing
+from changes import init_changes
+from cleanup import init_cleanup
+from suggest import init_suggest
+from synthetic import seed_command
 import os
 
 def create_app():
@@ -19,8 +26,20 @@ def create_app():
     CORS(app, origins=allowed_origins, supports_credentials=True)
 
     
-    db.init_app(app)
-    ma.init_app(app)
+    init_metrics(app)
+    init_database(app)
+    # Alembic is only needed by the `flask db` commands; importing it costs
+    # more than the rest of the app, so web workers skip it
+    if os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+        init_migrations(app)
+    init_cache(app)
+    init_query_stats(app)
+    init_processing(app)
+    init_changes(app)
+    init_cleanup(app)
+    init_suggest(app)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(init_db_command)
 
 
     app.register_blueprint(bp, url_prefix='/api')
@@ -39,17 +58,9 @@ def create_app():
                 'users': '/api/users'
             }
         })
-    
-    # Create tables
-    with app.app_context():
-        instance_dir = os.path.join(app.root_path, 'instance')
-        os.makedirs(instance_dir, exist_ok=True)
-
-        uploads_dir = os.path.join(app.root_path, 'uploads')
-        os.makedirs(uploads_dir, exist_ok=True)
-
-        db.create_all()
 
+    # No database access here: the schema comes from `flask init-db`, so
+    # importing the app (every worker boot, every CLI command) stays cheap
     return app
 
 app = create_app()
@@ -0,0 +1,217 @@
+import os
+import struct
+import zlib
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from models import db, Blob, File, collection_files
+
+# Streaming ZIP writer for collection downloads. Each member is read from
+# the blob store in fixed-size chunks and written straight to the response:
+# no temp file, and no more than one read buffer (plus zlib's window) in
+# memory however large the archive. Sizes and CRCs follow each member in a
+# data descriptor, so nothing has to be known up front; ZIP64 records are
+# used for members, offsets and entry counts past the classic limits.
+#
+# When every member is stored rather than deflated, the archive length is
+# a function of names and sizes only, so the response can carry
+# Content-Length (and download managers can show progress).
+
+STORED = 0
+DEFLATED = 8
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_COUNT_LIMIT = 0xFFFF
+# General purpose flags: sizes in a data descriptor, UTF-8 names
+FLAGS = 0x08 | 0x800
+
+# Formats that are already compressed; deflating them again only costs CPU
+COMPRESSED_EXTENSIONS = frozenset((
+    '.7z', '.avi', '.bz2', '.docx', '.epub', '.flac', '.gif', '.gz', '.heic', '.jar', '.jpeg', '.jpg',
+    '.m4a', '.mkv', '.mov', '.mp3', '.mp4', '.odp', '.ods', '.odt', '.ogg', '.png', '.pptx', '.rar',
+    '.tgz', '.webm', '.webp', '.xlsx', '.xz', '.zip', '.zst',
+))
+COMPRESSED_MIME_PREFIXES = ('image/', 'video/', 'audio/')
+COMPRESSED_MIME_TYPES = frozenset((
+    'application/zip', 'application/gzip', 'application/x-7z-compressed', 'application/x-bzip2',
+    'application/x-xz', 'application/zstd',
+))
+UNCOMPRESSED_MIME_TYPES = frozenset(('image/bmp', 'image/svg+xml', 'image/tiff', 'audio/wav', 'audio/x-wav'))
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class Entry:
+    __slots__ = ('name', 'key', 'size', 'modified', 'method', 'crc', 'compressed_size', 'offset')
+
+    def __init__(self, name, key, size, modified, method):
+        self.name = name.encode('utf-8')
+        self.key = key
+        self.size = size
+        self.modified = modified
+        self.method = method
+        self.crc = 0
+        self.compressed_size = size if method == STORED else None
+        self.offset = 0
+
+    @property
+    def zip64(self):
+        # Decided before the data is read; same margin as the zipfile module
+        return self.size is None or self.size * 1.05 > ZIP64_LIMIT
+
+
+def is_compressed(filename, mime_type):
+    if os.path.splitext(filename)[1].lower() in COMPRESSED_EXTENSIONS:
+        return True
+    if not mime_type or mime_type in UNCOMPRESSED_MIME_TYPES:
+        return False
+    return mime_type in COMPRESSED_MIME_TYPES or mime_type.startswith(COMPRESSED_MIME_PREFIXES)
+
+
+def _dos_datetime(value):
+    value = min(max(value or datetime(1980, 1, 1), datetime(1980, 1, 1)), datetime(2107, 12, 31, 23, 59, 58))
+    dos_time = value.hour << 11 | value.minute << 5 | value.second // 2
+    dos_date = (value.year - 1980) << 9 | value.month << 5 | value.day
+    return dos_time, dos_date
+
+
+def local_header(entry):
+    dos_time, dos_date = _dos_datetime(entry.modified)
+    if entry.zip64:
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+        version, sizes = 45, ZIP64_LIMIT
+    else:
+        extra = b''
+        version, sizes = 20, 0
+    return struct.pack(
+        '<IHHHHHIIIHH', 0x04034b50, version, FLAGS, entry.method, dos_time, dos_date,
+        0, sizes, sizes, len(entry.name), len(extra),
+    ) + entry.name + extra
+
+
+def data_descriptor(entry):
+    if entry.zip64:
+        return struct.pack('<IIQQ', 0x08074b50, entry.crc, entry.compressed_size, entry.size)
+    return struct.pack('<IIII', 0x08074b50, entry.crc, entry.compressed_size, entry.size)
+
+
+def central_header(entry):
+    dos_time, dos_date = _dos_datetime(entry.modified)
+    # ZIP64 extra carries only the fields that overflow, in this order
+    overflow = [value for value in (entry.size, entry.compressed_size, entry.offset) if value >= ZIP64_LIMIT]
+    extra = struct.pack('<HH', 0x0001, 8 * len(overflow)) + struct.pack(f'<{len(overflow)}Q', *overflow) if overflow else b''
+    version = 45 if overflow or entry.zip64 else 20
+    return struct.pack(
+        '<IHHHHHHIIIHHHHHII', 0x02014b50, 3 << 8 | version, version, FLAGS, entry.method,
+        dos_time, dos_date, entry.crc,
+        min(entry.compressed_size, ZIP64_LIMIT), min(entry.size, ZIP64_LIMIT),
+        len(entry.name), len(extra), 0, 0, 0, 0o100644 << 16, min(entry.offset, ZIP64_LIMIT),
+    ) + entry.name + extra
+
+
+def end_records(count, directory_offset, directory_size):
+    records = b''
+    if count >= ZIP_COUNT_LIMIT or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+        zip64_end_offset = directory_offset + directory_size
+        records += struct.pack(
+            '<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, directory_size, directory_offset,
+        )
+        records += struct.pack('<IIQI', 0x07064b50, 0, zip64_end_offset, 1)
+    return records + struct.pack(
+        '<IHHHHIIH', 0x06054b50, 0, 0, min(count, ZIP_COUNT_LIMIT), min(count, ZIP_COUNT_LIMIT),
+        min(directory_size, ZIP64_LIMIT), min(directory_offset, ZIP64_LIMIT), 0,
+    )
+
+
+def archive_size(entries):
+    """Exact length of the archive, or None if any member is deflated."""
+    if any(entry.method != STORED or entry.size is None for entry in entries):
+        return None
+    offset = 0
+    for entry in entries:
+        entry.offset = offset
+        offset += len(local_header(entry)) + entry.size + len(data_descriptor(entry))
+    directory_size = sum(len(central_header(entry)) for entry in entries)
+    return offset + directory_size + len(end_records(len(entries), offset, directory_size))
+
+
+def stream_zip(store, entries, read_size=64 * 1024, level=6):
+    """Yield the archive as bytes chunks."""
+    offset = 0
+    for entry in entries:
+        entry.offset = offset
+        header = local_header(entry)
+        yield header
+        offset += len(header)
+
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if entry.method == DEFLATED else None
+        crc = size = written = 0
+        with store.open_range(entry.key) as src:
+            while True:
+                data = src.read(read_size)
+                if not data:
+                    break
+                crc = zlib.crc32(data, crc)
+                size += len(data)
+                if compressor is not None:
+                    data = compressor.compress(data)
+                if data:
+                    written += len(data)
+                    yield data
+        if compressor is not None:
+            data = compressor.flush()
+            written += len(data)
+            yield data
+        if entry.size is not None and size != entry.size:
+            # Headers already promised this size (and maybe Content-Length)
+            raise ArchiveError(f"{entry.key}: expected {entry.size} bytes, read {size}")
+        entry.crc, entry.size, entry.compressed_size = crc, size, written
+        descriptor = data_descriptor(entry)
+        yield descriptor
+        offset += written + len(descriptor)
+
+    directory_size = 0
+    for entry in entries:
+        header = central_header(entry)
+        directory_size += len(header)
+        yield header
+    yield end_records(len(entries), offset, directory_size)
+
+
+def _unique(name, seen):
+    name = name.replace('\\', '/').strip('/').replace('/', '_') or 'file'
+    stem, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate.lower() in seen:
+        n += 1
+        candidate = f"{stem} ({n}){ext}"
+    seen.add(candidate.lower())
+    return candidate
+
+
+def collection_entries(store, collection_id, compress=True):
+    """Archive members for a collection's stored files, in file id order."""
+    rows = db.session.execute(
+        select(
+            File.filename, File.path, File.mime_type, File.created_at,
+            func.coalesce(File.size_bytes, Blob.size_bytes),
+        )
+        .join(collection_files, collection_files.c.file_id == File.id)
+        .outerjoin(Blob, Blob.sha256 == File.blob_sha256)
+        .where(collection_files.c.collection_id == collection_id, File.path.isnot(None))
+        .order_by(File.id)
+    )
+    entries = []
+    seen = set()
+    for filename, key, mime_type, created_at, size in rows:
+        if size is None:
+            info = store.stat(key)
+            if info is None:
+                continue
+            size = info.size
+        method = DEFLATED if compress and not is_compressed(filename, mime_type) else STORED
+        entries.append(Entry(_unique(filename, seen), key, size, created_at, method))
+    return entries
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy.engine import make_url
+
+from database import is_memory_sqlite
+from models import db
+
+# Housekeeping that runs off the request path: each task gets a single
+# background thread per process and runs at most once per interval. Tasks
+# are started by the after_request hook, so an idle process does no work,
+# and every task also has a CLI command for cron-style scheduling.
+
+
+class PeriodicTask:
+    """Runs ``func()`` in a background thread at most once every ``interval`` seconds."""
+
+    def __init__(self, app, name, func, interval):
+        self.app = app
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._next_run = 0.0
+        self._executor = None
+        self._pid = None
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def poke(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_run and not force:
+                return
+            # Threads don't survive a fork; one executor per process
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+                self._pid = os.getpid()
+                self._pending = None
+            elif self._pending is not None and not self._pending.done():
+                return
+            self._next_run = now + self.interval
+            self._pending = self._executor.submit(self._run)
+
+    def _run(self):
+        with self.app.app_context():
+            try:
+                self.func()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception("%s failed", self.name)
+
+
+def _poke_tasks(response):
+    for task in current_app.extensions['periodic_tasks'].values():
+        task.poke()
+    return response
+
+
+def add_periodic_task(app, name, func, interval):
+    """Schedule ``func`` (called in an app context) unless ``interval`` is 0."""
+    if interval <= 0:
+        return None
+    # In-memory SQLite is one connection shared by every thread, so work
+    # from a background thread would interleave with the requests' own
+    if is_memory_sqlite(make_url(app.config['SQLALCHEMY_DATABASE_URI'])):
+        return None
+    tasks = app.extensions.setdefault('periodic_tasks', {})
+    if not tasks:
+        app.after_request(_poke_tasks)
+    tasks[name] = PeriodicTask(app, name, func, interval)
+    return tasks[name]
+
+
+def periodic_task(name):
+    return current_app.extensions.get('periodic_tasks', {}).get(name)
@@ -0,0 +1,342 @@
+"""Drive every API endpoint and report throughput and latency percentiles as JSON.
+
+Run from backend/:
+    python -m benchmarks.load --files 20000 --output before.json
+    python -m benchmarks.load --files 20000 --compare before.json
+    python -m benchmarks.load --url http://127.0.0.1:8000 --concurrency 8
+
+Without --url the app runs in-process through the Flask test client against a
+throwaway SQLite database filled by `synthetic.generate`, one request at a
+time. With --url it targets a running server (e.g. gunicorn over a database
+seeded with `flask seed`) from --concurrency threads. Request order, ids and
+payloads all derive from --seed, so two runs with the same arguments make the
+same calls and their reports are comparable across commits; --compare exits
+non-zero when an endpoint's p95 regresses past --threshold. The names of the
+users and tags a run creates carry --run-tag (default: the seed); give each
+run against the same --url database its own tag so they do not collide.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK = 64 * 1024
+
+
+def call(method, path, body=None, data=None, content_type=None, ok=(), then=None):
+    """One request: JSON ``body`` or raw ``data``; ``ok`` lists extra non-error statuses."""
+    if body is not None:
+        data, content_type = json.dumps(body).encode(), 'application/json'
+    return {'method': method, 'path': path, 'data': data, 'content_type': content_type,
+            'ok': ok, 'then': then}
+
+
+def multipart(fields, filename, content, boundary='datahub-load-boundary'):
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n'
+    )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def _keep(key, field='id'):
+    def then(ctx, payload):
+        ctx[key].append(payload[field])
+    return then
+
+
+def _take(ctx, key):
+    # Consumers pop what producers appended; None when a producer failed
+    return ctx[key].pop() if ctx[key] else None
+
+
+def _text(rng, size):
+    return ' '.join(rng.choice(('alpha', 'beta', 'gamma', 'delta', 'report', 'notes')) for _ in range(size // 6)).encode()
+
+
+def _upload(ctx, rng, i):
+    data, content_type = multipart(
+        {'user_id': rng.choice(ctx['users']), 'tags': ','.join(rng.sample(ctx['tags'], 2))},
+        f"load-{ctx['run']}-{i}.txt", _text(rng, 4096),
+    )
+    return call('POST', '/api/files', data=data, content_type=content_type, then=_keep('stored'))
+
+
+def _stored_file(ctx, rng, i):
+    return ctx['stored'][i % len(ctx['stored'])] if ctx['stored'] else 0
+
+
+# (name, weight, build(ctx, rng, i) -> call); weight multiplies --requests.
+# Ordered so that producers (creates) run before their consumers (deletes).
+SCENARIOS = [
+    ('register', 1, lambda c, r, i: call('POST', '/api/register', {'username': f"load-{c['run']}-{i}", 'password': 'pw'})),
+    ('login', 1, lambda c, r, i: call('POST', '/api/login', {'username': f"load-{c['run']}-{i}", 'password': 'pw'})),
+    ('list users', 1, lambda c, r, i: call('GET', '/api/users')),
+    ('get user', 1, lambda c, r, i: call('GET', f"/api/users/{r.choice(c['users'])}")),
+    ('user summary', 1, lambda c, r, i: call('GET', f"/api/users/{r.choice(c['users'])}/summary")),
+    ('user files', 1, lambda c, r, i: call('GET', f"/api/users/{r.choice(c['users'])}/files")),
+    ('user collections', 1, lambda c, r, i: call('GET', f"/api/users/{r.choice(c['users'])}/collections")),
+    ('list tags', 1, lambda c, r, i: call('GET', '/api/tags')),
+    ('tag facets', 1, lambda c, r, i: call('GET', f"/api/tags/facets?tags={r.choice(c['tags'])}")),
+    ('suggest tags', 1, lambda c, r, i: call(
+        'GET', f"/api/tags/suggest?prefix={r.choice(c['tags'])[:1 + i % 3]}&limit=10")),
+    ('create tag', 1, lambda c, r, i: call('POST', '/api/tags', {'name': f"load-{c['run']}-{i % 10}"})),
+    ('list files', 1, lambda c, r, i: call('GET', '/api/files')),
+    ('list files by tags', 1, lambda c, r, i: call(
+        'GET', f"/api/files?tags={r.choice(c['tags'])},{r.choice(c['tags'])}&match=any")),
+    ('list files sparse', 1, lambda c, r, i: call('GET', '/api/files?fields=id,filename&limit=200')),
+    ('export files', 1, lambda c, r, i: call('GET', f"/api/files/export?format=ndjson&tags={r.choice(c['tags'])}")),
+    ('get file', 1, lambda c, r, i: call('GET', f"/api/files/{r.choice(c['files'])}")),
+    ('search', 1, lambda c, r, i: call('GET', f"/api/search?q={r.choice(('report', 'notes', 'budget', 'photo'))}")),
+    ('changes', 1, lambda c, r, i: call('GET', '/api/changes?since=0')),
+    ('create file', 2, lambda c, r, i: call(
+        'POST', '/api/files',
+        {'filename': f'load-{i}.txt', 'user_id': r.choice(c['users']), 'tags': r.sample(c['tags'], 2)},
+        then=_keep('created'))),
+    ('upload file', 1, lambda c, r, i: _upload(c, r, i)),
+    ('bulk create files', 1, lambda c, r, i: call(
+        'POST', '/api/files/bulk', data=b''.join(
+            json.dumps({'filename': f'bulk-{i}-{j}.csv', 'user_id': r.choice(c['users'])}).encode() + b'\n'
+            for j in range(100)),
+        content_type='application/x-ndjson')),
+    ('update file', 1, lambda c, r, i: call(
+        'PATCH', f"/api/files/{c['created'][i % len(c['created'])] if c['created'] else 0}",
+        {'description': f'updated {i}', 'tags': r.sample(c['tags'], 2)})),
+    ('file content', 1, lambda c, r, i: call('GET', f'/api/files/{_stored_file(c, r, i)}/content')),
+    ('file status', 1, lambda c, r, i: call('GET', f'/api/files/{_stored_file(c, r, i)}/status')),
+    # Previews exist only once processing has caught up
+    ('file preview', 1, lambda c, r, i: call('GET', f'/api/files/{_stored_file(c, r, i)}/preview', ok=(404,))),
+    ('delete file', 1, lambda c, r, i: call('DELETE', f"/api/files/{_take(c, 'created')}")),
+    ('bulk delete files', 1, lambda c, r, i: call(
+        'POST', '/api/files/bulk-delete', {'file_ids': [_take(c, 'created') or 0]})),
+    ('create upload', 2, lambda c, r, i: call(
+        'POST', '/api/uploads',
+        {'user_id': r.choice(c['users']), 'filename': f'chunked-{i}.txt', 'size': CHUNK, 'chunk_size': CHUNK},
+        then=_keep('sessions'))),
+    ('get upload', 1, lambda c, r, i: call('GET', f"/api/uploads/{c['sessions'][i % len(c['sessions'])]}")),
+    ('put upload chunk', 2, lambda c, r, i: call(
+        'PUT', f"/api/uploads/{c['sessions'][i % len(c['sessions'])]}/chunks/0",
+        data=_text(r, CHUNK).ljust(CHUNK, b' ')[:CHUNK], content_type='application/octet-stream')),
+    ('complete upload', 1, lambda c, r, i: call(
+        'POST', f"/api/uploads/{_take(c, 'sessions')}/complete", then=_keep('stored'))),
+    ('abort upload', 1, lambda c, r, i: call('DELETE', f"/api/uploads/{_take(c, 'sessions')}")),
+    ('list collections', 1, lambda c, r, i: call('GET', '/api/collections')),
+    ('export collections', 1, lambda c, r, i: call('GET', '/api/collections/export?format=ndjson')),
+    ('get collection', 1, lambda c, r, i: call('GET', f"/api/collections/{r.choice(c['collections'])}")),
+    ('collection files', 1, lambda c, r, i: call('GET', f"/api/collections/{r.choice(c['collections'])}/files")),
+    ('create collection', 2, lambda c, r, i: call(
+        'POST', '/api/collections',
+        {'name': f'load-{i}', 'user_id': r.choice(c['users']), 'file_ids': r.sample(c['files'], 5)},
+        then=_keep('new_collections'))),
+    ('update collection', 1, lambda c, r, i: call(
+        'PATCH', f"/api/collections/{c['new_collections'][i % len(c['new_collections'])]}",
+        {'name': f'renamed-{i}', 'file_ids': r.sample(c['files'], 5)})),
+    ('add collection files', 1, lambda c, r, i: call(
+        'POST', f"/api/collections/{r.choice(c['new_collections'])}/files", {'file_ids': r.sample(c['files'], 5)})),
+    ('remove collection files', 1, lambda c, r, i: call(
+        'DELETE', f"/api/collections/{r.choice(c['new_collections'])}/files", {'file_ids': r.sample(c['files'], 5)})),
+    ('delete collection', 1, lambda c, r, i: call('DELETE', f"/api/collections/{_take(c, 'new_collections')}")),
+    ('metrics', 1, lambda c, r, i: call('GET', '/api/metrics')),
+]
+
+
+class InProcessClient:
+    """Flask test client; requests run one at a time."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def __call__(self, method, path, data, content_type):
+        response = self.client.open(path, method=method, data=data, content_type=content_type)
+        return response.status_code, response.get_data()
+
+
+class HTTPClient:
+    """urllib against a running server; safe to share between threads."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def __call__(self, method, path, data, content_type):
+        headers = {'Content-Type': content_type} if content_type else {}
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read()
+
+
+def discover(client, run):
+    """Ids to aim requests at, read through the API itself."""
+    def get(path):
+        status, body = client('GET', path, None, None)
+        if status != 200:
+            sys.exit(f'GET {path} returned {status}')
+        return json.loads(body)
+
+    ctx = {
+        'run': run,
+        'users': [u['id'] for u in get('/api/users')][-1000:],
+        'files': [f['id'] for f in get('/api/files?fields=id&limit=200')['items']],
+        'tags': [t['name'] for t in get('/api/tags/facets?limit=50')],
+        'collections': [c['id'] for c in get('/api/collections?limit=200')['items']],
+        'created': [], 'stored': [], 'sessions': [], 'new_collections': [],
+    }
+    missing = [key for key in ('users', 'files', 'tags', 'collections') if not ctx[key]]
+    if missing:
+        sys.exit(f"no {', '.join(missing)} to work with; seed the database first")
+    return ctx
+
+
+def percentile(ordered, q):
+    # Nearest rank
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def run_scenario(client, ctx, rng, build, count, concurrency):
+    # Calls are built up front from the seeded rng so threads can't reorder them
+    calls = [build(ctx, rng, i) for i in range(count)]
+
+    def send(spec):
+        started = time.perf_counter()
+        status, body = client(spec['method'], spec['path'], spec['data'], spec['content_type'])
+        return status, body, time.perf_counter() - started
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(send, calls))
+    else:
+        results = [send(spec) for spec in calls]
+    elapsed = time.perf_counter() - started
+
+    errors = 0
+    for spec, (status, body, _) in zip(calls, results):
+        if status >= 400 and status not in spec['ok']:
+            errors += 1
+        elif spec['then'] is not None and status < 400:
+            spec['then'](ctx, json.loads(body))
+    latencies = sorted(seconds * 1000 for _, _, seconds in results)
+    return {
+        'requests': count,
+        'errors': errors,
+        'rps': round(count / elapsed, 1),
+        'mean_ms': round(sum(latencies) / count, 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    """Endpoints whose p95 grew by more than ``threshold`` (a fraction) over the baseline."""
+    regressions = []
+    for name, current in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if before and current['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='Base URL of a running server; default runs the app in-process')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=1, help='Client threads (--url only)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--run-tag', help='Suffix for created usernames and tags (default: the seed)')
+    parser.add_argument('--only', nargs='+', help='Run just these endpoint names')
+    parser.add_argument('--users', default='100')
+    parser.add_argument('--files', default='10k')
+    parser.add_argument('--tags', default='500')
+    parser.add_argument('--collections', default='1k')
+    parser.add_argument('--output', help='Also write the report to this file')
+    parser.add_argument('--compare', help='Baseline report to check p95 latencies against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p95 growth, as a fraction')
+    args = parser.parse_args(argv)
+
+    dataset = None
+    if args.url:
+        client = HTTPClient(args.url)
+        concurrency = args.concurrency
+    else:
+        workdir = tempfile.mkdtemp(prefix='datahub-load-')
+        # Must be set before the app is imported
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+        from app import app
+        from database import init_db
+        from synthetic import generate, parse_count
+        app.instance_path = workdir
+        with app.app_context():
+            init_db()
+            dataset = generate(
+                parse_count(args.users), parse_count(args.files), parse_count(args.tags),
+                parse_count(args.collections), seed=args.seed,
+            )
+        client = InProcessClient(app)
+        concurrency = 1
+
+    rng = random.Random(args.seed)
+    ctx = discover(client, args.run_tag or str(args.seed))
+    endpoints = {}
+    for name, weight, build in SCENARIOS:
+        if args.only and name not in args.only:
+            continue
+        endpoints[name] = run_scenario(client, ctx, rng, build, args.requests * weight, concurrency)
+        print(f"{name}: {endpoints[name]}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'target': args.url or 'in-process',
+            'seed': args.seed,
+            'requests_per_endpoint': args.requests,
+            'concurrency': concurrency,
+            'dataset': dataset,
+            'python': platform.python_version(),
+        },
+        'endpoints': endpoints,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=2)
+
+    failed = [name for name, result in endpoints.items() if result['errors']]
+    if failed:
+        print(f"errors from: {', '.join(failed)}", file=sys.stderr)
+    regressions = []
+    if args.compare:
+        with open(args.compare) as src:
+            regressions = compare(report, json.load(src), args.threshold)
+        for line in regressions:
+            print(f'regression: {line}', file=sys.stderr)
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Compare FileSchema dumping against the lean serializer.
+
+Run from backend/:  python -m benchmarks.serialize --files 2000 --tags 5
+Prints one JSON object with per-variant timings in milliseconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+# Throwaway in-memory database; must be set before the app is imported
+os.environ['DATABASE_URL'] = 'sqlite://'
+
+from app import app  # noqa: E402
+from database import init_db  # noqa: E402
+from models import db, File, User  # noqa: E402
+from schemas import FileSchema, cached_schema  # noqa: E402
+from serializers import FILE_TAGS, files_to_dicts  # noqa: E402
+from tagging import set_file_tags  # noqa: E402
+
+
+def seed(n_files, tags_per_file):
+    user = User(username='bench', password='bench')
+    db.session.add(user)
+    db.session.flush()
+    for i in range(n_files):
+        f = File(filename=f'file{i}.pdf', description=f'description {i}', user_id=user.id)
+        set_file_tags(f, names=[f'tag{(i + j) % 50}' for j in range(tags_per_file)])
+        db.session.add(f)
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(samples), 3), 'min_ms': round(min(samples), 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--tags', type=int, default=3, help='tags per file')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        init_db()
+        seed(args.files, args.tags)
+        files = File.query.options(FILE_TAGS).all()
+
+        expected = FileSchema(many=True).dump(files)
+        if files_to_dicts(files) != expected:
+            sys.exit('lean serializer output differs from FileSchema')
+
+        results = {
+            'files': args.files,
+            'tags_per_file': args.tags,
+            'schema_per_call': timed(lambda: FileSchema(many=True).dump(files), args.repeat),
+            'schema_cached': timed(lambda: cached_schema(FileSchema, many=True).dump(files), args.repeat),
+            'lean': timed(lambda: files_to_dicts(files), args.repeat),
+            'lean_sparse': timed(lambda: files_to_dicts(files, ('id', 'filename', 'tags')), args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
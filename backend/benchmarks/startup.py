@@ -0,0 +1,134 @@
+"""Measure cold start: app import time and time to the first requests.
+
+Run from backend/:
+    python -m benchmarks.startup --repeat 5
+    python -m benchmarks.startup --max-import-ms 600 --max-first-request-ms 900
+
+Every sample is a fresh interpreter, as a gunicorn worker or a CLI command
+would be, plus a second one under `python -X importtime` for the
+per-package breakdown. It reports the time to `import app`, the time until
+GET /api/health has answered (counted from the child's first statement),
+the extra time taken by the first request that needs a marshmallow schema,
+and the whole process from launch to exit. The database is created once up
+front with init_db, so the samples do not include it. The output is JSON
+with the medians and the packages that take longest to import; the run
+exits non-zero if a --max-* budget is exceeded.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.load import git_commit
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in each fresh interpreter; prints its timings as JSON on stdout
+CHILD = """
+import json, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+with app.test_client() as client:
+    assert client.get('/api/health').status_code == 200
+    first = time.perf_counter()
+    assert client.get('/api/users/1').status_code == 200
+    schema = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first': first - started, 'schema': schema - first}))
+"""
+
+
+def parse_importtime(stderr):
+    """{top-level package: self ms} from -X importtime output."""
+    by_package = Counter()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        by_package[name.strip().split('.')[0]] += int(self_us) / 1000
+    return by_package
+
+
+def run_child(env, *flags):
+    return subprocess.run(
+        [sys.executable, *flags, '-c', CHILD], cwd=BACKEND, env=env, capture_output=True, text=True, check=True,
+    )
+
+
+def sample(env):
+    launched = time.perf_counter()
+    result = run_child(env)
+    wall = time.perf_counter() - launched
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    # A second run for the per-package breakdown; importtime slows imports down
+    by_package = parse_importtime(run_child(env, '-X', 'importtime').stderr)
+    return {
+        'import_ms': timings['import'] * 1000,
+        # Import, app setup and the request, timed inside the child
+        'first_request_ms': timings['first'] * 1000,
+        'first_schema_request_ms': timings['schema'] * 1000,
+        # Launch to exit, including interpreter start-up and shutdown
+        'process_ms': wall * 1000,
+    }, by_package
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Slowest packages to list')
+    parser.add_argument('--max-import-ms', type=float)
+    parser.add_argument('--max-first-request-ms', type=float)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='datahub-startup-')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+               STORAGE_ROOT=os.path.join(workdir, 'uploads'))
+    subprocess.run(
+        [sys.executable, '-c',
+         'from app import app\n'
+         'from database import init_db\n'
+         'with app.app_context():\n'
+         '    init_db()\n'
+         "app.test_client().post('/api/register', json={'username': 'startup', 'password': 'x'})\n"],
+        cwd=BACKEND, env=env, capture_output=True, check=True,
+    )
+
+    samples = []
+    packages = Counter()
+    for _ in range(args.repeat):
+        measured, by_package = sample(env)
+        samples.append(measured)
+        packages.update(by_package)
+
+    def median(key):
+        return round(statistics.median(s[key] for s in samples), 1)
+
+    report = {
+        'meta': {'commit': git_commit(), 'python': sys.version.split()[0], 'samples': args.repeat},
+        'import_ms': median('import_ms'),
+        'first_request_ms': median('first_request_ms'),
+        'process_ms': median('process_ms'),
+        'first_schema_request_ms': median('first_schema_request_ms'),
+        'slowest_imports_ms': {
+            name: round(ms / args.repeat, 1) for name, ms in packages.most_common(args.top)
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if args.max_import_ms is not None and report['import_ms'] > args.max_import_ms:
+        failures.append(f"import {report['import_ms']} ms, budget {args.max_import_ms} ms")
+    if args.max_first_request_ms is not None and report['first_request_ms'] > args.max_first_request_ms:
+        failures.append(f"first request {report['first_request_ms']} ms, budget {args.max_first_request_ms} ms")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+from metrics import observe_cache
+from models import db, ResourceVersion, upsert_insert
+
+# Read endpoints are cached under a key that includes the current version of
+# every resource they depend on. Write handlers bump those versions in the
+# same transaction as the write, so a committed change moves readers to a new
+# key on every worker and a stale entry can never be served. The versions
+# also make a cheap ETag: a matching If-None-Match is answered with 304
+# before the view runs.
+
+
+class LRUCache:
+    """In-process cache bounded by the total size of the stored bodies."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class RedisCache:
+    """Shared cache for several workers or hosts; needs the optional redis package."""
+
+    def __init__(self, url, ttl):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_URL is set but the redis package is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        body = self.client.get(f"datahub:response:{key}")
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    def set(self, key, body):
+        self.client.set(f"datahub:response:{key}", body, ex=self.ttl)
+
+    def clear(self):
+        for key in self.client.scan_iter("datahub:response:*"):
+            self.client.delete(key)
+
+
+def init_cache(app):
+    url = app.config['RESPONSE_CACHE_URL']
+    if url:
+        backend = RedisCache(url, app.config['RESPONSE_CACHE_TTL'])
+    else:
+        backend = LRUCache(app.config['RESPONSE_CACHE_MAX_BYTES'])
+    app.extensions['response_cache'] = backend
+    return backend
+
+
+def bump_versions(*resources):
+    """Invalidate cached reads of ``resources`` once the current transaction commits."""
+    table = ResourceVersion.__table__
+    insert = upsert_insert(table)
+    for resource in resources:
+        if insert is not None:
+            db.session.execute(
+                insert.values(resource=resource, version=1).on_conflict_do_update(
+                    index_elements=['resource'], set_={'version': table.c.version + 1}
+                )
+            )
+            continue
+        updated = db.session.execute(
+            table.update().where(table.c.resource == resource).values(version=table.c.version + 1)
+        )
+        if not updated.rowcount:
+            db.session.add(ResourceVersion(resource=resource, version=1))
+
+
+def current_versions(resources):
+    rows = dict(
+        db.session.query(ResourceVersion.resource, ResourceVersion.version)
+        .filter(ResourceVersion.resource.in_(resources))
+    )
+    return tuple(rows.get(resource, 0) for resource in resources)
+
+
+def cached_view(*resources):
+    """Cache a JSON GET view per query string and versions of ``resources``."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = current_app.extensions.get('response_cache')
+            # Streamed exports are never buffered into the cache
+            if backend is None or request.args.get('stream') == '1':
+                return view(*args, **kwargs)
+
+            versions = current_versions(resources)
+            query = '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+            raw_key = f"{request.endpoint}:{sorted(kwargs.items())}?{query}|{versions}"
+            key = hashlib.sha1(raw_key.encode()).hexdigest()
+
+            if key in request.if_none_match:
+                observe_cache(True)
+                response = current_app.response_class(status=304)
+            else:
+                body = backend.get(key)
+                observe_cache(body is not None)
+                if body is None:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    backend.set(key, response.get_data())
+                else:
+                    response = current_app.response_class(body, mimetype='application/json')
+            response.set_etag(key)
+            # Clients must revalidate, which costs one version lookup
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
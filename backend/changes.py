@@ -0,0 +1,348 @@
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, func, inspect, select
+from sqlalchemy.orm import aliased, undefer
+
+from background import add_periodic_task
+from models import db, Change, Collection, File, ResourceVersion, Tag, upsert_insert
+from pagination import InvalidCursor
+from serializers import collection_to_dict, file_load_options, files_to_dicts, tag_to_dict
+
+# Change feed. Triggers append a row to `changes` for every insert, update
+# and delete of a file, collection or tag; tag links and collection
+# membership bump the parent's version and updated_at, which logs the
+# parent. Triggers also catch the set-based writes (bulk ingest, membership
+# INSERT ... SELECT) that never go through the ORM.
+#
+# GET /api/changes?since=<cursor> returns what changed after the cursor,
+# one entry per resource with its current state or a tombstone. Compaction
+# keeps only the newest entry per resource, so the log holds about one row
+# per live resource and since=0 is a full snapshot; tombstones older than
+# CHANGES_RETENTION_SECONDS are dropped, after which older cursors get 410
+# and the client resyncs from 0.
+
+RESOURCES = ('file', 'collection', 'tag')
+
+# Compaction progress and the newest expired tombstone, kept in resource_versions
+COMPACTED_MARKER = 'changes:compacted'
+HORIZON_MARKER = 'changes:horizon'
+
+SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+POSTGRES_NOW = "(clock_timestamp() AT TIME ZONE 'UTC')"
+
+
+def _sqlite_log_ddl(table, resource, update_of=''):
+    insert = "INSERT INTO changes(resource, resource_id, op, created_at) VALUES ('{}', {}.id, '{}', {}); END"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_changes_ai AFTER INSERT ON {table} BEGIN "
+        + insert.format(resource, 'new', 'upsert', SQLITE_NOW),
+        f"CREATE TRIGGER IF NOT EXISTS {table}_changes_au AFTER UPDATE{update_of} ON {table} BEGIN "
+        + insert.format(resource, 'new', 'upsert', SQLITE_NOW),
+        f"CREATE TRIGGER IF NOT EXISTS {table}_changes_ad AFTER DELETE ON {table} BEGIN "
+        + insert.format(resource, 'old', 'delete', SQLITE_NOW),
+    ]
+
+
+def _sqlite_touch_ddl(table, parent, column):
+    update = f"UPDATE {parent} SET version = version + 1, updated_at = {SQLITE_NOW} WHERE id = {{}}.{column}; END"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_changes_ai AFTER INSERT ON {table} BEGIN " + update.format('new'),
+        f"CREATE TRIGGER IF NOT EXISTS {table}_changes_ad AFTER DELETE ON {table} BEGIN " + update.format('old'),
+    ]
+
+
+SQLITE_DDL = (
+    _sqlite_log_ddl('files', 'file')
+    + _sqlite_log_ddl('collections', 'collection')
+    # tags.file_count is maintained by the facet triggers; only renames matter
+    + _sqlite_log_ddl('tags', 'tag', ' OF name')
+    + _sqlite_touch_ddl('file_tags', 'files', 'file_id')
+    + _sqlite_touch_ddl('collection_files', 'collections', 'collection_id')
+)
+
+
+def _postgres_touch_function(table, parent, column):
+    return f"""CREATE OR REPLACE FUNCTION {table}_changes_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            UPDATE {parent} SET version = version + 1, updated_at = {POSTGRES_NOW} WHERE id = OLD.{column};
+        ELSE
+            UPDATE {parent} SET version = version + 1, updated_at = {POSTGRES_NOW} WHERE id = NEW.{column};
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql"""
+
+
+POSTGRES_DDL = [
+    f"""CREATE OR REPLACE FUNCTION changes_log_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO changes(resource, resource_id, op, created_at)
+            VALUES (TG_ARGV[0], OLD.id, 'delete', {POSTGRES_NOW});
+        ELSE
+            INSERT INTO changes(resource, resource_id, op, created_at)
+            VALUES (TG_ARGV[0], NEW.id, 'upsert', {POSTGRES_NOW});
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS files_changes_aiud ON files",
+    "CREATE TRIGGER files_changes_aiud AFTER INSERT OR UPDATE OR DELETE ON files "
+    "FOR EACH ROW EXECUTE FUNCTION changes_log_trg('file')",
+    "DROP TRIGGER IF EXISTS collections_changes_aiud ON collections",
+    "CREATE TRIGGER collections_changes_aiud AFTER INSERT OR UPDATE OR DELETE ON collections "
+    "FOR EACH ROW EXECUTE FUNCTION changes_log_trg('collection')",
+    "DROP TRIGGER IF EXISTS tags_changes_aiud ON tags",
+    "CREATE TRIGGER tags_changes_aiud AFTER INSERT OR DELETE OR UPDATE OF name ON tags "
+    "FOR EACH ROW EXECUTE FUNCTION changes_log_trg('tag')",
+    _postgres_touch_function('file_tags', 'files', 'file_id'),
+    "DROP TRIGGER IF EXISTS file_tags_changes_aid ON file_tags",
+    "CREATE TRIGGER file_tags_changes_aid AFTER INSERT OR DELETE ON file_tags "
+    "FOR EACH ROW EXECUTE FUNCTION file_tags_changes_trg()",
+    _postgres_touch_function('collection_files', 'collections', 'collection_id'),
+    "DROP TRIGGER IF EXISTS collection_files_changes_aid ON collection_files",
+    "CREATE TRIGGER collection_files_changes_aid AFTER INSERT OR DELETE ON collection_files "
+    "FOR EACH ROW EXECUTE FUNCTION collection_files_changes_trg()",
+]
+
+# One entry per existing row; only run when the triggers are first installed
+BACKFILL = [
+    "INSERT INTO changes(resource, resource_id, op, created_at) "
+    "SELECT '{resource}', id, 'upsert', {now} FROM {table} ORDER BY id".format(resource=resource, table=table, now='{now}')
+    for resource, table in (('tag', 'tags'), ('collection', 'collections'), ('file', 'files'))
+]
+
+DROP_SQLITE = [
+    f"DROP TRIGGER IF EXISTS {table}_changes_{suffix}"
+    for table in ('files', 'collections', 'tags', 'file_tags', 'collection_files')
+    for suffix in ('ai', 'au', 'ad')
+]
+DROP_POSTGRES = [
+    "DROP TRIGGER IF EXISTS files_changes_aiud ON files",
+    "DROP TRIGGER IF EXISTS collections_changes_aiud ON collections",
+    "DROP TRIGGER IF EXISTS tags_changes_aiud ON tags",
+    "DROP TRIGGER IF EXISTS file_tags_changes_aid ON file_tags",
+    "DROP TRIGGER IF EXISTS collection_files_changes_aid ON collection_files",
+    "DROP FUNCTION IF EXISTS changes_log_trg()",
+    "DROP FUNCTION IF EXISTS file_tags_changes_trg()",
+    "DROP FUNCTION IF EXISTS collection_files_changes_trg()",
+]
+
+
+def _has_change_triggers(connection):
+    if connection.dialect.name == 'sqlite':
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'files_changes_ai'"
+    else:
+        sql = "SELECT 1 FROM pg_trigger WHERE tgname = 'files_changes_aiud'"
+    return connection.exec_driver_sql(sql).first() is not None
+
+
+def install_changes(connection):
+    """Create the change-log triggers if missing and log every existing row once."""
+    dialect = connection.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        return
+    # Databases that predate the change feed get it from the Alembic migration
+    inspector = inspect(connection)
+    if not inspector.has_table('changes'):
+        return
+    if 'version' not in {column['name'] for column in inspector.get_columns('files')}:
+        return
+    if _has_change_triggers(connection):
+        return
+    for statement in (SQLITE_DDL if dialect == 'sqlite' else POSTGRES_DDL):
+        connection.exec_driver_sql(statement)
+    now = SQLITE_NOW if dialect == 'sqlite' else POSTGRES_NOW
+    for statement in BACKFILL:
+        connection.exec_driver_sql(statement.format(now=now))
+
+
+def uninstall_changes(connection):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        statements = DROP_SQLITE
+    elif dialect == 'postgresql':
+        statements = DROP_POSTGRES
+    else:
+        return
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+class ExpiredCursor(ValueError):
+    pass
+
+
+def format_cursor(position, horizon):
+    # Paging a snapshot from since=0 hands out positions below the horizon;
+    # they carry the horizon they were issued under and stay valid until
+    # compaction moves it again
+    return str(position) if position >= horizon else f"{position}.{horizon}"
+
+
+def parse_cursor(value):
+    """(position, horizon it was issued under) from a next_cursor string."""
+    position, _, horizon = value.partition('.')
+    if not position.isdigit() or not (horizon.isdigit() or not horizon):
+        raise InvalidCursor(value)
+    return int(position), int(horizon or 0)
+
+
+def _marker(name):
+    return db.session.scalar(select(ResourceVersion.version).where(ResourceVersion.resource == name)) or 0
+
+
+def _raise_marker(name, value):
+    table = ResourceVersion.__table__
+    insert = upsert_insert(table)
+    if insert is not None:
+        db.session.execute(insert.values(resource=name, version=value).on_conflict_do_update(
+            index_elements=['resource'],
+            set_={'version': case((table.c.version < value, value), else_=table.c.version)},
+        ))
+        return
+    row = db.session.get(ResourceVersion, name, with_for_update=True)
+    if row is None:
+        db.session.add(ResourceVersion(resource=name, version=value))
+    elif row.version < value:
+        row.version = value
+
+
+def _visible(query):
+    # On PostgreSQL, ids are handed out before commit, so a slow transaction
+    # can commit an id below one a client has already seen. Holding back the
+    # newest entries for a moment lets such transactions land first; SQLite
+    # has a single writer and commits in id order.
+    settle = current_app.config['CHANGES_SETTLE_SECONDS']
+    if settle and db.session.get_bind().dialect.name != 'sqlite':
+        query = query.where(Change.created_at <= datetime.utcnow() - timedelta(seconds=settle))
+    return query
+
+
+def head_cursor():
+    return str(db.session.scalar(_visible(select(func.max(Change.id)))) or 0)
+
+
+def _load(resource, ids, fields):
+    if not ids:
+        return {}
+    if resource == 'file':
+        files = File.query.options(*file_load_options(fields)).filter(File.id.in_(ids)).all()
+        return dict(zip((f.id for f in files), files_to_dicts(files, fields)))
+    if resource == 'collection':
+        collections = Collection.query.options(undefer(Collection.file_count)).filter(Collection.id.in_(ids))
+        return {col.id: collection_to_dict(col) for col in collections}
+    return {tag.id: tag_to_dict(tag) for tag in Tag.query.filter(Tag.id.in_(ids))}
+
+
+def changes_since(cursor, limit, resources=RESOURCES, fields=None):
+    """(entries, next_cursor, has_more) for the log after ``cursor``.
+
+    Entries are {"type", "id", "op"} plus "data" (the current serialized
+    row) for upserts, one per resource in the order of its latest change.
+    Raises InvalidCursor, or ExpiredCursor once tombstones after the cursor
+    may have been dropped.
+    """
+    since, issued_horizon = parse_cursor(cursor)
+    # The horizon rides along with the page instead of costing a query
+    horizon_value = (
+        select(ResourceVersion.version).where(ResourceVersion.resource == HORIZON_MARKER).scalar_subquery()
+    )
+    query = select(Change, func.coalesce(horizon_value, 0)).where(Change.id > since)
+    if set(resources) != set(RESOURCES):
+        query = query.where(Change.resource.in_(resources))
+    result = db.session.execute(_visible(query).order_by(Change.id).limit(limit + 1)).all()
+    horizon = result[0][1] if result else _marker(HORIZON_MARKER)
+    if since and since < horizon and issued_horizon < horizon:
+        raise ExpiredCursor(cursor)
+    rows = [row for row, _ in result]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for row in rows:
+        key = (row.resource, row.resource_id)
+        latest.pop(key, None)
+        latest[key] = row.op
+    wanted = {resource: [rid for (res, rid), op in latest.items() if res == resource and op == 'upsert']
+              for resource in resources}
+    current = {resource: _load(resource, ids, fields) for resource, ids in wanted.items()}
+
+    entries = []
+    for (resource, resource_id), op in latest.items():
+        data = current[resource].get(resource_id) if op == 'upsert' else None
+        if data is None:
+            # Gone since; its tombstone is further along the log
+            entries.append({'type': resource, 'id': resource_id, 'op': 'delete'})
+        else:
+            entries.append({'type': resource, 'id': resource_id, 'op': 'upsert', 'data': data})
+    if not has_more:
+        # Caught up: the cursor is the head of the log, past any horizon
+        return entries, format_cursor(max(rows[-1].id if rows else since, horizon), horizon), has_more
+    return entries, format_cursor(rows[-1].id, max(horizon, issued_horizon)), has_more
+
+
+def compact_changes(batch_size=5000, retention_seconds=30 * 24 * 3600):
+    """Drop superseded entries and expired tombstones; returns rows removed.
+
+    Works through the log ``batch_size`` entries at a time from where the
+    last run stopped: every entry in the batch deletes the older entries for
+    the same resource through the (resource, resource_id, id) index.
+    """
+    mark = _marker(COMPACTED_MARKER)
+    upto = min(db.session.scalar(select(func.max(Change.id))) or 0, mark + batch_size)
+    removed = 0
+    if upto > mark:
+        newer = aliased(Change)
+        superseded = (
+            select(Change.id)
+            .join(newer, (newer.resource == Change.resource) & (newer.resource_id == Change.resource_id)
+                  & (newer.id > Change.id))
+            .where(newer.id > mark, newer.id <= upto)
+        )
+        removed += db.session.execute(
+            delete(Change).where(Change.id.in_(superseded)), execution_options={'synchronize_session': False},
+        ).rowcount
+        _raise_marker(COMPACTED_MARKER, upto)
+
+    cutoff = datetime.utcnow() - timedelta(seconds=retention_seconds)
+    expired = list(db.session.scalars(
+        select(Change.id).where(Change.op == 'delete', Change.created_at < cutoff)
+        .order_by(Change.id).limit(batch_size)
+    ))
+    if expired:
+        removed += db.session.execute(
+            delete(Change).where(Change.id.in_(expired)), execution_options={'synchronize_session': False},
+        ).rowcount
+        # Cursors before the newest dropped tombstone may have missed a delete
+        _raise_marker(HORIZON_MARKER, max(expired))
+    return removed
+
+
+@click.command('compact-changes')
+@with_appcontext
+def compact_changes_command():
+    """Compact the change log until no superseded entries or expired tombstones remain."""
+    config = current_app.config
+    total = 0
+    while True:
+        removed = compact_changes(config['CHANGES_COMPACT_BATCH_SIZE'], config['CHANGES_RETENTION_SECONDS'])
+        db.session.commit()
+        total += removed
+        if not removed and _marker(COMPACTED_MARKER) >= (db.session.scalar(select(func.max(Change.id))) or 0):
+            break
+    click.echo(f"removed {total} change(s)")
+
+
+def _compact():
+    config = current_app.config
+    compact_changes(config['CHANGES_COMPACT_BATCH_SIZE'], config['CHANGES_RETENTION_SECONDS'])
+
+
+def init_changes(app):
+    app.cli.add_command(compact_changes_command)
+    add_periodic_task(app, 'changes-compact', _compact, app.config['CHANGES_COMPACT_INTERVAL'])
@@ -0,0 +1,204 @@
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, case, delete, func, insert, select
+
+from background import add_periodic_task, periodic_task
+from cache import bump_versions
+from models import db, Blob, File, FileJob, FileTag, collection_files
+from processing import preview_root
+from storage import blob_key, blob_store
+
+# Bulk deletion and blob garbage collection. delete_files removes files
+# with set-based statements, a bounded batch of ids per transaction, and
+# only decrements blob reference counts. The bytes are reclaimed later by
+# sweep_blobs, which runs in a background thread (BLOB_SWEEP_INTERVAL) or
+# from `flask sweep-blobs`: it deletes blobs no file references, objects
+# in the store with no blobs row (e.g. an upload whose transaction rolled
+# back), scratch files of abandoned uploads and previews of deleted files.
+#
+# Anything modified within BLOB_SWEEP_GRACE_SECONDS is left alone. Stores
+# touch a blob when an upload reuses it, so a blob that is being
+# re-acquired is never removed under the upload.
+
+
+def _delete_batch(ids):
+    # One reference less per deleted file; duplicates of a blob in the
+    # batch are released in one statement
+    released = db.session.execute(
+        select(File.blob_sha256, func.count())
+        .where(File.id.in_(ids), File.blob_sha256.isnot(None))
+        .group_by(File.blob_sha256)
+    ).all()
+    if released:
+        table = Blob.__table__
+        db.session.execute(
+            table.update().where(table.c.sha256 == bindparam('digest')).values(
+                ref_count=case((table.c.ref_count > bindparam('n'), table.c.ref_count - bindparam('n')), else_=0),
+            ),
+            [{'digest': digest, 'n': n} for digest, n in released],
+        )
+    # Links first: the tag counter triggers look up files.user_id
+    for statement in (
+        delete(FileJob).where(FileJob.file_id.in_(ids)),
+        delete(FileTag).where(FileTag.file_id.in_(ids)),
+        collection_files.delete().where(collection_files.c.file_id.in_(ids)),
+        delete(File).where(File.id.in_(ids)),
+    ):
+        db.session.execute(statement, execution_options={'synchronize_session': False})
+
+
+def delete_files(query, batch_size=1000):
+    """Delete every file matched by a File query, committing per batch; returns the count."""
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = [row.id for row in (
+            query.with_entities(File.id).filter(File.id > last_id).order_by(File.id).limit(batch_size)
+        )]
+        if not ids:
+            break
+        _delete_batch(ids)
+        bump_versions('files', 'tags', 'collections')
+        db.session.commit()
+        deleted += len(ids)
+        last_id = ids[-1]
+    return deleted
+
+
+def request_sweep():
+    """Start a background sweep now rather than at the next interval."""
+    task = periodic_task('blob-sweep')
+    if task is not None:
+        task.poke(force=True)
+
+
+def _idle(store, key, cutoff):
+    info = store.stat(key)
+    return info is None or info.mtime < cutoff
+
+
+def _sweep_unreferenced(store, batch_size, cutoff):
+    removed = 0
+    after = ''
+    while True:
+        digests = list(db.session.scalars(
+            select(Blob.sha256).where(Blob.ref_count == 0, Blob.sha256 > after)
+            .order_by(Blob.sha256).limit(batch_size)
+        ))
+        if not digests:
+            return removed
+        after = digests[-1]
+        idle = [digest for digest in digests if _idle(store, blob_key(digest), cutoff)]
+        if not idle:
+            continue
+        # Rows first, and only those still unreferenced. The deletes stay
+        # uncommitted while the bytes go, so an upload acquiring one of these
+        # blobs waits for the commit and then recreates its row; bytes an
+        # upload touched in the meantime are kept and their row put back
+        gone = db.session.execute(
+            delete(Blob).where(Blob.sha256.in_(idle), Blob.ref_count == 0)
+            .returning(Blob.sha256, Blob.size_bytes, Blob.created_at),
+            execution_options={'synchronize_session': False},
+        ).all()
+        kept = []
+        for digest, size, created_at in gone:
+            key = blob_key(digest)
+            if _idle(store, key, cutoff):
+                store.delete(key)
+                removed += 1
+            else:
+                kept.append({'sha256': digest, 'size_bytes': size, 'ref_count': 0, 'created_at': created_at})
+        if kept:
+            db.session.execute(insert(Blob), kept)
+        db.session.commit()
+
+
+def _drop_orphans(store, keys):
+    by_digest = {key.rsplit('/', 1)[1]: key for key in keys}
+    known = set(db.session.scalars(select(Blob.sha256).where(Blob.sha256.in_(by_digest))))
+    orphans = [key for digest, key in by_digest.items() if digest not in known]
+    for key in orphans:
+        store.delete(key)
+    return len(orphans)
+
+
+def _sweep_orphans(store, batch_size, cutoff):
+    removed = 0
+    batch = []
+    for key, info in store.iter_keys():
+        if info.mtime < cutoff:
+            batch.append(key)
+        if len(batch) >= batch_size:
+            removed += _drop_orphans(store, batch)
+            batch = []
+    if batch:
+        removed += _drop_orphans(store, batch)
+    return removed
+
+
+def _sweep_previews(batch_size, cutoff):
+    # Previews are named <file id>.<ext>
+    root = preview_root()
+    try:
+        names = [entry.name for entry in os.scandir(root)
+                 if entry.is_file() and entry.stat().st_mtime < cutoff]
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for start in range(0, len(names), batch_size):
+        batch = {}
+        for name in names[start:start + batch_size]:
+            stem = name.split('.', 1)[0]
+            if stem.isdigit():
+                batch.setdefault(int(stem), []).append(name)
+        live = set(db.session.scalars(select(File.id).where(File.id.in_(batch))))
+        for file_id, files in batch.items():
+            if file_id in live:
+                continue
+            for name in files:
+                try:
+                    os.unlink(os.path.join(root, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
+
+
+def sweep_blobs(store, batch_size=500, grace_seconds=3600):
+    """Reclaim storage nothing refers to any more; returns counts per kind."""
+    cutoff = time.time() - grace_seconds
+    counts = {
+        'blobs': _sweep_unreferenced(store, batch_size, cutoff),
+        'orphans': _sweep_orphans(store, batch_size, cutoff),
+        'tmp': store.cleanup_tmp(cutoff),
+        'previews': _sweep_previews(batch_size, cutoff),
+    }
+    db.session.commit()
+    return counts
+
+
+def _sweep():
+    config = current_app.config
+    counts = sweep_blobs(blob_store(), config['BLOB_SWEEP_BATCH_SIZE'], config['BLOB_SWEEP_GRACE_SECONDS'])
+    if any(counts.values()):
+        current_app.logger.info("blob sweep removed %s", counts)
+
+
+@click.command('sweep-blobs')
+@click.option('--grace', type=int, default=None, help='Seconds a blob must be idle (default BLOB_SWEEP_GRACE_SECONDS).')
+@with_appcontext
+def sweep_blobs_command(grace):
+    """Delete unreferenced blobs, orphaned objects and abandoned upload files."""
+    config = current_app.config
+    grace = config['BLOB_SWEEP_GRACE_SECONDS'] if grace is None else grace
+    counts = sweep_blobs(blob_store(), config['BLOB_SWEEP_BATCH_SIZE'], grace)
+    click.echo(f"removed {counts}")
+
+
+def init_cleanup(app):
+    app.cli.add_command(sweep_blobs_command)
+    add_periodic_task(app, 'blob-sweep', _sweep, app.config['BLOB_SWEEP_INTERVAL'])
@@ -10,3 +10,117 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
     FRONTEND_URL = os.getenv("FRONTEND_URL", "https://data-hdtb3rd3y-mercy5-ks-projects.vercel.app")
+
+    # Keyset pagination for list endpoints
+    API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "50"))
+    API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "200"))
+
+    # Resumable upload sessions
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+    UPLOAD_MAX_CHUNK_SIZE = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
+    UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))  # seconds
+
+    # File downloads: let a fronting proxy serve the bytes instead of gunicorn.
+    # USE_X_SENDFILE is Flask's own switch (Apache/lighttpd); set
+    # X_ACCEL_REDIRECT_PREFIX to the internal nginx location that maps onto
+    # the uploads folder, e.g. "/protected-uploads/".
+    USE_X_SENDFILE = os.getenv("USE_X_SENDFILE", "false").lower() in ("1", "true", "yes")
+    X_ACCEL_REDIRECT_PREFIX = os.getenv("X_ACCEL_REDIRECT_PREFIX", "")
+
+    # Blob storage: "local" (STORAGE_ROOT, default <instance>/uploads),
+    # "memory" (tests) or "s3" (any S3-compatible endpoint; needs boto3).
+    # Upload sessions and previews stay under STORAGE_ROOT either way.
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+    STORAGE_ROOT = os.getenv("STORAGE_ROOT", "")
+    STORAGE_BUFFER_SIZE = int(os.getenv("STORAGE_BUFFER_SIZE", str(1024 * 1024)))
+    STORAGE_FSYNC = os.getenv("STORAGE_FSYNC", "false").lower() in ("1", "true", "yes")
+    STORAGE_S3_BUCKET = os.getenv("STORAGE_S3_BUCKET", "")
+    STORAGE_S3_PREFIX = os.getenv("STORAGE_S3_PREFIX", "")
+    STORAGE_S3_ENDPOINT_URL = os.getenv("STORAGE_S3_ENDPOINT_URL", "")  # e.g. http://localhost:9000 for MinIO
+    STORAGE_S3_REGION = os.getenv("STORAGE_S3_REGION", "")
+    STORAGE_S3_PART_SIZE = int(os.getenv("STORAGE_S3_PART_SIZE", str(8 * 1024 * 1024)))  # min 5 MiB
+    STORAGE_S3_CONCURRENCY = int(os.getenv("STORAGE_S3_CONCURRENCY", "4"))  # parts in flight per process
+
+    # GET /api/collections/<id>/archive: per-member read size and deflate level
+    ARCHIVE_READ_SIZE = int(os.getenv("ARCHIVE_READ_SIZE", str(64 * 1024)))
+    ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))
+
+    # GET /api/changes: tombstones are kept this long (older cursors get 410),
+    # and a background pass compacts the log at most once per interval
+    # (0 leaves it to `flask compact-changes`). On PostgreSQL the newest
+    # entries are held back for CHANGES_SETTLE_SECONDS so transactions that
+    # commit out of id order are not skipped.
+    CHANGES_RETENTION_SECONDS = int(os.getenv("CHANGES_RETENTION_SECONDS", str(30 * 24 * 3600)))
+    CHANGES_COMPACT_INTERVAL = int(os.getenv("CHANGES_COMPACT_INTERVAL", "60"))
+    CHANGES_COMPACT_BATCH_SIZE = int(os.getenv("CHANGES_COMPACT_BATCH_SIZE", "5000"))
+    CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", "1"))
+
+    # POST /api/files/bulk-delete: files per delete batch/transaction. Blobs
+    # no file references any more are removed by a background sweep every
+    # BLOB_SWEEP_INTERVAL seconds (0 leaves it to `flask sweep-blobs`), once
+    # they have been idle for BLOB_SWEEP_GRACE_SECONDS.
+    FILE_DELETE_BATCH_SIZE = int(os.getenv("FILE_DELETE_BATCH_SIZE", "1000"))
+    BLOB_SWEEP_INTERVAL = int(os.getenv("BLOB_SWEEP_INTERVAL", "3600"))
+    BLOB_SWEEP_BATCH_SIZE = int(os.getenv("BLOB_SWEEP_BATCH_SIZE", "500"))
+    BLOB_SWEEP_GRACE_SECONDS = int(os.getenv("BLOB_SWEEP_GRACE_SECONDS", "3600"))
+
+    # GET /api/tags/suggest: each process keeps a prefix index of the tags,
+    # refreshed after its own writes and checked for other processes' at
+    # most once per interval (0 turns the index off; lookups query the DB)
+    TAG_INDEX_REFRESH_INTERVAL = float(os.getenv("TAG_INDEX_REFRESH_INTERVAL", "2"))
+
+    # Stored bytes allowed per user across all of their files (0 = no limit).
+    # Uploads are refused on their Content-Length before the body is read
+    # and re-checked against the exact size once the file row is written.
+    USER_QUOTA_BYTES = int(os.getenv("USER_QUOTA_BYTES", "0"))
+
+    # POST /api/files/bulk: NDJSON records per insert batch/transaction
+    BULK_INGEST_BATCH_SIZE = int(os.getenv("BULK_INGEST_BATCH_SIZE", "1000"))
+    BULK_INGEST_MAX_BATCH_SIZE = int(os.getenv("BULK_INGEST_MAX_BATCH_SIZE", "10000"))
+
+    # Response cache for read endpoints; set RESPONSE_CACHE_URL (redis://...)
+    # to share it between workers instead of one LRU per process
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "")
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds, shared backend only
+
+    # Per-request SQL accounting: Server-Timing header (db time and query
+    # count, app time) and a warning log line for each slow statement
+    QUERY_STATS_ENABLED = os.getenv("QUERY_STATS_ENABLED", "true").lower() in ("1", "true", "yes")
+    SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+    # Prometheus metrics at /api/metrics; under gunicorn, gunicorn.conf.py
+    # points PROMETHEUS_MULTIPROC_DIR at a shared directory for all workers
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+    # Connection pool (ignored for in-memory SQLite)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a connection
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+    # PRAGMAs run on every new SQLite connection; an empty value skips one.
+    # WAL lets readers run during a write and busy_timeout makes a second
+    # writer wait instead of failing with "database is locked".
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+    # Comma-separated read replica URLs; GET requests read from them, and a
+    # client that just wrote reads from the primary for this many seconds
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+    # Post-upload processing (checksum, MIME type, text extraction, previews).
+    # PROCESSING_EXECUTOR: "thread" runs jobs in-process, "process" also moves
+    # the CPU-bound analysis into a process pool, "off" leaves them queued in
+    # file_jobs for `flask process-files`.
+    PROCESSING_EXECUTOR = os.getenv("PROCESSING_EXECUTOR", "thread")
+    PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", str(min(4, os.cpu_count() or 1))))
+    PROCESSING_MAX_ATTEMPTS = int(os.getenv("PROCESSING_MAX_ATTEMPTS", "3"))
+    PROCESSING_RETRY_DELAY = float(os.getenv("PROCESSING_RETRY_DELAY", "5"))  # seconds, doubled per failed attempt
+    PROCESSING_STALE_SECONDS = int(os.getenv("PROCESSING_STALE_SECONDS", "600"))  # requeue running jobs after
+    PROCESSING_MAX_TEXT_BYTES = int(os.getenv("PROCESSING_MAX_TEXT_BYTES", str(1024 * 1024)))
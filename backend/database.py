@@ -0,0 +1,195 @@
+import os
+import random
+import time
+from functools import wraps
+
+import click
+from flask import current_app, g, request
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+
+from metrics import TimedQueuePool
+from models import db
+
+# Engine setup: pool settings, SQLite PRAGMAs and optional read replicas.
+#
+# With DATABASE_REPLICA_URLS set, GET/HEAD requests read from one replica
+# (chosen per request) through RoutingSession; flushes and INSERT/UPDATE/
+# DELETE statements always go to the primary. A successful write sets a
+# short-lived cookie, and a client carrying it (or sending
+# X-Read-Your-Writes: 1) reads from the primary until it expires, so it
+# sees its own changes despite replication lag.
+#
+# Nothing here touches the database at import or app creation: the schema
+# is created or migrated by `flask init-db` (init_db), run once per deploy
+# before the workers start.
+
+RYW_COOKIE = 'datahub_rw'
+READ_METHODS = ('GET', 'HEAD')
+
+
+def is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(uri, config):
+    """create_engine() keyword arguments for ``uri`` from Config."""
+    url = make_url(uri)
+    # In-memory SQLite gets a single static connection instead of a pool
+    if is_memory_sqlite(url):
+        return {}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if config['METRICS_ENABLED']:
+        options['poolclass'] = TimedQueuePool
+    return options
+
+
+def _sqlite_pragmas(config):
+    pragmas = {
+        'journal_mode': config['SQLITE_JOURNAL_MODE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT_MS'],
+    }
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if value not in (None, ''):
+                cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return on_connect
+
+
+def _choose_replica():
+    g.db_replica = None
+    replicas = current_app.extensions.get('db_replicas')
+    if not replicas or request.method not in READ_METHODS:
+        return
+    if request.headers.get('X-Read-Your-Writes') == '1':
+        return
+    try:
+        pinned_until = float(request.cookies.get(RYW_COOKIE, 0))
+    except ValueError:
+        pinned_until = 0
+    if pinned_until > time.time():
+        return
+    g.db_replica = random.choice(replicas)
+
+
+def _pin_writer(response):
+    if request.method in READ_METHODS or request.method == 'OPTIONS' or response.status_code >= 400:
+        return response
+    window = current_app.config['READ_YOUR_WRITES_SECONDS']
+    response.set_cookie(
+        RYW_COOKIE, str(int(time.time() + window)), max_age=window, httponly=True, samesite='Lax',
+    )
+    return response
+
+
+def read_primary(view):
+    """Serve a GET view from the primary, for state the caller has just written."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_replica = None
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def init_database(app):
+    config = app.config
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(config['SQLALCHEMY_DATABASE_URI'], config),
+        **config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+    }
+    replica_keys = []
+    binds = config.setdefault('SQLALCHEMY_BINDS', {})
+    for index, uri in enumerate(config['DATABASE_REPLICA_URLS']):
+        key = f'replica_{index}'
+        binds[key] = {'url': uri, **engine_options(uri, config)}
+        replica_keys.append(key)
+
+    db.init_app(app)
+
+    with app.app_context():
+        on_connect = _sqlite_pragmas(config)
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', on_connect)
+        if replica_keys:
+            app.extensions['db_replicas'] = [db.engines[key] for key in replica_keys]
+            app.before_request(_choose_replica)
+            app.after_request(_pin_writer)
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def init_migrations(app):
+    """Register Flask-Migrate and its `flask db` commands."""
+    from flask_migrate import Migrate
+    Migrate(app, db, directory=MIGRATIONS_DIR)
+
+
+class SchemaNotVersioned(RuntimeError):
+    pass
+
+
+def init_db():
+    """Bring the primary database to the latest schema; returns what was done.
+
+    An empty database is created from the models (tables, triggers, search
+    index) and stamped with the Alembic head; one that is already stamped is
+    upgraded with its migrations.
+    """
+    # Alembic and the trigger DDL are only needed here, not on app import
+    import flask_migrate
+    from changes import install_changes
+    from facets import install_facets
+    from search import install_search
+    from suggest import install_suggest
+    from usage import install_usage
+
+    if 'migrate' not in current_app.extensions:
+        init_migrations(current_app._get_current_object())
+
+    url = db.engine.url
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+
+    inspector = inspect(db.engine)
+    if inspector.has_table('alembic_version'):
+        flask_migrate.upgrade()
+        return 'upgraded'
+    if inspector.get_table_names():
+        raise SchemaNotVersioned(
+            "the database has tables but no Alembic revision; run `flask db stamp <revision>` "
+            "for the schema it has, then `flask init-db`"
+        )
+    db.create_all()
+    with db.engine.begin() as connection:
+        install_search(connection)
+        install_facets(connection)
+        install_changes(connection)
+        install_suggest(connection)
+        install_usage(connection)
+    flask_migrate.stamp()
+    return 'created'
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the schema in an empty database, or run pending migrations."""
+    try:
+        click.echo(f"database {init_db()}")
+    except SchemaNotVersioned as exc:
+        raise click.ClickException(str(exc))
@@ -0,0 +1,139 @@
+from sqlalchemy import func, inspect, select
+
+from models import db, File, FileTag, Tag, UserTagCount
+
+# tags.file_count and user_tag_counts are kept current by triggers on
+# file_tags, so unfiltered and per-owner facet counts are plain index reads
+# instead of COUNT(*) over the link table.
+
+SQLITE_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS file_tags_counts_ai AFTER INSERT ON file_tags BEGIN "
+    "UPDATE tags SET file_count = file_count + 1 WHERE id = new.tag_id; "
+    "INSERT INTO user_tag_counts(user_id, tag_id, file_count) "
+    "SELECT user_id, new.tag_id, 1 FROM files WHERE id = new.file_id "
+    "ON CONFLICT(user_id, tag_id) DO UPDATE SET file_count = file_count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS file_tags_counts_ad AFTER DELETE ON file_tags BEGIN "
+    "UPDATE tags SET file_count = file_count - 1 WHERE id = old.tag_id; "
+    "UPDATE user_tag_counts SET file_count = file_count - 1 "
+    "WHERE tag_id = old.tag_id AND user_id = (SELECT user_id FROM files WHERE id = old.file_id); END",
+]
+
+POSTGRES_DDL = [
+    """CREATE OR REPLACE FUNCTION file_tags_counts_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE tags SET file_count = file_count + 1 WHERE id = NEW.tag_id;
+            INSERT INTO user_tag_counts(user_id, tag_id, file_count)
+            SELECT user_id, NEW.tag_id, 1 FROM files WHERE id = NEW.file_id
+            ON CONFLICT (user_id, tag_id) DO UPDATE
+            SET file_count = user_tag_counts.file_count + 1;
+        ELSE
+            UPDATE tags SET file_count = file_count - 1 WHERE id = OLD.tag_id;
+            UPDATE user_tag_counts SET file_count = file_count - 1
+            WHERE tag_id = OLD.tag_id
+              AND user_id = (SELECT user_id FROM files WHERE id = OLD.file_id);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS file_tags_counts_aid ON file_tags",
+    "CREATE TRIGGER file_tags_counts_aid AFTER INSERT OR DELETE ON file_tags "
+    "FOR EACH ROW EXECUTE FUNCTION file_tags_counts_trg()",
+]
+
+# Recount from scratch; only run when the triggers are first installed
+BACKFILL = [
+    "UPDATE tags SET file_count = (SELECT count(*) FROM file_tags WHERE file_tags.tag_id = tags.id)",
+    "DELETE FROM user_tag_counts",
+    "INSERT INTO user_tag_counts(user_id, tag_id, file_count) "
+    "SELECT f.user_id, ft.tag_id, count(*) FROM file_tags ft "
+    "JOIN files f ON f.id = ft.file_id GROUP BY f.user_id, ft.tag_id",
+]
+
+
+def _has_count_triggers(connection):
+    if connection.dialect.name == 'sqlite':
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'file_tags_counts_ai'"
+    else:
+        sql = "SELECT 1 FROM pg_trigger WHERE tgname = 'file_tags_counts_aid'"
+    return connection.exec_driver_sql(sql).first() is not None
+
+
+def install_facets(connection):
+    """Create the tag-count triggers if missing and backfill the counters."""
+    dialect = connection.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        return
+    # Databases that predate the counters get them from the Alembic migration
+    inspector = inspect(connection)
+    if not inspector.has_table('user_tag_counts'):
+        return
+    if 'file_count' not in {column['name'] for column in inspector.get_columns('tags')}:
+        return
+    if _has_count_triggers(connection):
+        return
+    for statement in (SQLITE_DDL if dialect == 'sqlite' else POSTGRES_DDL):
+        connection.exec_driver_sql(statement)
+    for statement in BACKFILL:
+        connection.exec_driver_sql(statement)
+
+
+class UnknownTags(LookupError):
+    pass
+
+
+def filter_files(query, tag_names=None, match='all', user_id=None):
+    """Restrict a File query by owner and tags.
+
+    ``match='all'`` keeps files carrying every tag, ``'any'`` files with at
+    least one. Both are driven by the (tag_id, file_id) index. Raises
+    UnknownTags when ``match='all'`` names a tag that does not exist.
+    """
+    if user_id is not None:
+        query = query.filter(File.user_id == user_id)
+    if not tag_names:
+        return query
+
+    tag_ids = list(db.session.scalars(select(Tag.id).where(Tag.name.in_(tag_names))))
+    if match == 'all' and len(tag_ids) < len(set(tag_names)):
+        raise UnknownTags(tag_names)
+    tagged = select(FileTag.file_id).where(FileTag.tag_id.in_(tag_ids))
+    if match == 'all' and len(tag_ids) > 1:
+        tagged = tagged.group_by(FileTag.file_id).having(func.count() == len(tag_ids))
+    return query.filter(File.id.in_(tagged))
+
+
+def tag_facets(tag_names=None, match='all', user_id=None, limit=50):
+    """[(Tag, count)] for the files matching the filter, most used first."""
+    if not tag_names:
+        # Precomputed counters; no scan of file_tags
+        if user_id is None:
+            query = (
+                db.session.query(Tag, Tag.file_count)
+                .filter(Tag.file_count > 0)
+                .order_by(Tag.file_count.desc(), Tag.name)
+            )
+        else:
+            query = (
+                db.session.query(Tag, UserTagCount.file_count)
+                .join(UserTagCount, UserTagCount.tag_id == Tag.id)
+                .filter(UserTagCount.user_id == user_id, UserTagCount.file_count > 0)
+                .order_by(UserTagCount.file_count.desc(), Tag.name)
+            )
+        return query.limit(limit).all()
+
+    # Drill-down: count co-occurring tags over the (already narrowed) file set
+    try:
+        files = filter_files(db.session.query(File.id), tag_names, match, user_id)
+    except UnknownTags:
+        return []
+    count = func.count(FileTag.file_id).label('file_count')
+    return (
+        db.session.query(Tag, count)
+        .join(FileTag, FileTag.tag_id == Tag.id)
+        .filter(FileTag.file_id.in_(files.statement))
+        .group_by(Tag.id)
+        .order_by(count.desc(), Tag.name)
+        .limit(limit)
+        .all()
+    )
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+
+# gunicorn reads this file from the working directory before importing the
+# app. prometheus_client picks its multiprocess mode at import time, so the
+# metrics directory has to be set here, ahead of any worker.
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'datahub-metrics')
+)
+
+# Import the app once in the master and fork workers from it: a new or
+# restarted worker is ready as soon as it is forked, and the imported code
+# is shared copy-on-write. GUNICORN_PRELOAD=false imports it in each worker
+# instead (needed for --reload).
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+
+def on_starting(server):
+    # Values left by a previous run would be summed into the new one
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    # Build what the first requests would otherwise build in every worker
+    import schemas
+    for name in schemas.SCHEMA_NAMES:
+        getattr(schemas, name)
+    # Workers inherit the tag prefix index instead of loading their own
+    from models import db
+    from suggest import refresh_tag_index
+    app = server.app.wsgi()
+    if 'tag-index' in app.extensions.get('periodic_tasks', {}):
+        with app.app_context():
+            try:
+                refresh_tag_index()
+            except Exception:
+                server.log.exception("tag index not preloaded")
+            db.session.remove()
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    # A connection opened in the master must not be shared with the workers;
+    # drop the inherited pools without closing the master's sockets
+    from models import db
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
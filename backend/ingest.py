@@ -0,0 +1,119 @@
+import json
+from itertools import islice
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from cache import bump_versions
+from models import db, User, File, FileTag
+from tagging import resolve_tags, tag_items
+
+
+class RecordError(ValueError):
+    pass
+
+
+def parse_record(line):
+    """Validate one NDJSON line into (file_row, tag_items)."""
+    try:
+        record = json.loads(line)
+    except ValueError as exc:
+        raise RecordError(f"invalid JSON: {exc}")
+    if not isinstance(record, dict):
+        raise RecordError("record must be a JSON object")
+
+    filename = record.get('filename')
+    if not isinstance(filename, str) or not filename.strip():
+        raise RecordError("filename is required")
+    try:
+        user_id = int(record.get('user_id'))
+    except (TypeError, ValueError):
+        raise RecordError("user_id is required")
+
+    tags_with_meta = record.get('tags_with_meta')
+    names = record.get('tags')
+    if isinstance(names, str):
+        names = names.split(',')
+    items = tag_items(
+        tags_with_meta if isinstance(tags_with_meta, list) else None,
+        names if isinstance(names, list) else None,
+    )
+    row = {
+        'filename': filename.strip(),
+        'user_id': user_id,
+        'description': record.get('description'),
+        'url': record.get('url'),
+    }
+    return row, items
+
+
+def _insert_batch(parsed):
+    """Insert one batch of (line_no, row, items); returns line numbers of unknown users."""
+    user_ids = {row['user_id'] for _, row, _ in parsed}
+    known = {uid for (uid,) in db.session.query(User.id).filter(User.id.in_(user_ids))}
+    rejected = [line_no for line_no, row, _ in parsed if row['user_id'] not in known]
+    parsed = [entry for entry in parsed if entry[1]['user_id'] in known]
+    if not parsed:
+        return rejected
+
+    tags, _ = resolve_tags([name for _, _, items in parsed for name, _ in items])
+    file_ids = db.session.scalars(
+        insert(File).returning(File.id, sort_by_parameter_order=True),
+        [row for _, row, _ in parsed],
+    ).all()
+    links = [
+        {'file_id': file_id, 'tag_id': tags[name].id, 'added_by': added_by}
+        for file_id, (_, _, items) in zip(file_ids, parsed)
+        for name, added_by in items
+    ]
+    if links:
+        db.session.execute(insert(FileTag), links)
+    bump_versions('files', 'tags')
+    return rejected
+
+
+def ingest_ndjson(lines, batch_size):
+    """Bulk-insert metadata-only files from NDJSON lines.
+
+    Lines are parsed lazily and written ``batch_size`` at a time with
+    executemany inserts, one transaction per batch, so the body is never
+    held in memory. A failing batch is rolled back and reported without
+    stopping the rest. Returns {"inserted", "failed", "errors"}.
+    """
+    report = {"inserted": 0, "failed": 0, "errors": []}
+
+    def fail(line_no, message):
+        report["failed"] += 1
+        report["errors"].append({"line": line_no, "error": message})
+
+    numbered = (
+        (line_no, line) for line_no, line in enumerate(lines, start=1) if line.strip()
+    )
+    while True:
+        batch = list(islice(numbered, batch_size))
+        if not batch:
+            break
+        parsed = []
+        for line_no, line in batch:
+            try:
+                row, items = parse_record(line)
+            except RecordError as exc:
+                fail(line_no, str(exc))
+                continue
+            parsed.append((line_no, row, items))
+        if not parsed:
+            continue
+
+        try:
+            rejected = _insert_batch(parsed)
+            db.session.commit()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            message = f"batch failed: {exc.__class__.__name__}"
+            for line_no, _, _ in parsed:
+                fail(line_no, message)
+            continue
+        for line_no in rejected:
+            fail(line_no, "unknown user_id")
+        report["inserted"] += len(parsed) - len(rejected)
+    return report
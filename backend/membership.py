@@ -0,0 +1,69 @@
+from sqlalchemy import literal, select
+
+from models import db, File, collection_files, upsert_insert
+
+# Collection membership is changed with set-based statements on
+# collection_files instead of loading Collection.files, so adding ten files
+# to a collection of 50k touches ten rows, not the whole relationship.
+
+BATCH_SIZE = 1000
+
+
+class InvalidFileIds(ValueError):
+    pass
+
+
+def parse_file_ids(raw):
+    """A JSON list of file ids as a set of ints."""
+    if not isinstance(raw, list):
+        raise InvalidFileIds("file_ids must be a list of integers")
+    try:
+        return {int(value) for value in raw if not isinstance(value, bool)}
+    except (TypeError, ValueError):
+        raise InvalidFileIds("file_ids must be a list of integers")
+
+
+def _batches(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def add_members(collection_id, file_ids):
+    """Link the existing files among ``file_ids``; returns how many were new."""
+    table = collection_files
+    added = 0
+    for batch in _batches(file_ids):
+        rows = select(literal(collection_id), File.id).where(File.id.in_(batch))
+        insert = upsert_insert(table)
+        if insert is not None:
+            statement = insert.from_select(['collection_id', 'file_id'], rows).on_conflict_do_nothing()
+        else:
+            present = select(table.c.file_id).where(
+                table.c.collection_id == collection_id, table.c.file_id.in_(batch)
+            )
+            statement = table.insert().from_select(
+                ['collection_id', 'file_id'], rows.where(File.id.not_in(present))
+            )
+        added += db.session.execute(statement).rowcount
+    return added
+
+
+def remove_members(collection_id, file_ids):
+    """Unlink ``file_ids``; returns how many were members."""
+    table = collection_files
+    removed = 0
+    for batch in _batches(file_ids):
+        removed += db.session.execute(
+            table.delete().where(table.c.collection_id == collection_id, table.c.file_id.in_(batch))
+        ).rowcount
+    return removed
+
+
+def replace_members(collection_id, file_ids):
+    """Make ``file_ids`` the full member set, writing only the difference."""
+    table = collection_files
+    current = set(db.session.scalars(select(table.c.file_id).where(table.c.collection_id == collection_id)))
+    removed = remove_members(collection_id, current - file_ids)
+    added = add_members(collection_id, file_ids - current)
+    return added, removed
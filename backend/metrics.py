@@ -0,0 +1,125 @@
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import Pool, QueuePool
+
+# Prometheus metrics. Under gunicorn, gunicorn.conf.py sets
+# PROMETHEUS_MULTIPROC_DIR before the app is imported; prometheus_client then
+# keeps every worker's values in mmap'd files there and /api/metrics sums
+# them, so any worker can answer a scrape. Updates are a lock and an add,
+# cheap enough to leave on.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUESTS = Counter(
+    'datahub_http_requests_total', 'HTTP requests.', ['method', 'route', 'status'],
+)
+REQUEST_LATENCY = Histogram(
+    'datahub_http_request_duration_seconds', 'Time to produce a response.',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS,
+)
+POOL_WAIT = Histogram(
+    'datahub_db_pool_checkout_seconds', 'Time to check a connection out of the pool.',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+POOL_CAPACITY = Gauge(
+    'datahub_db_pool_capacity', 'Pool size plus max overflow.', multiprocess_mode='livesum',
+)
+POOL_IN_USE = Gauge(
+    'datahub_db_pool_checked_out', 'Connections currently checked out.', multiprocess_mode='livesum',
+)
+UPLOAD_BYTES = Counter(
+    'datahub_upload_bytes_total', 'Uploaded bytes received.', ['kind'],
+)
+UPLOAD_SECONDS = Counter(
+    'datahub_upload_seconds_total', 'Time spent receiving uploaded bytes.', ['kind'],
+)
+CACHE_LOOKUPS = Counter(
+    'datahub_response_cache_lookups_total', 'Response cache lookups.', ['result'],
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records checkout wait and its own capacity."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        POOL_CAPACITY.inc(self.size() + max(self._max_overflow, 0))
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started)
+
+    def dispose(self):
+        super().dispose()
+        POOL_CAPACITY.dec(self.size() + max(self._max_overflow, 0))
+
+
+@event.listens_for(Pool, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_IN_USE.inc()
+
+
+@event.listens_for(Pool, 'checkin')
+def _on_checkin(dbapi_connection, connection_record):
+    POOL_IN_USE.dec()
+
+
+def observe_upload(kind, size, seconds):
+    UPLOAD_BYTES.labels(kind).inc(size)
+    UPLOAD_SECONDS.labels(kind).inc(seconds)
+
+
+def observe_cache(hit):
+    CACHE_LOOKUPS.labels('hit' if hit else 'miss').inc()
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _observe_request(exc):
+    # Teardown runs even when an unhandled exception skipped the
+    # after_request hooks, so failed requests are counted as 500s
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    status = g.get('metrics_status', 500) if exc is None else 500
+    # The URL rule, not the path, so /files/1 and /files/2 share a series
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    labels = (request.method, route, str(status))
+    REQUESTS.labels(*labels).inc()
+    REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+
+
+def init_metrics(app):
+    """Hook request timing into ``app``; database.init_database installs TimedQueuePool."""
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_status)
+    app.teardown_request(_observe_request)
+
+
+def render():
+    """(body, content type) of the current metrics, summed over workers."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
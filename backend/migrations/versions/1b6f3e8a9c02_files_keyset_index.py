@@ -0,0 +1,28 @@
+"""files (created_at, id) index for keyset pagination
+
+Revision ID: 1b6f3e8a9c02
+Revises: 5a1d3c9e2b47
+Create Date: 2026-10-18 20:30:10.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b6f3e8a9c02'
+down_revision = '5a1d3c9e2b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up before `flask init-db` existed had db.create_all() run
+    # at every app start, which may already have created it
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_files_created_at_id' not in {i['name'] for i in inspector.get_indexes('files')}:
+        op.create_index('ix_files_created_at_id', 'files', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_files_created_at_id', table_name='files')
@@ -0,0 +1,47 @@
+"""content-addressed blobs and files.blob_sha256
+
+Revision ID: 3c7a2d5e8f14
+Revises: 1b6f3e8a9c02
+Create Date: 2026-10-18 20:30:20.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7a2d5e8f14'
+down_revision = '1b6f3e8a9c02'
+branch_labels = None
+depends_on = None
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def upgrade():
+    # Databases set up before `flask init-db` existed had db.create_all() run
+    # at every app start, which may already have made the table; only add
+    # what is missing
+    if not _inspector().has_table('blobs'):
+        op.create_table('blobs',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('sha256')
+        )
+    if 'blob_sha256' not in {c['name'] for c in _inspector().get_columns('files')}:
+        with op.batch_alter_table('files', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('blob_sha256', sa.String(length=64), nullable=True))
+            batch_op.create_foreign_key('fk_files_blob_sha256_blobs', 'blobs', ['blob_sha256'], ['sha256'])
+            batch_op.create_index('ix_files_blob_sha256', ['blob_sha256'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index('ix_files_blob_sha256')
+        batch_op.drop_constraint('fk_files_blob_sha256_blobs', type_='foreignkey')
+        batch_op.drop_column('blob_sha256')
+    op.drop_table('blobs')
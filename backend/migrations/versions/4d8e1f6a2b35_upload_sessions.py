@@ -0,0 +1,49 @@
+"""resumable upload sessions and chunks
+
+Revision ID: 4d8e1f6a2b35
+Revises: 3c7a2d5e8f14
+Create Date: 2026-10-18 20:30:30.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8e1f6a2b35'
+down_revision = '3c7a2d5e8f14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up before `flask init-db` existed had db.create_all() run
+    # at every app start, which may already have made the tables
+    if sa.inspect(op.get_bind()).has_table('upload_sessions'):
+        return
+    op.create_table('upload_sessions',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('tags', sa.JSON(), nullable=True),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('chunk_size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_upload_sessions_expires_at', 'upload_sessions', ['expires_at'], unique=False)
+    op.create_table('upload_chunks',
+    sa.Column('session_id', sa.String(length=32), nullable=False),
+    sa.Column('chunk_index', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['session_id'], ['upload_sessions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('session_id', 'chunk_index')
+    )
+
+
+def downgrade():
+    op.drop_table('upload_chunks')
+    op.drop_index('ix_upload_sessions_expires_at', table_name='upload_sessions')
+    op.drop_table('upload_sessions')
@@ -0,0 +1,40 @@
+"""full-text search index and triggers
+
+Revision ID: 8c4e0f6a1d23
+Revises: 4d8e1f6a2b35
+Create Date: 2026-10-18 20:31:00.000000
+
+"""
+from alembic import op
+
+from search import install_search
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e0f6a1d23'
+down_revision = '4d8e1f6a2b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # This id once also covered the keyset index, blobs and upload sessions,
+    # which now have their own revisions before it; databases stamped here
+    # already have all of them
+    install_search(op.get_bind())
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS files_fts')
+        for trigger in ('files_fts_ai', 'files_fts_au', 'files_fts_ad', 'files_fts_tags_ai', 'files_fts_tags_ad'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    elif bind.dialect.name == 'postgresql':
+        op.execute('DROP TRIGGER IF EXISTS file_tags_search_vector_aid ON file_tags')
+        op.execute('DROP TRIGGER IF EXISTS files_search_vector_biu ON files')
+        op.execute('DROP FUNCTION IF EXISTS file_tags_search_vector_trg()')
+        op.execute('DROP FUNCTION IF EXISTS files_search_vector_trg()')
+        op.execute('DROP FUNCTION IF EXISTS files_search_vector(integer, text, text)')
+        op.execute('DROP INDEX IF EXISTS ix_files_search_vector')
+        op.execute('ALTER TABLE files DROP COLUMN IF EXISTS search_vector')
@@ -0,0 +1,28 @@
+"""per-owner collection index
+
+Revision ID: a4d6e1c9b372
+Revises: f7b3d2a8c615
+Create Date: 2026-10-18 22:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d6e1c9b372'
+down_revision = 'f7b3d2a8c615'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up before `flask init-db` existed had db.create_all() run
+    # at every app start, which may already have created it
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_collections_user_id_created_at_id' not in {i['name'] for i in inspector.get_indexes('collections')}:
+        op.create_index('ix_collections_user_id_created_at_id', 'collections', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_collections_user_id_created_at_id', table_name='collections')
@@ -0,0 +1,63 @@
+"""tag facet indexes and counters
+
+Revision ID: b7e2d9f40c18
+Revises: 8c4e0f6a1d23
+Create Date: 2026-10-18 20:32:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from facets import install_facets
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d9f40c18'
+down_revision = '8c4e0f6a1d23'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up before `flask init-db` existed had db.create_all() run
+    # at every app start, which may already have created some of this
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_file_tags_tag_id_file_id' not in {i['name'] for i in inspector.get_indexes('file_tags')}:
+        op.create_index('ix_file_tags_tag_id_file_id', 'file_tags', ['tag_id', 'file_id'], unique=False)
+    if 'ix_files_user_id_created_at_id' not in {i['name'] for i in inspector.get_indexes('files')}:
+        op.create_index('ix_files_user_id_created_at_id', 'files', ['user_id', 'created_at', 'id'], unique=False)
+    if 'file_count' not in {c['name'] for c in inspector.get_columns('tags')}:
+        op.add_column('tags', sa.Column('file_count', sa.Integer(), server_default='0', nullable=False))
+        op.create_index('ix_tags_file_count', 'tags', ['file_count'], unique=False)
+    if not inspector.has_table('user_tag_counts'):
+        _create_user_tag_counts()
+
+    # Triggers plus a one-off recount of existing links
+    install_facets(op.get_bind())
+
+
+def _create_user_tag_counts():
+    op.create_table('user_tag_counts',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('file_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'tag_id')
+    )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS file_tags_counts_ai')
+        op.execute('DROP TRIGGER IF EXISTS file_tags_counts_ad')
+    elif bind.dialect.name == 'postgresql':
+        op.execute('DROP TRIGGER IF EXISTS file_tags_counts_aid ON file_tags')
+        op.execute('DROP FUNCTION IF EXISTS file_tags_counts_trg()')
+
+    op.drop_table('user_tag_counts')
+    op.drop_index('ix_tags_file_count', table_name='tags')
+    op.drop_column('tags', 'file_count')
+    op.drop_index('ix_files_user_id_created_at_id', table_name='files')
+    op.drop_index('ix_file_tags_tag_id_file_id', table_name='file_tags')
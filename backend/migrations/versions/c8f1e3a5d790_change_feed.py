@@ -0,0 +1,56 @@
+"""change feed: row versions and the changes log
+
+Revision ID: c8f1e3a5d790
+Revises: a4d6e1c9b372
+Create Date: 2026-10-18 23:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from changes import install_changes, uninstall_changes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f1e3a5d790'
+down_revision = 'a4d6e1c9b372'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up before `flask init-db` existed had db.create_all() run
+    # at every app start, which may already have created some of this
+    inspector = sa.inspect(op.get_bind())
+    for table in ('files', 'collections'):
+        columns = {c['name'] for c in inspector.get_columns(table)}
+        if 'updated_at' not in columns:
+            op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+            op.execute(f'UPDATE {table} SET updated_at = created_at')
+        if 'version' not in columns:
+            op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    if not inspector.has_table('changes'):
+        op.create_table('changes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('resource', sa.String(length=16), nullable=False),
+        sa.Column('resource_id', sa.Integer(), nullable=False),
+        sa.Column('op', sa.String(length=8), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sqlite_autoincrement=True
+        )
+        op.create_index('ix_changes_resource_resource_id_id', 'changes', ['resource', 'resource_id', 'id'], unique=False)
+        op.create_index('ix_changes_op_created_at', 'changes', ['op', 'created_at'], unique=False)
+
+    # Triggers plus one entry for every existing file, collection and tag
+    install_changes(op.get_bind())
+
+
+def downgrade():
+    uninstall_changes(op.get_bind())
+    op.drop_index('ix_changes_op_created_at', table_name='changes')
+    op.drop_index('ix_changes_resource_resource_id_id', table_name='changes')
+    op.drop_table('changes')
+    for table in ('collections', 'files'):
+        op.drop_column(table, 'version')
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,42 @@
+"""tag suggestions: lower(name) index and tags.updated_at
+
+Revision ID: d2f7a9c4e815
+Revises: c8f1e3a5d790
+Create Date: 2026-10-19 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from suggest import install_suggest, uninstall_suggest
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f7a9c4e815'
+down_revision = 'c8f1e3a5d790'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # Expression indexes are not reported by the inspector on SQLite
+    if bind.dialect.name == 'postgresql':
+        # text_pattern_ops lets LIKE 'prefix%' use the index under any collation
+        op.execute('CREATE INDEX IF NOT EXISTS ix_tags_name_lower ON tags (lower(name) text_pattern_ops)')
+    else:
+        op.execute('CREATE INDEX IF NOT EXISTS ix_tags_name_lower ON tags (lower(name))')
+    if 'updated_at' not in {c['name'] for c in inspector.get_columns('tags')}:
+        op.add_column('tags', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_tags_updated_at', 'tags', ['updated_at'], unique=False, if_not_exists=True)
+
+    # Triggers plus a one-off stamp of the existing tags
+    install_suggest(bind)
+
+
+def downgrade():
+    uninstall_suggest(op.get_bind())
+    op.drop_index('ix_tags_updated_at', table_name='tags')
+    op.drop_column('tags', 'updated_at')
+    op.drop_index('ix_tags_name_lower', table_name='tags')
@@ -0,0 +1,32 @@
+"""resource version counters for the response cache
+
+Revision ID: d3a91c5e7f02
+Revises: b7e2d9f40c18
+Create Date: 2026-10-18 20:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a91c5e7f02'
+down_revision = 'b7e2d9f40c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up before `flask init-db` existed had db.create_all() run
+    # at every app start, which may already have created it
+    if sa.inspect(op.get_bind()).has_table('resource_versions'):
+        return
+    op.create_table('resource_versions',
+    sa.Column('resource', sa.String(length=32), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('resource')
+    )
+
+
+def downgrade():
+    op.drop_table('resource_versions')
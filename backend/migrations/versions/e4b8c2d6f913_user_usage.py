@@ -0,0 +1,37 @@
+"""per-user storage usage counters
+
+Revision ID: e4b8c2d6f913
+Revises: d2f7a9c4e815
+Create Date: 2026-10-19 15:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from usage import install_usage, uninstall_usage
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b8c2d6f913'
+down_revision = 'd2f7a9c4e815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table('user_usage'):
+        op.create_table('user_usage',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('file_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('total_bytes', sa.BigInteger(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+        )
+
+    # Triggers plus a one-off count of existing files
+    install_usage(op.get_bind())
+
+
+def downgrade():
+    uninstall_usage(op.get_bind())
+    op.drop_table('user_usage')
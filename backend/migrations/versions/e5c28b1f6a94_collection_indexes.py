@@ -0,0 +1,31 @@
+"""collection listing and membership indexes
+
+Revision ID: e5c28b1f6a94
+Revises: d3a91c5e7f02
+Create Date: 2026-10-18 21:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c28b1f6a94'
+down_revision = 'd3a91c5e7f02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up before `flask init-db` existed had db.create_all() run
+    # at every app start, which may already have created them
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_collections_created_at_id' not in {i['name'] for i in inspector.get_indexes('collections')}:
+        op.create_index('ix_collections_created_at_id', 'collections', ['created_at', 'id'], unique=False)
+    if 'ix_collection_files_file_id' not in {i['name'] for i in inspector.get_indexes('collection_files')}:
+        op.create_index('ix_collection_files_file_id', 'collection_files', ['file_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_collection_files_file_id', table_name='collection_files')
+    op.drop_index('ix_collections_created_at_id', table_name='collections')
@@ -0,0 +1,51 @@
+"""files and collections created_at NOT NULL
+
+Revision ID: f1a9b3c7d248
+Revises: e4b8c2d6f913
+Create Date: 2026-10-19 18:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a9b3c7d248'
+down_revision = 'e4b8c2d6f913'
+branch_labels = None
+depends_on = None
+
+# Keyset pages are ordered by (created_at, id); a NULL sorts differently per
+# dialect and can never match a cursor, so rows without one get the epoch
+EPOCH = '1970-01-01 00:00:00'
+
+
+def _set_nullable(table, nullable):
+    bind = op.get_bind()
+    sqlite = bind.dialect.name == 'sqlite'
+    triggers = []
+    if sqlite:
+        # SQLite changes nullability by rebuilding the table, which drops the
+        # triggers defined on it; triggers on other tables that name it would
+        # also fail the final rename unless the legacy rename rules are on
+        triggers = bind.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,)
+        ).scalars().all()
+        op.execute('PRAGMA legacy_alter_table = ON')
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=nullable)
+    if sqlite:
+        op.execute('PRAGMA legacy_alter_table = OFF')
+    for sql in triggers:
+        op.execute(sql)
+
+
+def upgrade():
+    for table in ('files', 'collections'):
+        op.execute(f"UPDATE {table} SET created_at = '{EPOCH}' WHERE created_at IS NULL")
+        _set_nullable(table, False)
+
+
+def downgrade():
+    for table in ('collections', 'files'):
+        _set_nullable(table, True)
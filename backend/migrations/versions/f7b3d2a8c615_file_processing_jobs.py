@@ -0,0 +1,56 @@
+"""post-upload processing jobs, file size and MIME type
+
+Revision ID: f7b3d2a8c615
+Revises: e5c28b1f6a94
+Create Date: 2026-10-18 21:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from search import install_search
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7b3d2a8c615'
+down_revision = 'e5c28b1f6a94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up before `flask init-db` existed had db.create_all() run
+    # at every app start, which may already have created them
+    inspector = sa.inspect(op.get_bind())
+    columns = {c['name'] for c in inspector.get_columns('files')}
+    if 'size_bytes' not in columns:
+        op.add_column('files', sa.Column('size_bytes', sa.BigInteger(), nullable=True))
+    if 'mime_type' not in columns:
+        op.add_column('files', sa.Column('mime_type', sa.String(length=127), nullable=True))
+    if not inspector.has_table('file_jobs'):
+        op.create_table('file_jobs',
+        sa.Column('file_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('extracted_text', sa.Text(), nullable=True),
+        sa.Column('preview_path', sa.String(length=512), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['file_id'], ['files.id'], ),
+        sa.PrimaryKeyConstraint('file_id')
+        )
+        op.create_index('ix_file_jobs_status', 'file_jobs', ['status'], unique=False)
+
+    # Adds the extracted-text column to the full-text index
+    install_search(op.get_bind())
+
+
+def downgrade():
+    op.drop_index('ix_file_jobs_status', table_name='file_jobs')
+    op.drop_table('file_jobs')
+    # Plain drops: batch mode would copy files, which the search triggers reference
+    op.drop_column('files', 'mime_type')
+    op.drop_column('files', 'size_bytes')
+    # PostgreSQL: recreate files_search_vector() without the file_jobs lookup
+    install_search(op.get_bind())
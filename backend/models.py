@@ -1,9 +1,37 @@
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from datetime import datetime
+from sqlalchemy import func, literal_column, select
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql.dml import UpdateBase
 
 
-db = SQLAlchemy()
+class RoutingSession(Session):
+    """Reads go to the request's replica (g.db_replica) when one was chosen."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) and has_app_context():
+            replica = g.get('db_replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Dialects with INSERT ... ON CONFLICT and RETURNING
+_UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def upsert_insert(table):
+    """Dialect insert() supporting on_conflict_*, or None if the bound dialect lacks it."""
+    insert = _UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    return insert(table) if insert is not None else None
 
 class FileTag(db.Model):
     __tablename__ = 'file_tags'
@@ -16,11 +44,18 @@ class FileTag(db.Model):
     file = db.relationship('File', back_populates='tag_links')
     tag = db.relationship('Tag', back_populates='file_links')
 
+    __table_args__ = (
+        # The primary key leads with file_id; tag-driven lookups need tag_id first
+        db.Index('ix_file_tags_tag_id_file_id', 'tag_id', 'file_id'),
+    )
+
 # Association table between Collection and File
 collection_files = db.Table(
     'collection_files',
     db.Column('collection_id', db.Integer, db.ForeignKey('collections.id'), primary_key=True),
     db.Column('file_id', db.Integer, db.ForeignKey('files.id'), primary_key=True),
+    # The primary key leads with collection_id; file deletes look up by file_id
+    db.Index('ix_collection_files_file_id', 'file_id'),
 )
 
 
@@ -48,21 +83,110 @@ class File(db.Model):
     url = db.Column(db.String(512), nullable=True)
     description = db.Column(db.Text, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), nullable=True, index=True)
+    # Filled in by the post-upload pipeline (processing.py)
+    size_bytes = db.Column(db.BigInteger, nullable=True)
+    mime_type = db.Column(db.String(127), nullable=True)
+    # Bumped on every update; tag link changes bump them too (see changes.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=literal_column('version') + 1)
 
     # Association object pattern for tags
     tag_links = db.relationship('FileTag', back_populates='file', cascade="all, delete-orphan")
     tags = association_proxy('tag_links', 'tag', creator=lambda tag: FileTag(tag=tag))
 
+    __table_args__ = (
+        # Backs keyset pagination on (created_at, id), overall and per owner
+        db.Index('ix_files_created_at_id', 'created_at', 'id'),
+        db.Index('ix_files_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
+
     def __repr__(self):
         return f"<File {self.filename}>"
 
 
+class FileJob(db.Model):
+    """Post-upload processing state and results for one stored file."""
+    __tablename__ = 'file_jobs'
+
+    file_id = db.Column(db.Integer, db.ForeignKey('files.id'), primary_key=True)
+    status = db.Column(db.String(16), nullable=False, default='pending', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    extracted_text = db.deferred(db.Column(db.Text, nullable=True))
+    preview_path = db.Column(db.String(512), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    file = db.relationship('File', backref=db.backref('job', uselist=False, cascade='all, delete-orphan'))
+
+
+class Blob(db.Model):
+    """Content-addressed upload; ref_count is the number of files pointing at it."""
+    __tablename__ = 'blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    files = db.relationship('File', backref='blob', lazy=True)
+
+    def __repr__(self):
+        return f"<Blob {self.sha256[:12]} refs={self.ref_count}>"
+
+
+class UploadSession(db.Model):
+    """Resumable upload in progress; chunks land in a preallocated part file."""
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    tags = db.Column(db.JSON, nullable=True)
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    @property
+    def total_chunks(self):
+        return -(-self.size_bytes // self.chunk_size)
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.size_bytes - index * self.chunk_size)
+
+    def __repr__(self):
+        return f"<UploadSession {self.id}>"
+
+
+class UploadChunk(db.Model):
+    __tablename__ = 'upload_chunks'
+
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id', ondelete='CASCADE'), primary_key=True)
+    chunk_index = db.Column(db.Integer, primary_key=True)
+
+
 class Tag(db.Model):
     __tablename__ = 'tags'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
+    # Maintained by triggers on file_tags (see facets.py)
+    file_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    # Stamped by triggers on create, rename and file_count changes (see suggest.py)
+    updated_at = db.Column(db.DateTime, index=True)
+
+    __table_args__ = (
+        # Case-insensitive prefix lookups for tag suggestions
+        db.Index(
+            'ix_tags_name_lower', func.lower(name).label('name_lower'),
+            postgresql_ops={'name_lower': 'text_pattern_ops'},
+        ),
+    )
 
     file_links = db.relationship('FileTag', back_populates='tag', cascade="all, delete-orphan")
 
@@ -70,15 +194,79 @@ class Tag(db.Model):
         return f"<Tag {self.name}>"
 
 
+class UserTagCount(db.Model):
+    """Per-owner tag usage, maintained by triggers on file_tags (see facets.py)."""
+    __tablename__ = 'user_tag_counts'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    file_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+class UserUsage(db.Model):
+    """Per-owner file count and stored bytes, maintained by triggers on files (see usage.py)."""
+    __tablename__ = 'user_usage'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    file_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+
+
+class ResourceVersion(db.Model):
+    """Write counter per API resource; part of every response cache key (see cache.py)."""
+    __tablename__ = 'resource_versions'
+
+    resource = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Change(db.Model):
+    """One entry of the change feed, written by triggers (see changes.py)."""
+    __tablename__ = 'changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    resource = db.Column(db.String(16), nullable=False)
+    resource_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(8), nullable=False)  # 'upsert' or 'delete'
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Compaction finds a resource's older entries; expiry finds old tombstones
+        db.Index('ix_changes_resource_resource_id_id', 'resource', 'resource_id', 'id'),
+        db.Index('ix_changes_op_created_at', 'op', 'created_at'),
+        # Never reuse ids, even after the newest entries are compacted away
+        {'sqlite_autoincrement': True},
+    )
+
+
 class Collection(db.Model):
     __tablename__ = 'collections'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Bumped on every update; membership changes bump them too (see changes.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=literal_column('version') + 1)
 
     files = db.relationship('File', secondary=collection_files, backref=db.backref('collections', lazy='dynamic'))
 
+    # Member count as a correlated COUNT over the primary key index; deferred
+    # so it is only computed where a query undefers it or it is accessed
+    file_count = db.column_property(
+        select(func.count(collection_files.c.file_id))
+        .where(collection_files.c.collection_id == id)
+        .correlate_except(collection_files)
+        .scalar_subquery(),
+        deferred=True,
+    )
+
+    __table_args__ = (
+        db.Index('ix_collections_created_at_id', 'created_at', 'id'),
+        db.Index('ix_collections_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
+
     def __repr__(self):
         return f"<Collection {self.name}>"
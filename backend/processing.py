@@ -0,0 +1,286 @@
+import hashlib
+import mimetypes
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, update
+
+from cache import bump_versions
+from models import db, FileJob
+from search import index_file_text
+from storage import CHUNK_SIZE, blob_store, upload_root
+
+# Post-upload pipeline. Upload handlers only make the bytes durable and add a
+# pending FileJob row in the same transaction as the File; after commit the
+# job id is handed to an in-process thread pool. A job verifies the stored
+# checksum and size, sniffs the MIME type, extracts text into the search
+# index and writes a preview. The CPU-bound analyze() step can run in a
+# process pool instead (PROCESSING_EXECUTOR=process) to use every core.
+#
+# The job table makes the queue durable: jobs left pending or running by a
+# crashed worker are picked up again when a process starts its pool, and
+# `flask process-files` drains them without a web process.
+
+# Leading bytes of common binary formats
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'\x1f\x8b', 'application/gzip'),
+)
+
+TEXT_TYPES = ('application/json', 'application/xml', 'application/javascript', 'application/csv')
+PREVIEW_SIZE = (256, 256)
+PREVIEW_TEXT_CHARS = 2000
+# Leading bytes sniff_mime looks at
+HEAD_BYTES = 8192
+
+
+def sniff_mime(head, filename):
+    for magic, mime in SIGNATURES:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    guessed, _ = mimetypes.guess_type(filename)
+    if guessed and guessed != 'application/octet-stream':
+        return guessed
+    if b'\x00' not in head:
+        try:
+            head.decode('utf-8')
+            return 'text/plain'
+        except UnicodeDecodeError:
+            pass
+    return 'application/octet-stream'
+
+
+def sniff_stream(stream, filename):
+    """MIME type of a seekable stream from its first bytes; the position is left unchanged."""
+    position = stream.tell()
+    head = stream.read(HEAD_BYTES)
+    stream.seek(position)
+    return sniff_mime(head, filename)
+
+
+def is_text(mime):
+    return mime.startswith('text/') or mime in TEXT_TYPES
+
+
+def _image_preview(path, preview_path):
+    try:
+        from PIL import Image
+    except ImportError:
+        # Image thumbnails need the optional Pillow package
+        return None
+    with Image.open(path) as image:
+        image.thumbnail(PREVIEW_SIZE)
+        image.save(preview_path + '.png', 'PNG')
+    return preview_path + '.png'
+
+
+def analyze(path, filename, expected_sha256, preview_base, max_text_bytes):
+    """Inspect one stored file; runs without an app context so it can run in a subprocess."""
+    hasher = hashlib.sha256()
+    size = 0
+    head = b''
+    with open(path, 'rb') as src:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if not head:
+                head = chunk[:HEAD_BYTES]
+            hasher.update(chunk)
+            size += len(chunk)
+    if expected_sha256 and hasher.hexdigest() != expected_sha256:
+        raise ValueError("stored bytes do not match their checksum")
+
+    mime = sniff_mime(head, filename)
+    text = None
+    preview = None
+    os.makedirs(os.path.dirname(preview_base), exist_ok=True)
+    if is_text(mime):
+        with open(path, 'rb') as src:
+            text = src.read(max_text_bytes).decode('utf-8', errors='replace').replace('\x00', '')
+        preview = preview_base + '.txt'
+        with open(preview, 'w', encoding='utf-8') as out:
+            out.write(text[:PREVIEW_TEXT_CHARS])
+    elif mime.startswith('image/'):
+        preview = _image_preview(path, preview_base)
+    return {'size_bytes': size, 'mime_type': mime, 'text': text, 'preview_path': preview}
+
+
+def preview_root():
+    return os.path.join(upload_root(), 'previews')
+
+
+def _claimable(timeout):
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+    return (FileJob.status == 'pending') | ((FileJob.status == 'running') & (FileJob.updated_at < cutoff))
+
+
+def run_job(file_id):
+    """Process one job inside an app context; failures are recorded on the job.
+
+    Returns the attempts made so far when a failed job was put back to
+    pending for another try, otherwise None.
+    """
+    app = current_app._get_current_object()
+    # Claim atomically so two workers recovering the same backlog never both run it
+    claimed = db.session.execute(
+        update(FileJob)
+        .where(FileJob.file_id == file_id, _claimable(app.config['PROCESSING_STALE_SECONDS']))
+        .values(status='running', attempts=FileJob.attempts + 1, updated_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return None
+    job = db.session.get(FileJob, file_id)
+    # The file (and with it the job) may have been deleted since the claim
+    f = job.file if job is not None else None
+    if f is None:
+        return None
+
+    try:
+        # Remote stores are copied to a temp file for the duration
+        with blob_store().local_copy(f.path) as path:
+            args = (path, f.filename, f.blob_sha256, os.path.join(preview_root(), str(f.id)),
+                    app.config['PROCESSING_MAX_TEXT_BYTES'])
+            pool = _process_pool(app)
+            result = pool.submit(analyze, *args).result() if pool is not None else analyze(*args)
+    except Exception as exc:
+        db.session.rollback()
+        job = db.session.get(FileJob, file_id)
+        if job is None:
+            return None
+        job.error = f"{exc.__class__.__name__}: {exc}"
+        job.status = 'failed' if job.attempts >= app.config['PROCESSING_MAX_ATTEMPTS'] else 'pending'
+        db.session.commit()
+        app.logger.warning("processing file %s failed: %s", file_id, job.error)
+        return job.attempts if job.status == 'pending' else None
+
+    f.size_bytes = result['size_bytes']
+    f.mime_type = result['mime_type']
+    job.extracted_text = result['text']
+    job.preview_path = result['preview_path']
+    job.status = 'done'
+    job.error = None
+    db.session.flush()
+    if result['text']:
+        index_file_text(db.session, file_id)
+    bump_versions('files')
+    db.session.commit()
+    return None
+
+
+def stale_job_ids(timeout):
+    """Pending jobs plus running ones whose worker has gone quiet."""
+    return list(db.session.scalars(
+        select(FileJob.file_id).where(_claimable(timeout)).order_by(FileJob.file_id)
+    ))
+
+
+class JobRunner:
+    """Per-process pool of job threads, created on first use (after any fork)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _threads(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config['PROCESSING_WORKERS'], thread_name_prefix='file-jobs',
+                )
+                self._pid = os.getpid()
+                # Resume whatever a previous process left behind
+                self._executor.submit(self._recover)
+            return self._executor
+
+    def _run(self, file_id):
+        with self.app.app_context():
+            try:
+                attempts = run_job(file_id)
+            except Exception:
+                self.app.logger.exception("processing file %s crashed", file_id)
+                return
+        if attempts:
+            self._retry_later(file_id, attempts)
+
+    def _retry_later(self, file_id, attempts):
+        # Exponential backoff; a job whose timer dies with the process is
+        # still pending and is picked up by the next process's recovery
+        delay = self.app.config['PROCESSING_RETRY_DELAY'] * 2 ** (attempts - 1)
+        timer = threading.Timer(delay, self.submit, (file_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _recover(self):
+        with self.app.app_context():
+            file_ids = stale_job_ids(self.app.config['PROCESSING_STALE_SECONDS'])
+        for file_id in file_ids:
+            self._executor.submit(self._run, file_id)
+
+    def submit(self, file_id):
+        self._threads().submit(self._run, file_id)
+
+
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+
+def _process_pool(app):
+    if app.config['PROCESSING_EXECUTOR'] != 'process':
+        return None
+    pid = os.getpid()
+    pool = _process_pools.get(pid)
+    if pool is None:
+        with _process_pools_lock:
+            pool = _process_pools.get(pid)
+            if pool is None:
+                # spawn, not fork: the parent is a threaded web worker
+                pool = _process_pools[pid] = ProcessPoolExecutor(
+                    max_workers=app.config['PROCESSING_WORKERS'], mp_context=multiprocessing.get_context('spawn'),
+                )
+    return pool
+
+
+def add_job(file_record):
+    """Queue processing for a stored file; committed with the file itself."""
+    if file_record.path:
+        file_record.job = FileJob(status='pending')
+
+
+def submit_job(file_record):
+    """Start a committed job, unless jobs are left to `flask process-files`."""
+    runner = current_app.extensions.get('file_jobs')
+    if runner is not None and file_record.path:
+        runner.submit(file_record.id)
+
+
+@click.command('process-files')
+@with_appcontext
+def process_files_command():
+    """Run every pending (or stale) post-upload job in this process."""
+    file_ids = stale_job_ids(current_app.config['PROCESSING_STALE_SECONDS'])
+    for file_id in file_ids:
+        run_job(file_id)
+    click.echo(f"processed {len(file_ids)} file(s)")
+
+
+def init_processing(app):
+    app.cli.add_command(process_files_command)
+    if app.config['PROCESSING_EXECUTOR'] in ('thread', 'process'):
+        app.extensions['file_jobs'] = JobRunner(app)
@@ -0,0 +1,93 @@
+import heapq
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request SQL accounting. Cursor events on every engine add to a
+# QueryStats object on flask.g; the response reports it in a Server-Timing
+# header, and statements slower than SLOW_QUERY_MS are logged with the
+# request they ran in.
+
+
+class QueryStats:
+    def __init__(self, keep=5):
+        self.count = 0
+        self.total = 0.0
+        self.keep = keep
+        self.slowest = []  # min-heap of (seconds, statement)
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.total += seconds
+        entry = (seconds, statement)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def top(self):
+        return sorted(self.slowest, reverse=True)
+
+
+# The start time lives on the execution context, not the connection: the
+# after hook never runs for a statement that raises, and a per-connection
+# stack would then hand later statements the wrong start time
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_start', None)
+    if started is None or not has_request_context():
+        return
+    stats = g.get('query_stats')
+    if stats is None:
+        return
+    seconds = time.perf_counter() - started
+    stats.record(statement, seconds)
+    if seconds * 1000 >= g.slow_query_ms:
+        g.slow_queries.append((seconds, statement))
+
+
+def _start_request():
+    g.query_stats = QueryStats()
+    g.request_started = time.perf_counter()
+    g.slow_query_ms = current_app.config['SLOW_QUERY_MS']
+    g.slow_queries = []
+
+
+def _finish_request(response):
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+    elapsed = (time.perf_counter() - g.request_started) * 1000
+    if current_app.config['SERVER_TIMING']:
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={stats.total * 1000:.1f};desc="{stats.count} queries", app;dur={elapsed:.1f}',
+        )
+    for seconds, statement in g.slow_queries:
+        current_app.logger.warning(
+            "slow query %.1fms in %s %s: %s",
+            seconds * 1000, request.method, request.path, ' '.join(statement.split())[:1000],
+        )
+    return response
+
+
+_listening = False
+
+
+def init_query_stats(app):
+    global _listening
+    if not app.config['QUERY_STATS_ENABLED']:
+        return
+    if not _listening:
+        # Registered on the Engine class so replica engines are covered too
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
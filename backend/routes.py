@@ -1,18 +1,65 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, send_file
 from werkzeug.utils import secure_filename
-from models import db, User, File, Tag, Collection, FileTag
-from schemas import ma, UserSchema, FileSchema, TagSchema, CollectionSchema
+from models import db, User, File, Tag, Collection, FileJob, UploadSession, collection_files
+from sqlalchemy import text
+from sqlalchemy.orm import load_only, selectinload, undefer
+from schemas import cached_schema
+from pagination import InvalidCursor, keyset_page, page_limit
+from tagging import normalize_tag_names, resolve_tags, set_file_tags
+from storage import acquire_blob, blob_store, upload_root
+from uploads import (
+    ChunkSizeMismatch, discard_session, expire_sessions, open_session, part_path,
+    received_chunks, write_chunk,
+)
+from ingest import ingest_ndjson
+from search import search_file_ids
+from facets import UnknownTags, filter_files, tag_facets
+from suggest import MAX_SUGGESTIONS, suggest_tags
+from cache import bump_versions, cached_view
+from serializers import (
+    FILE_TAGS, InvalidFields, collection_to_dict, file_load_options, file_serializer,
+    files_to_dicts, parse_fields,
+)
+from streaming import STREAM_FORMATS, stream_query
+from membership import InvalidFileIds, add_members, parse_file_ids, remove_members, replace_members
+from metrics import observe_upload, render as render_metrics
+from database import read_primary
+from processing import add_job, sniff_stream, submit_job
+from summaries import user_summary
+from archive import archive_size, collection_entries, stream_zip
+from cleanup import delete_files, request_sweep
+from changes import RESOURCES, ExpiredCursor, changes_since, head_cursor
+from usage import MULTIPART_OVERHEAD, QuotaExceeded, check_quota
+from datetime import datetime
+from functools import partial
+import io
 import os
+import time
 
 bp = Blueprint('api', __name__)
 
-# Initialize Marshmallow with app context later in app factory
 
+@bp.errorhandler(InvalidFields)
+def invalid_fields(exc):
+    return jsonify({"error": f"unknown fields: {', '.join(exc.args[0])}"}), 400
 
-@bp.record
-def record_params(setup_state):
-    app = setup_state.app
-    ma.init_app(app)
+
+@bp.errorhandler(QuotaExceeded)
+def quota_exceeded(exc):
+    # Raised before anything is stored, or after the file row was flushed
+    db.session.rollback()
+    return jsonify({
+        "error": "storage quota exceeded",
+        "quota_bytes": exc.quota_bytes,
+        "used_bytes": exc.used_bytes,
+    }), 413
+
+
+# Liveness/readiness probe for the load balancer; one trivial query
+@bp.get('/health')
+def health():
+    db.session.execute(text('SELECT 1'))
+    return jsonify({"status": "ok"}), 200
 
 
 # Auth endpoints (simple MVP, not secure for production)
@@ -30,7 +77,7 @@ def register():
     user = User(username=username, password=password)
     db.session.add(user)
     db.session.commit()
-    return UserSchema().jsonify(user), 201
+    return cached_schema('UserSchema').jsonify(user), 201
 
 
 @bp.post('/login')
@@ -41,20 +88,87 @@ def login():
     user = User.query.filter_by(username=username, password=password).first()
     if not user:
         return jsonify({"error": "invalid credentials"}), 401
-    return UserSchema().jsonify(user), 200
+    return cached_schema('UserSchema').jsonify(user), 200
 
 
 # Basic reads for Users and Tags; create Tag
 @bp.get('/users')
 def list_users():
     users = User.query.order_by(User.created_at.asc()).all()
-    return UserSchema(many=True).jsonify(users), 200
+    return cached_schema('UserSchema', many=True).jsonify(users), 200
+
+
+@bp.get('/users/<int:user_id>')
+def get_user(user_id):
+    user = User.query.get_or_404(user_id)
+    return cached_schema('UserSchema').jsonify(user), 200
+
+
+@bp.get('/users/<int:user_id>/summary')
+@cached_view('files', 'collections')
+def get_user_summary(user_id):
+    user = User.query.get_or_404(user_id)
+    return jsonify(user_summary(user)), 200
+
+
+@bp.get('/users/<int:user_id>/files')
+@cached_view('files', 'tags')
+def list_user_files(user_id):
+    User.query.get_or_404(user_id)
+    fields = parse_fields(request.args.get('fields'))
+    query = filter_files(File.query.options(*file_load_options(fields)), user_id=user_id)
+    try:
+        files, next_cursor = keyset_page(query, File, page_limit(), request.args.get('cursor'))
+    except InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+    return jsonify({
+        "items": files_to_dicts(files, fields),
+        "next_cursor": next_cursor,
+    }), 200
+
+
+@bp.get('/users/<int:user_id>/collections')
+@cached_view('collections', 'files')
+def list_user_collections(user_id):
+    User.query.get_or_404(user_id)
+    query = Collection.query.options(undefer(Collection.file_count)).filter(Collection.user_id == user_id)
+    try:
+        collections, next_cursor = keyset_page(query, Collection, page_limit(), request.args.get('cursor'))
+    except InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+    return jsonify({
+        "items": [collection_to_dict(col) for col in collections],
+        "next_cursor": next_cursor,
+    }), 200
 
 
 @bp.get('/tags')
+@cached_view('tags')
 def list_tags():
     tags = Tag.query.order_by(Tag.name.asc()).all()
-    return TagSchema(many=True).jsonify(tags), 200
+    return cached_schema('TagSchema', many=True).jsonify(tags), 200
+
+
+@bp.get('/tags/suggest')
+def suggest_tag_names():
+    # Typeahead: tags starting with ?prefix= (any case), most used first.
+    # Served from the in-process index, so it skips the response cache.
+    prefix = (request.args.get('prefix') or '').strip().lower()
+    limit = max(1, min(request.args.get('limit', 10, type=int), MAX_SUGGESTIONS))
+    return jsonify(suggest_tags(prefix, limit)), 200
+
+
+@bp.get('/tags/facets')
+@cached_view('files', 'tags')
+def list_tag_facets():
+    # Per-tag file counts for the same filter GET /api/files accepts
+    filters = file_filters()
+    if filters is None:
+        return jsonify({"error": "match must be 'all' or 'any'"}), 400
+    facets = tag_facets(limit=page_limit(), **filters)
+    return jsonify([
+        {"id": tag.id, "name": tag.name, "count": count} for tag, count in facets
+    ]), 200
 
 
 @bp.post('/tags')
@@ -63,29 +177,83 @@ def create_tag():
     name = (data.get('name') or '').strip()
     if not name:
         return jsonify({"error": "name is required"}), 400
-    existing = Tag.query.filter_by(name=name).first()
-    if existing:
-        return TagSchema().jsonify(existing), 200
-    tag = Tag(name=name)
-    db.session.add(tag)
+    tags, created = resolve_tags([name])
+    bump_versions('tags')
     db.session.commit()
-    return TagSchema().jsonify(tag), 201
+    return cached_schema('TagSchema').jsonify(tags[name]), 201 if name in created else 200
+
+
+def file_filters():
+    """?tags=a,b&match=all|any&user_id= as filter_files kwargs, or None if invalid."""
+    match = request.args.get('match', 'all')
+    if match not in ('all', 'any'):
+        return None
+    return {
+        'tag_names': normalize_tag_names((request.args.get('tags') or '').split(',')),
+        'match': match,
+        'user_id': request.args.get('user_id', type=int),
+    }
+
+
+def load_file_with_tags(file_id):
+    return File.query.options(FILE_TAGS).populate_existing().filter_by(id=file_id).first_or_404()
 
 
 # Files CRUD
 @bp.get('/files')
+@cached_view('files', 'tags')
 def list_files():
-    files = File.query.order_by(File.created_at.desc()).all()
-    return FileSchema(many=True).jsonify(files), 200
+    if request.args.get('stream') == '1':
+        return export_files()
+    filters = file_filters()
+    if filters is None:
+        return jsonify({"error": "match must be 'all' or 'any'"}), 400
+    fields = parse_fields(request.args.get('fields'))
+    try:
+        query = filter_files(File.query.options(*file_load_options(fields)), **filters)
+        files, next_cursor = keyset_page(query, File, page_limit(), request.args.get('cursor'))
+    except UnknownTags:
+        files, next_cursor = [], None
+    except InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+    return jsonify({
+        "items": files_to_dicts(files, fields),
+        "next_cursor": next_cursor,
+    }), 200
+
+
+@bp.get('/files/export')
+def export_files():
+    # Whole (filtered) table as a streamed JSON array or NDJSON (?format=ndjson)
+    fmt = request.args.get('format', 'json')
+    if fmt not in STREAM_FORMATS:
+        return jsonify({"error": "format must be 'json' or 'ndjson'"}), 400
+    filters = file_filters()
+    if filters is None:
+        return jsonify({"error": "match must be 'all' or 'any'"}), 400
+    fields = parse_fields(request.args.get('fields'))
+    try:
+        query = filter_files(File.query.options(*file_load_options(fields)), **filters)
+    except UnknownTags:
+        query = File.query.filter(False)
+    query = query.order_by(File.created_at.desc(), File.id.desc())
+    return stream_query(query, file_serializer(fields), fmt)
 
 
 @bp.post('/files')
 def create_file():
+    # Uploads are refused on their Content-Length alone; passing ?user_id=
+    # lets that happen before the multipart body is read at all
+    upload_bytes = max((request.content_length or 0) - MULTIPART_OVERHEAD, 0)
+    early_user_id = request.args.get('user_id', type=int)
+    if request.mimetype == 'multipart/form-data' and early_user_id is not None:
+        check_quota(early_user_id, upload_bytes)
+
     # Support multipart form for upload or JSON for metadata-only
-    user_id = request.form.get('user_id') or (request.json or {}).get('user_id')
-    description = request.form.get('description') or (request.json or {}).get('description')
-    tags = request.form.get('tags')  # comma-separated string for MVP
     json_payload = request.get_json(silent=True) or {}
+    user_id = request.form.get('user_id') or json_payload.get('user_id') or early_user_id
+    description = request.form.get('description') or json_payload.get('description')
+    tags = request.form.get('tags')  # comma-separated string for MVP
     tags_list = json_payload.get('tags') if isinstance(json_payload, dict) else None  # optional list[str]
     tags_with_meta = json_payload.get('tags_with_meta') if isinstance(json_payload, dict) else None  # optional list[obj]
 
@@ -95,18 +263,23 @@ def create_file():
     file_record = File(filename="", user_id=int(user_id), description=description)
 
     # Handle file upload if present
-    upload_folder = os.path.join(current_app.instance_path, 'uploads')
-    os.makedirs(upload_folder, exist_ok=True)
-
     uploaded = None
     if 'file' in request.files:
         uploaded = request.files['file']
         if uploaded.filename:
-            filename = secure_filename(uploaded.filename)
-            save_path = os.path.join(upload_folder, filename)
-            uploaded.save(save_path)
-            file_record.filename = filename
+            if early_user_id is None:
+                check_quota(file_record.user_id, upload_bytes)
+            # Stored by content hash, so equal names never overwrite and
+            # equal bytes are kept once
+            file_record.filename = secure_filename(uploaded.filename)
+            file_record.mime_type = sniff_stream(uploaded.stream, file_record.filename)
+            started = time.perf_counter()
+            digest, size, save_path = blob_store().put_stream(uploaded.stream)
+            observe_upload('file', size, time.perf_counter() - started)
+            acquire_blob(digest, size)
             file_record.path = save_path
+            file_record.blob_sha256 = digest
+            file_record.size_bytes = size
             file_record.url = None
     else:
         # JSON payload with filename only
@@ -119,40 +292,154 @@ def create_file():
     # Tags handling
     # Preferred: tags_with_meta overrides others
     if tags_with_meta and isinstance(tags_with_meta, list):
-        for item in tags_with_meta:
-            if not isinstance(item, dict):
-                continue
-            name = (item.get('name') or '').strip()
-            if not name:
-                continue
-            added_by = item.get('added_by')
-            tag = Tag.query.filter_by(name=name).first()
-            if not tag:
-                tag = Tag(name=name)
-            file_record.tag_links.append(FileTag(tag=tag, added_by=added_by))
+        set_file_tags(file_record, tags_with_meta=tags_with_meta)
     else:
         # Fallbacks: list of tag names or comma string
         names = []
         if isinstance(tags_list, list):
-            names.extend([str(x).strip() for x in tags_list if str(x).strip()])
+            names.extend(tags_list)
         if tags:
-            names.extend([t.strip() for t in tags.split(',') if t.strip()])
-        for name in names:
-            tag = Tag.query.filter_by(name=name).first()
-            if not tag:
-                tag = Tag(name=name)
-            file_record.tags.append(tag)
+            names.extend(tags.split(','))
+        set_file_tags(file_record, names=names)
 
+    add_job(file_record)
     db.session.add(file_record)
+    if file_record.size_bytes:
+        # The usage triggers have counted the exact size once the row is flushed
+        db.session.flush()
+        check_quota(file_record.user_id, file_record.size_bytes, counted=True)
+    bump_versions('files', 'tags')
     db.session.commit()
-
-    return FileSchema().jsonify(file_record), 201
+    submit_job(file_record)
+
+    return cached_schema('FileSchema').jsonify(load_file_with_tags(file_record.id)), 201
+
+
+@bp.post('/files/bulk')
+def bulk_create_files():
+    # One NDJSON record per line: {"filename", "user_id", "description"?, "url"?, "tags"?|"tags_with_meta"?}
+    config = current_app.config
+    batch_size = request.args.get('batch_size', config['BULK_INGEST_BATCH_SIZE'], type=int)
+    batch_size = max(1, min(batch_size, config['BULK_INGEST_MAX_BATCH_SIZE']))
+    report = ingest_ndjson(io.BufferedReader(request.stream), batch_size)
+    status = 201 if report["inserted"] else 400
+    return jsonify(report), status
+
+
+@bp.post('/files/bulk-delete')
+def bulk_delete_files():
+    # Body: {"file_ids": [...], "user_id": n, "tags": [...], "match": "all"|"any"};
+    # the filters given are combined, and at least one is required
+    data = request.get_json(silent=True) or {}
+    query = File.query
+    if 'file_ids' in data:
+        try:
+            file_ids = parse_file_ids(data['file_ids'])
+        except InvalidFileIds as exc:
+            return jsonify({"error": str(exc)}), 400
+        query = query.filter(File.id.in_(file_ids))
+    user_id = data.get('user_id')
+    if user_id is not None and (isinstance(user_id, bool) or not isinstance(user_id, int)):
+        return jsonify({"error": "user_id must be an integer"}), 400
+    tag_names = normalize_tag_names(data.get('tags') if isinstance(data.get('tags'), list) else [])
+    match = data.get('match', 'all')
+    if match not in ('all', 'any'):
+        return jsonify({"error": "match must be 'all' or 'any'"}), 400
+    if 'file_ids' not in data and user_id is None and not tag_names:
+        return jsonify({"error": "file_ids, user_id or tags is required"}), 400
+    try:
+        query = filter_files(query, tag_names, match, user_id)
+    except UnknownTags:
+        return jsonify({"deleted": 0}), 200
+    deleted = delete_files(query, current_app.config['FILE_DELETE_BATCH_SIZE'])
+    if deleted:
+        # Reclaim the blobs off the request path
+        request_sweep()
+    return jsonify({"deleted": deleted}), 200
 
 
 @bp.get('/files/<int:file_id>')
 def get_file(file_id):
+    fields = parse_fields(request.args.get('fields'))
+    f = File.query.options(*file_load_options(fields)).filter_by(id=file_id).first_or_404()
+    return cached_schema('FileSchema', only=fields).jsonify(f), 200
+
+
+@bp.get('/files/<int:file_id>/content')
+def download_file(file_id):
+    f = File.query.get_or_404(file_id)
+    store = blob_store()
+    info = store.stat(f.path) if f.path else None
+    if info is None:
+        return jsonify({"error": "file has no stored content"}), 404
+    as_attachment = request.args.get('download') == '1'
+    # Blob digests are content hashes, so they make exact strong ETags
+    etag = f.blob_sha256 or True
+
+    local_path = store.local_path(f.path)
+    if local_path is None:
+        # Remote store: a lazily fetched, seekable reader, so a Range
+        # request turns into one ranged read from the store
+        response = send_file(
+            store.open(f.path, info.size),
+            download_name=f.filename,
+            as_attachment=as_attachment,
+            etag=etag,
+            last_modified=info.mtime,
+            conditional=False,
+        )
+        response.content_length = info.size
+        return response.make_conditional(request, accept_ranges=True, complete_length=info.size)
+
+    # send_file handles Range, If-None-Match and If-Modified-Since, hands
+    # the file to the server's wsgi.file_wrapper (sendfile under gunicorn)
+    # and honours USE_X_SENDFILE
+    accel_prefix = current_app.config['X_ACCEL_REDIRECT_PREFIX']
+    response = send_file(
+        local_path,
+        download_name=f.filename,
+        as_attachment=as_attachment,
+        etag=etag,
+        conditional=not accel_prefix,
+    )
+    if accel_prefix:
+        # nginx serves the bytes (and Range) from an internal location; keep
+        # the headers send_file computed but drop the body
+        response.close()
+        response.response = []
+        response.headers.pop('Content-Length', None)
+        rel_path = os.path.relpath(local_path, store.root).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + rel_path
+        response = response.make_conditional(request)
+    return response
+
+
+@bp.get('/files/<int:file_id>/status')
+@read_primary
+def file_status(file_id):
     f = File.query.get_or_404(file_id)
-    return FileSchema().jsonify(f), 200
+    job = f.job
+    if job is None:
+        # Metadata-only files have nothing to process
+        return jsonify({"file_id": f.id, "status": "none"}), 200
+    return jsonify({
+        "file_id": f.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "size_bytes": f.size_bytes,
+        "mime_type": f.mime_type,
+        "has_preview": bool(job.preview_path),
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }), 200
+
+
+@bp.get('/files/<int:file_id>/preview')
+def file_preview(file_id):
+    job = FileJob.query.get_or_404(file_id)
+    if not job.preview_path or not os.path.isfile(job.preview_path):
+        return jsonify({"error": "no preview available"}), 404
+    return send_file(job.preview_path, conditional=True)
 
 
 @bp.patch('/files/<int:file_id>')
@@ -165,42 +452,195 @@ def update_file(file_id):
         f.description = data['description']
     # tags_with_meta takes precedence if provided
     if 'tags_with_meta' in data and isinstance(data['tags_with_meta'], list):
-        f.tag_links.clear()
-        for item in data['tags_with_meta']:
-            if not isinstance(item, dict):
-                continue
-            name = (item.get('name') or '').strip()
-            if not name:
-                continue
-            added_by = item.get('added_by')
-            tag = Tag.query.filter_by(name=name).first()
-            if not tag:
-                tag = Tag(name=name)
-            f.tag_links.append(FileTag(tag=tag, added_by=added_by))
+        set_file_tags(f, tags_with_meta=data['tags_with_meta'])
     elif 'tags' in data and isinstance(data['tags'], list):
-        f.tags.clear()
-        for name in data['tags']:
-            tag = Tag.query.filter_by(name=name).first()
-            if not tag:
-                tag = Tag(name=name)
-            f.tags.append(tag)
+        set_file_tags(f, names=data['tags'])
+    bump_versions('files', 'tags')
     db.session.commit()
-    return FileSchema().jsonify(f), 200
+    return cached_schema('FileSchema').jsonify(load_file_with_tags(file_id)), 200
 
 
 @bp.delete('/files/<int:file_id>')
 def delete_file(file_id):
-    f = File.query.get_or_404(file_id)
-    db.session.delete(f)
+    File.query.with_entities(File.id).filter_by(id=file_id).first_or_404()
+    delete_files(File.query.filter(File.id == file_id))
+    request_sweep()
+    return jsonify({"message": "deleted"}), 204
+
+
+# Resumable upload sessions: create, PUT chunks in any order, then complete
+def upload_session_payload(session):
+    payload = cached_schema('UploadSessionSchema').dump(session)
+    payload['received'] = received_chunks(session)
+    return payload
+
+
+def live_upload_session(session_id):
+    """Session by id, or None once it has expired (its files are dropped)."""
+    session = UploadSession.query.get_or_404(session_id)
+    if session.expires_at < datetime.utcnow():
+        discard_session(upload_root(), session)
+        db.session.commit()
+        return None
+    return session
+
+
+@bp.post('/uploads')
+def create_upload():
+    data = request.get_json() or {}
+    user_id = data.get('user_id')
+    filename = secure_filename(data.get('filename') or '')
+    size_bytes = data.get('size')
+    if not user_id or not filename:
+        return jsonify({"error": "user_id and filename are required"}), 400
+    if not isinstance(size_bytes, int) or size_bytes < 0:
+        return jsonify({"error": "size must be a non-negative integer"}), 400
+    check_quota(int(user_id), size_bytes)
+
+    tags = data.get('tags')
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    root = upload_root()
+    expire_sessions(root)
+    session = open_session(
+        root, int(user_id), filename, size_bytes,
+        chunk_size=data.get('chunk_size'),
+        description=data.get('description'),
+        tags=normalize_tag_names(tags) if isinstance(tags, list) else None,
+    )
+    db.session.commit()
+    return jsonify(upload_session_payload(session)), 201
+
+
+@bp.get('/uploads/<session_id>')
+@read_primary
+def get_upload(session_id):
+    session = live_upload_session(session_id)
+    if session is None:
+        return jsonify({"error": "upload session expired"}), 410
+    return jsonify(upload_session_payload(session)), 200
+
+
+@bp.put('/uploads/<session_id>/chunks/<int:index>')
+def put_upload_chunk(session_id, index):
+    session = live_upload_session(session_id)
+    if session is None:
+        return jsonify({"error": "upload session expired"}), 410
+    if index >= session.total_chunks:
+        return jsonify({"error": "chunk index out of range"}), 400
+    expected = session.chunk_length(index)
+    # Reject a wrong-sized chunk before reading its body when we can
+    if request.content_length is not None and request.content_length != expected:
+        return jsonify({"error": f"chunk {index} must be {expected} bytes"}), 400
+    started = time.perf_counter()
+    try:
+        write_chunk(upload_root(), session, index, request.stream)
+    except ChunkSizeMismatch:
+        return jsonify({"error": f"chunk {index} must be {expected} bytes"}), 400
+    observe_upload('chunk', expected, time.perf_counter() - started)
+    db.session.commit()
+    return jsonify({"chunk_index": index}), 200
+
+
+@bp.post('/uploads/<session_id>/complete')
+def complete_upload(session_id):
+    session = live_upload_session(session_id)
+    if session is None:
+        return jsonify({"error": "upload session expired"}), 410
+    received = set(received_chunks(session))
+    missing = [i for i in range(session.total_chunks) if i not in received]
+    if missing:
+        return jsonify({"error": "upload incomplete", "missing": missing}), 409
+
+    # Checked again: other uploads may have used up the quota meanwhile, and
+    # the session is kept so the client can retry after freeing space
+    check_quota(session.user_id, session.size_bytes)
+    root = upload_root()
+    with open(part_path(root, session.id), 'rb') as src:
+        mime_type = sniff_stream(src, session.filename)
+    digest, size, path = blob_store().put_file(part_path(root, session.id))
+    acquire_blob(digest, size)
+    file_record = File(
+        filename=session.filename,
+        user_id=session.user_id,
+        description=session.description,
+        path=path,
+        blob_sha256=digest,
+        size_bytes=size,
+        mime_type=mime_type,
+    )
+    set_file_tags(file_record, names=session.tags)
+    add_job(file_record)
+    db.session.add(file_record)
+    if size:
+        db.session.flush()
+        check_quota(file_record.user_id, file_record.size_bytes, counted=True)
+    discard_session(root, session)
+    bump_versions('files', 'tags')
+    db.session.commit()
+    submit_job(file_record)
+    return cached_schema('FileSchema').jsonify(load_file_with_tags(file_record.id)), 201
+
+
+@bp.delete('/uploads/<session_id>')
+def abort_upload(session_id):
+    session = UploadSession.query.get_or_404(session_id)
+    discard_session(upload_root(), session)
     db.session.commit()
     return jsonify({"message": "deleted"}), 204
 
 
+# Full-text search over filename, description and tag names
+@bp.get('/search')
+@cached_view('files', 'tags')
+def search_files():
+    q = request.args.get('q', '')
+    fields = parse_fields(request.args.get('fields'))
+    limit = page_limit()
+    offset = max(0, request.args.get('offset', 0, type=int))
+    # One extra id tells us whether there is a next page
+    ids = search_file_ids(db.session, q, limit + 1, offset)
+    next_offset = offset + limit if len(ids) > limit else None
+    ids = ids[:limit]
+    query = File.query.options(*file_load_options(fields)).filter(File.id.in_(ids))
+    by_id = {f.id: f for f in query} if ids else {}
+    files = [by_id[i] for i in ids if i in by_id]
+    return jsonify({
+        "items": files_to_dicts(files, fields),
+        "next_offset": next_offset,
+    }), 200
+
+
 # Collections GET/POST
 @bp.get('/collections')
+@cached_view('collections', 'files')
 def list_collections():
-    collections = Collection.query.order_by(Collection.created_at.desc()).all()
-    return CollectionSchema(many=True).jsonify(collections), 200
+    if request.args.get('stream') == '1':
+        return export_collections()
+    # Member counts come from a correlated COUNT; the members themselves are
+    # paged through /collections/<id>/files
+    query = Collection.query.options(undefer(Collection.file_count))
+    try:
+        collections, next_cursor = keyset_page(query, Collection, page_limit(), request.args.get('cursor'))
+    except InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+    return jsonify({
+        "items": [collection_to_dict(col) for col in collections],
+        "next_cursor": next_cursor,
+    }), 200
+
+
+@bp.get('/collections/export')
+def export_collections():
+    fmt = request.args.get('format', 'json')
+    if fmt not in STREAM_FORMATS:
+        return jsonify({"error": "format must be 'json' or 'ndjson'"}), 400
+    query = (
+        Collection.query
+        .options(selectinload(Collection.files).options(load_only(File.id, File.filename)))
+        .order_by(Collection.created_at.desc(), Collection.id.desc())
+    )
+    return stream_query(query, partial(collection_to_dict, with_files=True), fmt)
 
 
 @bp.post('/collections')
@@ -208,26 +648,28 @@ def create_collection():
     data = request.get_json() or {}
     name = data.get('name')
     user_id = data.get('user_id')
-    file_ids = data.get('file_ids', [])
 
     if not name or not user_id:
         return jsonify({"error": "name and user_id are required"}), 400
+    try:
+        file_ids = parse_file_ids(data.get('file_ids', []))
+    except InvalidFileIds as exc:
+        return jsonify({"error": str(exc)}), 400
 
     col = Collection(name=name, user_id=int(user_id))
-    if file_ids:
-        files = File.query.filter(File.id.in_(file_ids)).all()
-        col.files.extend(files)
-
     db.session.add(col)
+    db.session.flush()
+    add_members(col.id, file_ids)
+    bump_versions('collections')
     db.session.commit()
 
-    return CollectionSchema().jsonify(col), 201
+    return cached_schema('CollectionSchema').jsonify(col), 201
 
 
 @bp.get('/collections/<int:collection_id>')
 def get_collection(collection_id):
-    col = Collection.query.get_or_404(collection_id)
-    return CollectionSchema().jsonify(col), 200
+    col = Collection.query.options(undefer(Collection.file_count)).get_or_404(collection_id)
+    return cached_schema('CollectionSchema').jsonify(col), 200
 
 
 @bp.patch('/collections/<int:collection_id>')
@@ -236,19 +678,118 @@ def update_collection(collection_id):
     data = request.get_json() or {}
     if 'name' in data:
         col.name = data['name']
-    if 'file_ids' in data and isinstance(data['file_ids'], list):
-        # Replace collection files with provided list
-        col.files.clear()
-        if data['file_ids']:
-            files = File.query.filter(File.id.in_(data['file_ids'])).all()
-            col.files.extend(files)
+    if 'file_ids' in data:
+        # Full replacement; only the difference from the current set is written
+        try:
+            replace_members(col.id, parse_file_ids(data['file_ids']))
+        except InvalidFileIds as exc:
+            return jsonify({"error": str(exc)}), 400
+    bump_versions('collections')
     db.session.commit()
-    return CollectionSchema().jsonify(col), 200
+    return cached_schema('CollectionSchema').jsonify(col), 200
+
+
+@bp.get('/collections/<int:collection_id>/files')
+@cached_view('collections', 'files', 'tags')
+def list_collection_files(collection_id):
+    Collection.query.get_or_404(collection_id)
+    fields = parse_fields(request.args.get('fields'))
+    query = (
+        File.query.options(*file_load_options(fields))
+        .join(collection_files, collection_files.c.file_id == File.id)
+        .filter(collection_files.c.collection_id == collection_id)
+    )
+    try:
+        files, next_cursor = keyset_page(query, File, page_limit(), request.args.get('cursor'))
+    except InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+    return jsonify({
+        "items": files_to_dicts(files, fields),
+        "next_cursor": next_cursor,
+    }), 200
+
+
+@bp.get('/collections/<int:collection_id>/archive')
+def collection_archive(collection_id):
+    # Streamed ZIP of the member files; ?compress=0 stores every member,
+    # which also lets the response carry Content-Length
+    col = Collection.query.get_or_404(collection_id)
+    store = blob_store()
+    entries = collection_entries(store, col.id, compress=request.args.get('compress', '1') != '0')
+    config = current_app.config
+    response = current_app.response_class(
+        stream_zip(store, entries, config['ARCHIVE_READ_SIZE'], config['ARCHIVE_COMPRESSION_LEVEL']),
+        mimetype='application/zip',
+        direct_passthrough=True,
+    )
+    size = archive_size(entries)
+    if size is not None:
+        response.content_length = size
+    name = secure_filename(col.name) or f"collection-{col.id}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.zip"'
+    return response
+
+
+@bp.post('/collections/<int:collection_id>/files')
+def add_collection_files(collection_id):
+    return change_collection_files(collection_id, add_members, 'added')
+
+
+@bp.delete('/collections/<int:collection_id>/files')
+def remove_collection_files(collection_id):
+    return change_collection_files(collection_id, remove_members, 'removed')
+
+
+def change_collection_files(collection_id, apply, key):
+    # Body: {"file_ids": [...]}; unknown file ids are ignored on add
+    col = Collection.query.get_or_404(collection_id)
+    data = request.get_json(silent=True) or {}
+    try:
+        file_ids = parse_file_ids(data.get('file_ids'))
+    except InvalidFileIds as exc:
+        return jsonify({"error": str(exc)}), 400
+    changed = apply(col.id, file_ids)
+    if changed:
+        bump_versions('collections')
+    db.session.commit()
+    return jsonify({key: changed, "file_count": col.file_count}), 200
 
 
 @bp.delete('/collections/<int:collection_id>')
 def delete_collection(collection_id):
     col = Collection.query.get_or_404(collection_id)
+    # Drop the links in one statement so the ORM has no member list to load
+    db.session.execute(collection_files.delete().where(collection_files.c.collection_id == col.id))
     db.session.delete(col)
+    bump_versions('collections')
     db.session.commit()
     return jsonify({"message": "deleted"}), 204
+
+
+@bp.get('/changes')
+def list_changes():
+    # Without ?since, just the current cursor: load the lists, then poll
+    # with it. since=0 replays every live resource.
+    since = request.args.get('since')
+    if since is None:
+        return jsonify({"changes": [], "next_cursor": head_cursor(), "has_more": False}), 200
+    resources = [r.strip() for r in request.args.get('types', '').split(',') if r.strip()] or RESOURCES
+    unknown = sorted(set(resources) - set(RESOURCES))
+    if unknown:
+        return jsonify({"error": f"unknown types: {', '.join(unknown)}"}), 400
+    try:
+        changes, cursor, has_more = changes_since(
+            since, page_limit(), resources, parse_fields(request.args.get('fields')),
+        )
+    except InvalidCursor:
+        return jsonify({"error": "invalid cursor"}), 400
+    except ExpiredCursor:
+        return jsonify({"error": "cursor expired; resync with since=0"}), 410
+    return jsonify({"changes": changes, "next_cursor": cursor, "has_more": has_more}), 200
+
+
+# Prometheus scrape target
+@bp.get('/metrics')
+def metrics():
+    body, content_type = render_metrics()
+    return current_app.response_class(body, content_type=content_type)
@@ -1,51 +1,106 @@
-from flask_marshmallow import Marshmallow
-from marshmallow import fields
-from models import User, File, Tag, Collection, FileTag
+import threading
+from functools import lru_cache
 
-ma = Marshmallow()
+from flask import current_app, has_app_context
+from models import User, File, Tag, Collection, FileTag, UploadSession
 
+# Importing marshmallow-sqlalchemy and creating the auto schemas (which
+# inspect their models) is a large part of app import time, so both wait
+# for first use: `schemas.FileSchema` (or `from schemas import FileSchema`)
+# defines every schema then, and request handlers go through
+# cached_schema('FileSchema'). Hot list endpoints never need them (see
+# serializers.py).
 
-class TagSchema(ma.SQLAlchemyAutoSchema):
-    class Meta:
-        model = Tag
-        include_fk = True
-        load_instance = True
+_classes = None
+_lock = threading.Lock()
 
 
-class FileTagSchema(ma.SQLAlchemyAutoSchema):
-    tag = fields.Nested(TagSchema(only=("id", "name")))
+@lru_cache(maxsize=256)
+def cached_schema(schema, many=False, only=None):
+    """Shared schema instance per (class or class name, many, only); building one per request is costly."""
+    if isinstance(schema, str):
+        schema = __getattr__(schema)
+    return schema(many=many, only=only)
 
-    class Meta:
-        model = FileTag
-        include_fk = True
-        load_instance = True
 
+SCHEMA_NAMES = (
+    'TagSchema', 'FileTagSchema', 'FileSchema', 'CollectionSchema', 'UserSchema', 'UploadSessionSchema',
+)
 
-class FileSchema(ma.SQLAlchemyAutoSchema):
-    tags = fields.List(fields.Nested(TagSchema))
-    # Expose association object details
-    tags_with_meta = fields.List(fields.Nested(FileTagSchema), attribute='tag_links')
 
-    class Meta:
-        model = File
-        include_fk = True
-        load_instance = True
+def __getattr__(name):
+    # The import system probes modules for attributes such as __path__
+    if name not in SCHEMA_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    global _classes
+    if _classes is None:
+        with _lock:
+            if _classes is None:
+                _classes = _define()
+    return _classes[name]
 
 
-class CollectionSchema(ma.SQLAlchemyAutoSchema):
-    files = fields.List(fields.Nested(FileSchema(only=("id", "filename"))))
+def _define():
+    from flask_marshmallow import Marshmallow
+    from marshmallow import fields
 
-    class Meta:
-        model = Collection
-        include_fk = True
-        load_instance = True
+    ma = Marshmallow()
+    if has_app_context():
+        # Gives load_instance schemas the db session
+        ma.init_app(current_app)
 
+    class TagSchema(ma.SQLAlchemyAutoSchema):
+        class Meta:
+            model = Tag
+            include_fk = True
+            load_instance = True
+            # Bookkeeping for the suggestion index, not part of the API
+            exclude = ("updated_at",)
 
-class UserSchema(ma.SQLAlchemyAutoSchema):
-    files = fields.List(fields.Nested(FileSchema(only=("id", "filename"))))
-    collections = fields.List(fields.Nested(CollectionSchema(only=("id", "name"))))
+    class FileTagSchema(ma.SQLAlchemyAutoSchema):
+        tag = fields.Nested(TagSchema(only=("id", "name")))
 
-    class Meta:
-        model = User
-        load_instance = True
-        exclude = ("password",)
+        class Meta:
+            model = FileTag
+            include_fk = True
+            load_instance = True
+
+    class FileSchema(ma.SQLAlchemyAutoSchema):
+        tags = fields.List(fields.Nested(TagSchema))
+        # Expose association object details
+        tags_with_meta = fields.List(fields.Nested(FileTagSchema), attribute='tag_links')
+
+        class Meta:
+            model = File
+            include_fk = True
+            load_instance = True
+
+    class CollectionSchema(ma.SQLAlchemyAutoSchema):
+        # Members are paged through /collections/<id>/files
+        file_count = fields.Integer(dump_only=True)
+
+        class Meta:
+            model = Collection
+            include_fk = True
+            load_instance = True
+
+    class UserSchema(ma.SQLAlchemyAutoSchema):
+        # Owned files and collections are paged through /users/<id>/files and
+        # /users/<id>/collections, and totals come from /users/<id>/summary
+
+        class Meta:
+            model = User
+            load_instance = True
+            exclude = ("password",)
+
+    class UploadSessionSchema(ma.SQLAlchemyAutoSchema):
+        total_chunks = fields.Integer(dump_only=True)
+
+        class Meta:
+            model = UploadSession
+            include_fk = True
+            load_instance = True
+
+    return {schema.__name__: schema for schema in (
+        TagSchema, FileTagSchema, FileSchema, CollectionSchema, UserSchema, UploadSessionSchema,
+    )}
@@ -0,0 +1,173 @@
+import re
+
+from sqlalchemy import and_, exists, inspect, or_, select, text
+
+from models import File, FileTag, Tag
+
+# Full-text index over files.filename, files.description, attached tag
+# names and the text the post-upload pipeline extracted (file_jobs). SQLite
+# keeps a separate FTS5 table; PostgreSQL keeps a tsvector column with a GIN
+# index. Both are maintained by triggers, so every write path (ORM, bulk Core
+# inserts, cascaded deletes) stays in sync; extracted text is written with
+# index_file_text() when a job finishes.
+
+_SQLITE_TAGS = (
+    "(SELECT coalesce(group_concat(t.name, ' '), '') FROM file_tags ft "
+    "JOIN tags t ON t.id = ft.tag_id WHERE ft.file_id = {file_id})"
+)
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE files_fts USING fts5("
+    "filename, description, tags, content, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS files_fts_ai AFTER INSERT ON files BEGIN "
+    "INSERT INTO files_fts(rowid, filename, description, tags) "
+    "VALUES (new.id, new.filename, coalesce(new.description, ''), ''); END",
+    "CREATE TRIGGER IF NOT EXISTS files_fts_au AFTER UPDATE OF filename, description ON files BEGIN "
+    "UPDATE files_fts SET filename = new.filename, description = coalesce(new.description, '') "
+    "WHERE rowid = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS files_fts_ad AFTER DELETE ON files BEGIN "
+    "DELETE FROM files_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS files_fts_tags_ai AFTER INSERT ON file_tags BEGIN "
+    f"UPDATE files_fts SET tags = {_SQLITE_TAGS.format(file_id='new.file_id')} "
+    "WHERE rowid = new.file_id; END",
+    "CREATE TRIGGER IF NOT EXISTS files_fts_tags_ad AFTER DELETE ON file_tags BEGIN "
+    f"UPDATE files_fts SET tags = {_SQLITE_TAGS.format(file_id='old.file_id')} "
+    "WHERE rowid = old.file_id; END",
+]
+
+SQLITE_BACKFILL = (
+    "INSERT INTO files_fts(rowid, filename, description, tags, content) "
+    "SELECT f.id, f.filename, coalesce(f.description, ''), "
+    f"{_SQLITE_TAGS.format(file_id='f.id')}, {{content}} FROM files f"
+)
+_SQLITE_CONTENT = "coalesce((SELECT j.extracted_text FROM file_jobs j WHERE j.file_id = f.id), '')"
+
+POSTGRES_DDL = [
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS ix_files_search_vector ON files USING gin (search_vector)",
+    """CREATE OR REPLACE FUNCTION files_search_vector(fid integer, fname text, fdesc text)
+    RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('simple', coalesce(fname, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce((
+                SELECT string_agg(t.name, ' ') FROM file_tags ft
+                JOIN tags t ON t.id = ft.tag_id WHERE ft.file_id = fid), '')), 'B')
+            || setweight(to_tsvector('simple', coalesce(fdesc, '')), 'C'){content}
+    $$ LANGUAGE sql STABLE""",
+    """CREATE OR REPLACE FUNCTION files_search_vector_trg() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := files_search_vector(NEW.id, NEW.filename, NEW.description);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS files_search_vector_biu ON files",
+    "CREATE TRIGGER files_search_vector_biu BEFORE INSERT OR UPDATE OF filename, description "
+    "ON files FOR EACH ROW EXECUTE FUNCTION files_search_vector_trg()",
+    """CREATE OR REPLACE FUNCTION file_tags_search_vector_trg() RETURNS trigger AS $$
+    DECLARE
+        fid integer;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN fid := OLD.file_id; ELSE fid := NEW.file_id; END IF;
+        UPDATE files SET search_vector = files_search_vector(id, filename, description)
+        WHERE id = fid;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS file_tags_search_vector_aid ON file_tags",
+    "CREATE TRIGGER file_tags_search_vector_aid AFTER INSERT OR DELETE ON file_tags "
+    "FOR EACH ROW EXECUTE FUNCTION file_tags_search_vector_trg()",
+]
+
+_POSTGRES_CONTENT = (
+    "\n            || setweight(to_tsvector('simple', coalesce(("
+    "SELECT j.extracted_text FROM file_jobs j WHERE j.file_id = fid), '')), 'D')"
+)
+
+POSTGRES_BACKFILL = (
+    "UPDATE files SET search_vector = files_search_vector(id, filename, description) "
+    "WHERE search_vector IS NULL"
+)
+
+
+def install_search(connection):
+    """Create the full-text index and its triggers if missing, then backfill."""
+    dialect = connection.dialect.name
+    inspector = inspect(connection)
+    # Extracted text is indexed once the file_jobs table exists
+    has_jobs = inspector.has_table('file_jobs')
+    if dialect == 'sqlite':
+        if inspector.has_table('files_fts'):
+            columns = [row[1] for row in connection.exec_driver_sql("PRAGMA table_info(files_fts)")]
+            if 'content' in columns or not has_jobs:
+                return
+            # Index predates extracted text; rebuild it with the extra column
+            connection.exec_driver_sql("DROP TABLE files_fts")
+        for statement in SQLITE_DDL:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(SQLITE_BACKFILL.format(content=_SQLITE_CONTENT if has_jobs else "''"))
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_DDL:
+            connection.exec_driver_sql(statement.replace('{content}', _POSTGRES_CONTENT if has_jobs else ''))
+        connection.exec_driver_sql(POSTGRES_BACKFILL)
+
+
+def index_file_text(session, file_id):
+    """Bring one file's index entry up to date with its extracted text."""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        session.execute(
+            text(
+                "UPDATE files_fts SET content = coalesce(("
+                "SELECT extracted_text FROM file_jobs WHERE file_id = :id), '') WHERE rowid = :id"
+            ),
+            {'id': file_id},
+        )
+    elif dialect == 'postgresql':
+        session.execute(
+            text("UPDATE files SET search_vector = files_search_vector(id, filename, description) WHERE id = :id"),
+            {'id': file_id},
+        )
+
+
+def search_terms(q):
+    return re.findall(r'[^\W_]+', q or '')
+
+
+def search_file_ids(session, q, limit, offset=0):
+    """File ids matching every term in ``q`` (as prefixes), best match first."""
+    terms = search_terms(q)
+    if not terms:
+        return []
+    dialect = session.get_bind().dialect.name
+    params = {'limit': limit, 'offset': offset}
+    if dialect == 'sqlite':
+        # bm25 is lower-is-better; filename and tags outrank description,
+        # which outranks extracted content
+        params['q'] = ' '.join(f'"{term}"*' for term in terms)
+        sql = (
+            "SELECT rowid FROM files_fts WHERE files_fts MATCH :q "
+            "ORDER BY bm25(files_fts, 10.0, 2.0, 5.0, 1.0), rowid DESC LIMIT :limit OFFSET :offset"
+        )
+    elif dialect == 'postgresql':
+        params['q'] = ' & '.join(f'{term}:*' for term in terms)
+        sql = (
+            "SELECT id FROM files, to_tsquery('simple', :q) query "
+            "WHERE search_vector @@ query "
+            "ORDER BY ts_rank(search_vector, query) DESC, id DESC LIMIT :limit OFFSET :offset"
+        )
+    else:
+        return _like_file_ids(session, terms, limit, offset)
+    return [row[0] for row in session.execute(text(sql), params)]
+
+
+def _like_file_ids(session, terms, limit, offset):
+    # No full-text index on other databases: every term must appear in the
+    # filename, description or a tag name; newest first, without ranking
+    conditions = []
+    for term in terms:
+        pattern = f'%{term}%'
+        tagged = exists().where(
+            FileTag.file_id == File.id, FileTag.tag_id == Tag.id, Tag.name.ilike(pattern)
+        )
+        conditions.append(or_(File.filename.ilike(pattern), File.description.ilike(pattern), tagged))
+    query = select(File.id).where(and_(*conditions)).order_by(File.id.desc()).limit(limit).offset(offset)
+    return list(session.scalars(query))
@@ -1,6 +1,6 @@
 from app import app
-from models import db, User, File, Tag, Collection, FileTag
-from sqlalchemy.exc import IntegrityError
+from models import db, User, File, Collection
+from tagging import resolve_tags, set_file_tags
 
 
 def get_or_create_user(username: str, password: str) -> User:
@@ -13,24 +13,19 @@ def get_or_create_user(username: str, password: str) -> User:
     return user
 
 
-def get_or_create_tag(name: str) -> Tag:
-    tag = Tag.query.filter_by(name=name).first()
-    if tag:
-        return tag
-    tag = Tag(name=name)
-    db.session.add(tag)
+def get_or_create_tags(names) -> dict:
+    tags, _ = resolve_tags(names)
     db.session.commit()
-    return tag
+    return tags
 
 
 def create_file(owner: User, filename: str, description: str = "", tag_names=None, added_by=None) -> File:
     f = File(filename=filename, description=description, user_id=owner.id)
     db.session.add(f)
     db.session.flush()  # get id
-    tag_names = tag_names or []
-    for name in tag_names:
-        t = get_or_create_tag(name)
-        f.tag_links.append(FileTag(tag=t, added_by=(added_by or owner.id)))
+    set_file_tags(f, tags_with_meta=[
+        {"name": name, "added_by": added_by or owner.id} for name in tag_names or []
+    ])
     db.session.commit()
     return f
 
@@ -53,10 +48,7 @@ def seed():
         carol = get_or_create_user("carol", "password")
 
         # Common tags
-        finance = get_or_create_tag("finance")
-        health = get_or_create_tag("health")
-        personal = get_or_create_tag("personal")
-        data = get_or_create_tag("data")
+        get_or_create_tags(["finance", "health", "personal", "data"])
 
         # Files
         f1 = File.query.filter_by(filename="q3_report.pdf", user_id=alice.id).first() or create_file(
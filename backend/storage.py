@@ -0,0 +1,617 @@
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from flask import current_app
+
+from models import db, Blob, upsert_insert
+
+# Read/write granularity for streaming uploads to disk
+CHUNK_SIZE = 1024 * 1024
+
+# Blob storage. Blobs are content-addressed: the key of a blob is derived
+# from its SHA-256 (ab/cd/<hash>) and File.path holds that key. Every
+# backend implements put_stream, put_file, open_range, delete and stat,
+# plus touch, iter_keys and cleanup_tmp for the sweeper; STORAGE_BACKEND
+# picks one of
+#
+#   local   files under STORAGE_ROOT (default <instance>/uploads)
+#   memory  a dict, for tests and benchmarks
+#   s3      any S3-compatible object store (AWS, MinIO, moto); needs boto3
+#
+# Resumable upload sessions are always staged on local disk under
+# upload_root() and handed to the store with put_file on completion.
+
+BlobStat = namedtuple('BlobStat', 'size mtime')
+
+# Keys of stored blobs, as opposed to tmp/ and other scratch names
+BLOB_KEY_RE = re.compile(r'[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}')
+
+# S3 rejects multipart parts smaller than this (except the last)
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def blob_key(digest):
+    """Sharded key of a blob: ab/cd/<sha256>."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def upload_root():
+    """Local directory for upload sessions, previews and the local backend."""
+    return current_app.config['STORAGE_ROOT'] or os.path.join(current_app.instance_path, 'uploads')
+
+
+def _read_full(stream, size):
+    """Read up to ``size`` bytes, looping over short reads."""
+    parts = []
+    remaining = size
+    while remaining:
+        data = stream.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as src:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+class _Slice(io.RawIOBase):
+    """At most ``length`` bytes of a readable stream."""
+
+    def __init__(self, raw, length):
+        self.raw = raw
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self.remaining)
+        data = self.raw.read(n) if n else b''
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+class BlobReader(io.RawIOBase):
+    """Seekable file object over a remote blob.
+
+    Nothing is fetched until the first read; a seek drops the open body and
+    the next read asks the store for the rest of the blob from the new
+    offset, so send_file's Range handling costs one ranged GET.
+    """
+
+    def __init__(self, store, key, size):
+        self.store = store
+        self.key = key
+        self.size = size
+        self._pos = 0
+        self._body = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        position = max(0, base + offset)
+        if position != self._pos:
+            self._drop_body()
+            self._pos = position
+        return self._pos
+
+    def readinto(self, buffer):
+        if self._pos >= self.size:
+            return 0
+        if self._body is None:
+            self._body = self.store.open_range(self.key, self._pos)
+        data = self._body.read(len(buffer))
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def _drop_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def close(self):
+        self._drop_body()
+        super().close()
+
+
+class BlobStore:
+    """Interface shared by the storage backends."""
+
+    def put_stream(self, stream):
+        """Store the bytes of a readable stream; returns (digest, size, key)."""
+        raise NotImplementedError
+
+    def put_file(self, path):
+        """Move a local file into the store; returns (digest, size, key)."""
+        raise NotImplementedError
+
+    def open_range(self, key, start=0, length=None):
+        """Readable stream of ``length`` bytes (default: the rest) from ``start``."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def stat(self, key):
+        """BlobStat(size, mtime), or None if there is no such blob."""
+        raise NotImplementedError
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    def touch(self, key):
+        """Bump a blob's mtime; puts that find the blob already stored call it.
+
+        The sweeper (cleanup.py) leaves recently modified blobs alone, so a
+        blob being reused by an upload is not deleted under it.
+        """
+        raise NotImplementedError
+
+    def iter_keys(self):
+        """Yield (key, BlobStat) for every stored blob, in no particular order."""
+        raise NotImplementedError
+
+    def cleanup_tmp(self, older_than):
+        """Drop scratch data from uploads abandoned before ``older_than`` (epoch seconds)."""
+        return 0
+
+    def local_path(self, key):
+        """Filesystem path of a blob when the store keeps one, else None."""
+        return None
+
+    def open(self, key, size):
+        return BlobReader(self, key, size)
+
+    @contextmanager
+    def local_copy(self, key):
+        """A path to the blob's bytes for code that needs a real file."""
+        path = self.local_path(key)
+        if path is not None:
+            yield path
+            return
+        fd, tmp_path = tempfile.mkstemp(prefix='blob-')
+        try:
+            with os.fdopen(fd, 'wb') as out, self.open_range(key) as src:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+            yield tmp_path
+        finally:
+            os.unlink(tmp_path)
+
+
+class LocalStore(BlobStore):
+    """Blobs as files under ``root``, written once and renamed into place."""
+
+    def __init__(self, root, buffer_size=CHUNK_SIZE, fsync=False):
+        self.root = root
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+
+    def path(self, key):
+        # Rows written before keys were introduced hold absolute paths
+        if os.path.isabs(key):
+            return key
+        return os.path.join(self.root, *key.split('/'))
+
+    def local_path(self, key):
+        return self.path(key)
+
+    def _place(self, tmp_path, digest):
+        """Rename a finished temp file to its blob path, or drop it if already stored."""
+        key = blob_key(digest)
+        final_path = self.path(key)
+        if os.path.exists(final_path):
+            os.unlink(tmp_path)
+            self.touch(key)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+        return key
+
+    def put_stream(self, stream):
+        """Bytes go to a temp file while the SHA-256 is computed in the same
+        pass, then the file is renamed into place (or dropped as a duplicate).
+        """
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        hasher = hashlib.sha256()
+        size = 0
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        try:
+            with os.fdopen(fd, 'wb', buffering=0) as out:
+                while True:
+                    if hasattr(stream, 'readinto'):
+                        n = stream.readinto(buffer)
+                        chunk = view[:n]
+                    else:
+                        chunk = stream.read(self.buffer_size)
+                        n = len(chunk)
+                    if not n:
+                        break
+                    hasher.update(chunk)
+                    while chunk:
+                        chunk = chunk[out.write(chunk):]
+                    size += n
+                if self.fsync:
+                    os.fsync(out.fileno())
+            digest = hasher.hexdigest()
+            key = self._place(tmp_path, digest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest, size, key
+
+    def put_file(self, path):
+        # Same filesystem: hashed in one read pass and renamed, never copied
+        digest, size = hash_file(path, self.buffer_size)
+        if self.fsync:
+            with open(path, 'rb') as src:
+                os.fsync(src.fileno())
+        return digest, size, self._place(path, digest)
+
+    def open_range(self, key, start=0, length=None):
+        src = open(self.path(key), 'rb')
+        src.seek(start)
+        return src if length is None else _Slice(src, length)
+
+    def delete(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def stat(self, key):
+        try:
+            info = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return BlobStat(info.st_size, info.st_mtime)
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def touch(self, key):
+        try:
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self):
+        # Only the two levels of hex shard directories hold blobs
+        for first in _scandir(self.root):
+            if not (first.is_dir() and len(first.name) == 2):
+                continue
+            for second in _scandir(first.path):
+                if not (second.is_dir() and len(second.name) == 2):
+                    continue
+                for entry in _scandir(second.path):
+                    key = f"{first.name}/{second.name}/{entry.name}"
+                    if BLOB_KEY_RE.fullmatch(key) and entry.is_file():
+                        info = entry.stat()
+                        yield key, BlobStat(info.st_size, info.st_mtime)
+
+    def cleanup_tmp(self, older_than):
+        removed = 0
+        for entry in _scandir(os.path.join(self.root, 'tmp')):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < older_than:
+                    os.unlink(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def _scandir(path):
+    try:
+        with os.scandir(path) as entries:
+            yield from entries
+    except FileNotFoundError:
+        return
+
+
+class MemoryStore(BlobStore):
+    """Blobs in a dict; per process, gone on restart."""
+
+    def __init__(self):
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def _put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        key = blob_key(digest)
+        with self._lock:
+            stored = self._blobs.get(key)
+            self._blobs[key] = (stored[0] if stored else bytes(data), time.time())
+        return digest, len(data), key
+
+    def put_stream(self, stream):
+        return self._put(stream.read())
+
+    def put_file(self, path):
+        with open(path, 'rb') as src:
+            result = self._put(src.read())
+        os.unlink(path)
+        return result
+
+    def open_range(self, key, start=0, length=None):
+        data, _ = self._blobs[key]
+        end = len(data) if length is None else start + length
+        return io.BytesIO(data[start:end])
+
+    def delete(self, key):
+        with self._lock:
+            self._blobs.pop(key, None)
+
+    def stat(self, key):
+        entry = self._blobs.get(key)
+        return BlobStat(len(entry[0]), entry[1]) if entry else None
+
+    def touch(self, key):
+        with self._lock:
+            if key in self._blobs:
+                self._blobs[key] = (self._blobs[key][0], time.time())
+
+    def iter_keys(self):
+        for key, (data, mtime) in list(self._blobs.items()):
+            yield key, BlobStat(len(data), mtime)
+
+
+class S3Store(BlobStore):
+    """Blobs as objects in an S3 bucket, under ``prefix``.
+
+    Uploads larger than one part go up as a multipart upload while the
+    request body is still being read: parts are sent from a thread pool, at
+    most ``concurrency`` in flight per process, which also bounds buffered
+    memory to concurrency * part_size. The digest is only known at the end,
+    so such uploads land under tmp/ and are copied server-side to their
+    content key. Objects are rewritten even when the blob already exists,
+    which refreshes LastModified for the sweeper.
+    """
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None,
+                 part_size=8 * 1024 * 1024, concurrency=4):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs the boto3 package") from None
+        self._boto3 = boto3
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.endpoint_url = endpoint_url or None
+        self.region = region or None
+        self.part_size = max(part_size, S3_MIN_PART_SIZE)
+        self.concurrency = max(1, concurrency)
+        self.transfer = TransferConfig(
+            multipart_threshold=self.part_size, multipart_chunksize=self.part_size,
+            max_concurrency=self.concurrency,
+        )
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _state(self):
+        # Clients and threads don't survive a fork; make them per process
+        with self._lock:
+            if self._pid != os.getpid():
+                session = self._boto3.session.Session()
+                self._client = session.client('s3', endpoint_url=self.endpoint_url, region_name=self.region)
+                self._parts = ThreadPoolExecutor(self.concurrency, thread_name_prefix='s3-parts')
+                self._slots = threading.BoundedSemaphore(self.concurrency)
+                self._pid = os.getpid()
+            return self._client, self._parts, self._slots
+
+    @property
+    def client(self):
+        return self._state()[0]
+
+    def name(self, key):
+        return self.prefix + key
+
+    def put_stream(self, stream):
+        client, parts_pool, slots = self._state()
+        part = _read_full(stream, self.part_size)
+        hasher = hashlib.sha256(part)
+        if len(part) < self.part_size:
+            # The whole body fit in one part: its key is known, one PUT
+            digest = hasher.hexdigest()
+            key = blob_key(digest)
+            client.put_object(Bucket=self.bucket, Key=self.name(key), Body=part)
+            return digest, len(part), key
+
+        tmp_name = self.name(f"tmp/{uuid.uuid4().hex}")
+        upload_id = client.create_multipart_upload(Bucket=self.bucket, Key=tmp_name)['UploadId']
+        futures = []
+        size = 0
+        try:
+            while part:
+                size += len(part)
+                slots.acquire()
+                failed = next((f for f in futures if f.done() and f.exception()), None)
+                if failed is not None:
+                    slots.release()
+                    raise failed.exception()
+                future = parts_pool.submit(self._upload_part, tmp_name, upload_id, len(futures) + 1, part)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+                part = _read_full(stream, self.part_size)
+                hasher.update(part)
+            client.complete_multipart_upload(
+                Bucket=self.bucket, Key=tmp_name, UploadId=upload_id,
+                MultipartUpload={'Parts': [f.result() for f in futures]},
+            )
+        except BaseException:
+            wait(futures)
+            client.abort_multipart_upload(Bucket=self.bucket, Key=tmp_name, UploadId=upload_id)
+            raise
+
+        digest = hasher.hexdigest()
+        key = blob_key(digest)
+        try:
+            client.copy(
+                {'Bucket': self.bucket, 'Key': tmp_name}, self.bucket, self.name(key), Config=self.transfer,
+            )
+        finally:
+            client.delete_object(Bucket=self.bucket, Key=tmp_name)
+        return digest, size, key
+
+    def _upload_part(self, name, upload_id, number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=name, UploadId=upload_id, PartNumber=number, Body=data,
+        )
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def put_file(self, path):
+        # Hash first so the object goes straight to its key; boto3 then
+        # sends large files as parallel multipart ranges of the file
+        digest, size = hash_file(path)
+        key = blob_key(digest)
+        if self.exists(key):
+            self.touch(key)
+        else:
+            self.client.upload_file(path, self.bucket, self.name(key), Config=self.transfer)
+        os.unlink(path)
+        return digest, size, key
+
+    def open_range(self, key, start=0, length=None):
+        kwargs = {}
+        if start or length is not None:
+            end = '' if length is None else start + length - 1
+            kwargs['Range'] = f"bytes={start}-{end}"
+        return self.client.get_object(Bucket=self.bucket, Key=self.name(key), **kwargs)['Body']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.name(key))
+
+    def stat(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.name(key))
+        except self.client.exceptions.ClientError as exc:
+            if exc.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return BlobStat(head['ContentLength'], head['LastModified'].timestamp())
+
+    def touch(self, key):
+        # S3 has no utime; a server-side copy onto itself sets LastModified
+        self.client.copy(
+            {'Bucket': self.bucket, 'Key': self.name(key)}, self.bucket, self.name(key),
+            ExtraArgs={'MetadataDirective': 'REPLACE'}, Config=self.transfer,
+        )
+
+    def _list(self, prefix):
+        pages = self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.name(prefix))
+        for page in pages:
+            yield from page.get('Contents', ())
+
+    def iter_keys(self):
+        for obj in self._list(''):
+            key = obj['Key'][len(self.prefix):]
+            if BLOB_KEY_RE.fullmatch(key):
+                yield key, BlobStat(obj['Size'], obj['LastModified'].timestamp())
+
+    def cleanup_tmp(self, older_than):
+        client = self.client
+        stale = [{'Key': obj['Key']} for obj in self._list('tmp/') if obj['LastModified'].timestamp() < older_than]
+        for start in range(0, len(stale), 1000):
+            client.delete_objects(Bucket=self.bucket, Delete={'Objects': stale[start:start + 1000], 'Quiet': True})
+        # Multipart uploads from processes that died mid-request
+        aborted = 0
+        pages = client.get_paginator('list_multipart_uploads').paginate(Bucket=self.bucket, Prefix=self.name('tmp/'))
+        for page in pages:
+            for upload in page.get('Uploads', ()):
+                if upload['Initiated'].timestamp() < older_than:
+                    client.abort_multipart_upload(Bucket=self.bucket, Key=upload['Key'], UploadId=upload['UploadId'])
+                    aborted += 1
+        return len(stale) + aborted
+
+
+def create_store(app):
+    config = app.config
+    backend = config['STORAGE_BACKEND']
+    if backend == 'local':
+        root = config['STORAGE_ROOT'] or os.path.join(app.instance_path, 'uploads')
+        return LocalStore(root, buffer_size=config['STORAGE_BUFFER_SIZE'], fsync=config['STORAGE_FSYNC'])
+    if backend == 'memory':
+        return MemoryStore()
+    if backend == 's3':
+        return S3Store(
+            config['STORAGE_S3_BUCKET'],
+            prefix=config['STORAGE_S3_PREFIX'],
+            endpoint_url=config['STORAGE_S3_ENDPOINT_URL'],
+            region=config['STORAGE_S3_REGION'],
+            part_size=config['STORAGE_S3_PART_SIZE'],
+            concurrency=config['STORAGE_S3_CONCURRENCY'],
+        )
+    raise ValueError(f"unknown STORAGE_BACKEND {backend!r}")
+
+
+_store_lock = threading.Lock()
+
+
+def blob_store():
+    """The app's BlobStore, created on first use."""
+    app = current_app._get_current_object()
+    store = app.extensions.get('blob_store')
+    if store is None:
+        with _store_lock:
+            store = app.extensions.get('blob_store')
+            if store is None:
+                store = app.extensions['blob_store'] = create_store(app)
+    return store
+
+
+def acquire_blob(digest, size):
+    """Count one more file reference to a blob, creating its row if needed."""
+    table = Blob.__table__
+    insert = upsert_insert(table)
+    if insert is not None:
+        stmt = insert.values(sha256=digest, size_bytes=size, ref_count=1).on_conflict_do_update(
+            index_elements=['sha256'], set_={'ref_count': table.c.ref_count + 1}
+        )
+        db.session.execute(stmt)
+        return
+    with db.session.no_autoflush:
+        blob = db.session.get(Blob, digest, with_for_update=True)
+    if blob is None:
+        db.session.add(Blob(sha256=digest, size_bytes=size, ref_count=1))
+    else:
+        blob.ref_count += 1
@@ -0,0 +1,46 @@
+import json
+
+from flask import Response, stream_with_context
+
+from models import db
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _rows(query, serialize, batch_size):
+    """Serialized rows in batches, detaching each ORM object once written."""
+    batch = []
+    rows = db.session.scalars(query.statement, execution_options={'yield_per': batch_size})
+    for obj in rows:
+        batch.append(json.dumps(serialize(obj)))
+        db.session.expunge(obj)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_query(query, serialize, fmt='json', batch_size=500):
+    """Chunked Response streaming ``query`` as a JSON array or NDJSON.
+
+    Rows are fetched ``batch_size`` at a time (server-side cursor on
+    PostgreSQL) and written out per batch, so memory stays flat however
+    many rows the query returns.
+    """
+    def generate():
+        if fmt == 'ndjson':
+            for batch in _rows(query, serialize, batch_size):
+                yield '\n'.join(batch) + '\n'
+            return
+        yield '['
+        first = True
+        for batch in _rows(query, serialize, batch_size):
+            yield ('' if first else ',') + ','.join(batch)
+            first = False
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[fmt])
@@ -0,0 +1,266 @@
+import bisect
+import heapq
+from datetime import datetime, timedelta
+
+from flask import current_app, request
+from sqlalchemy import and_, func, inspect, select
+
+from background import add_periodic_task, periodic_task
+from cache import current_versions
+from changes import POSTGRES_NOW, SQLITE_NOW
+from models import db, Tag
+
+# GET /api/tags/suggest is answered from a per-process prefix index: the
+# lowercased tag names in one sorted list, so the tags starting with a
+# prefix are a single bisect range. Ranges holding more than SCAN_LIMIT
+# tags keep their MAX_SUGGESTIONS most used tags precomputed, so a lookup
+# never ranks more than SCAN_LIMIT entries and needs no SQL.
+#
+# tags.updated_at is stamped by triggers whenever a tag is created, renamed
+# or its file_count moves. A background task, run after every write and
+# otherwise at most once per TAG_INDEX_REFRESH_INTERVAL, checks the 'tags'
+# version and, when it has moved, reads only the tags stamped since its
+# last read and patches their entries and rankings. Until the first load
+# finishes, suggestions come from the lower(name) index.
+
+SCAN_LIMIT = 256
+MAX_SUGGESTIONS = 50
+# Sorts after every character a tag name can hold
+END = '\U0010ffff'
+# Each read goes back this far past the previous one, for transactions that
+# stamped a row before it and committed after
+READ_OVERLAP = timedelta(seconds=5)
+# Full reload now and then, in case a commit lagged more than that
+FULL_RELOAD_AFTER = timedelta(minutes=10)
+
+SQLITE_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS tags_touch_ai AFTER INSERT ON tags BEGIN "
+    f"UPDATE tags SET updated_at = {SQLITE_NOW} WHERE id = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS tags_touch_au AFTER UPDATE OF name, file_count ON tags BEGIN "
+    f"UPDATE tags SET updated_at = {SQLITE_NOW} WHERE id = new.id; END",
+]
+
+POSTGRES_DDL = [
+    f"""CREATE OR REPLACE FUNCTION tags_touch_trg() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at := {POSTGRES_NOW};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS tags_touch_biu ON tags",
+    "CREATE TRIGGER tags_touch_biu BEFORE INSERT OR UPDATE OF name, file_count ON tags "
+    "FOR EACH ROW EXECUTE FUNCTION tags_touch_trg()",
+]
+
+BACKFILL = "UPDATE tags SET updated_at = {now} WHERE updated_at IS NULL"
+
+DROP_SQLITE = [
+    "DROP TRIGGER IF EXISTS tags_touch_ai",
+    "DROP TRIGGER IF EXISTS tags_touch_au",
+]
+DROP_POSTGRES = [
+    "DROP TRIGGER IF EXISTS tags_touch_biu ON tags",
+    "DROP FUNCTION IF EXISTS tags_touch_trg()",
+]
+
+
+def _has_touch_triggers(connection):
+    if connection.dialect.name == 'sqlite':
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'tags_touch_au'"
+    else:
+        sql = "SELECT 1 FROM pg_trigger WHERE tgname = 'tags_touch_biu'"
+    return connection.exec_driver_sql(sql).first() is not None
+
+
+def install_suggest(connection):
+    """Create the tags.updated_at triggers if missing and stamp existing tags."""
+    dialect = connection.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        return
+    # Databases that predate the column get it from the Alembic migration
+    if 'updated_at' not in {column['name'] for column in inspect(connection).get_columns('tags')}:
+        return
+    if _has_touch_triggers(connection):
+        return
+    for statement in (SQLITE_DDL if dialect == 'sqlite' else POSTGRES_DDL):
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql(BACKFILL.format(now=SQLITE_NOW if dialect == 'sqlite' else POSTGRES_NOW))
+
+
+def uninstall_suggest(connection):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        statements = DROP_SQLITE
+    elif dialect == 'postgresql':
+        statements = DROP_POSTGRES
+    else:
+        return
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+class TagIndex:
+    """Immutable snapshot of the tags; ``updated`` returns a new one."""
+
+    def __init__(self, entries, tags, tops, version, read_at, loaded_at):
+        self.entries = entries  # sorted [(lowercased name, name, id)]
+        self.tags = tags  # {id: (name, file_count)}
+        self.tops = tops  # {prefix: best MAX_SUGGESTIONS entries} for large ranges
+        self.version = version
+        self.read_at = read_at
+        self.loaded_at = loaded_at
+
+    @classmethod
+    def build(cls, rows, version, read_at):
+        tags = {tag_id: (name, count) for tag_id, name, count in rows}
+        entries = sorted((name.lower(), name, tag_id) for tag_id, (name, _) in tags.items())
+        index = cls(entries, tags, {}, version, read_at, read_at)
+        index._rerank(index._large_prefixes())
+        return index
+
+    def updated(self, rows, version, read_at):
+        """A new snapshot with the changed tags in ``rows`` applied."""
+        tags = self.tags
+        removed = []
+        added = []
+        touched = set()
+        for tag_id, name, count in rows:
+            old = tags.get(tag_id)
+            if old == (name, count):
+                continue
+            if tags is self.tags:
+                tags = dict(self.tags)
+            tags[tag_id] = (name, count)
+            touched.add(name.lower())
+            if old is not None:
+                touched.add(old[0].lower())
+            if old is None or old[0] != name:
+                added.append((name.lower(), name, tag_id))
+                if old is not None:
+                    removed.append((old[0].lower(), old[0], tag_id))
+        if not touched:
+            return TagIndex(self.entries, tags, self.tops, version, read_at, self.loaded_at)
+
+        entries = self.entries
+        if removed or added:
+            entries = list(entries)
+            for entry in removed:
+                del entries[bisect.bisect_left(entries, entry)]
+            for entry in added:
+                bisect.insort(entries, entry)
+        index = TagIndex(entries, tags, dict(self.tops), version, read_at, self.loaded_at)
+        # Only the ranges holding a changed tag can rank differently
+        index._rerank({key[:length] for key in touched for length in range(len(key) + 1)})
+        return index
+
+    def _range(self, prefix, lo=0, hi=None):
+        hi = len(self.entries) if hi is None else hi
+        lo = bisect.bisect_left(self.entries, (prefix,), lo, hi)
+        return lo, bisect.bisect_left(self.entries, (prefix + END,), lo, hi)
+
+    def _rank(self, entries, limit):
+        tags = self.tags
+        return heapq.nsmallest(limit, entries, key=lambda e: (-tags[e[2]][1], e[1]))
+
+    def _children(self, prefix, lo, hi):
+        """(child prefix, lo, hi) for each distinct next character in a range."""
+        depth = len(prefix) + 1
+        while lo < hi:
+            key = self.entries[lo][0]
+            if len(key) < depth:
+                lo += 1
+                continue
+            child_lo, child_hi = self._range(key[:depth], lo, hi)
+            yield key[:depth], child_lo, child_hi
+            lo = child_hi
+
+    def _large_prefixes(self):
+        """Every prefix whose range holds more than SCAN_LIMIT entries."""
+        found = []
+        pending = [('',) + self._range('')]
+        while pending:
+            prefix, lo, hi = pending.pop()
+            if hi - lo > SCAN_LIMIT:
+                found.append(prefix)
+                pending.extend(self._children(prefix, lo, hi))
+        return found
+
+    def _rerank(self, prefixes):
+        # Longest first: a range's best tags are among its sub-ranges' best,
+        # so a large range only ranks those instead of every entry
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            lo, hi = self._range(prefix)
+            if hi - lo <= SCAN_LIMIT:
+                self.tops.pop(prefix, None)
+                continue
+            # Tags named exactly ``prefix`` sort first and are in no sub-range
+            exact = lo
+            while exact < hi and self.entries[exact][0] == prefix:
+                exact += 1
+            candidates = self.entries[lo:exact]
+            for child, child_lo, child_hi in self._children(prefix, exact, hi):
+                top = self.tops.get(child) if child_hi - child_lo > SCAN_LIMIT else None
+                candidates.extend(self.entries[child_lo:child_hi] if top is None else top)
+            self.tops[prefix] = self._rank(candidates, MAX_SUGGESTIONS)
+
+    def suggest(self, prefix, limit):
+        top = self.tops.get(prefix)
+        if top is None:
+            lo, hi = self._range(prefix)
+            top = self._rank(self.entries[lo:hi], limit)
+        return [
+            {'id': tag_id, 'name': name, 'file_count': self.tags[tag_id][1]}
+            for _, name, tag_id in top[:limit]
+        ]
+
+
+def _suggest_from_db(prefix, limit):
+    query = select(Tag.id, Tag.name, Tag.file_count).order_by(Tag.file_count.desc(), Tag.name).limit(limit)
+    if prefix:
+        lowered = func.lower(Tag.name)
+        if db.session.get_bind().dialect.name == 'sqlite':
+            # SQLite only uses the expression index for a range, not LIKE
+            query = query.where(and_(lowered >= prefix, lowered < prefix + END))
+        else:
+            query = query.where(lowered.startswith(prefix, autoescape=True))
+    return [{'id': tag_id, 'name': name, 'file_count': count} for tag_id, name, count in db.session.execute(query)]
+
+
+def suggest_tags(prefix, limit):
+    """Up to ``limit`` tags whose lowercased name starts with ``prefix``, most used first."""
+    index = current_app.extensions.get('tag_index')
+    if index is None:
+        task = periodic_task('tag-index')
+        if task is not None:
+            task.poke(force=True)
+        return _suggest_from_db(prefix, limit)
+    return index.suggest(prefix, limit)
+
+
+def refresh_tag_index():
+    index = current_app.extensions.get('tag_index')
+    # Version and clock first: a write landing in between is read again next time
+    version = current_versions(('tags',))[0]
+    read_at = datetime.utcnow()
+    columns = select(Tag.id, Tag.name, Tag.file_count)
+    if index is None or read_at - index.loaded_at > FULL_RELOAD_AFTER:
+        index = TagIndex.build(db.session.execute(columns).all(), version, read_at)
+    elif index.version != version:
+        changed = db.session.execute(columns.where(Tag.updated_at >= index.read_at - READ_OVERLAP)).all()
+        index = index.updated(changed, version, read_at)
+    else:
+        return
+    current_app.extensions['tag_index'] = index
+
+
+def _refresh_after_write(response):
+    # Writes made by this process show up right away, other processes'
+    # within TAG_INDEX_REFRESH_INTERVAL
+    if request.method not in ('GET', 'HEAD') and response.status_code < 400:
+        periodic_task('tag-index').poke(force=True)
+    return response
+
+
+def init_suggest(app):
+    if add_periodic_task(app, 'tag-index', refresh_tag_index, app.config['TAG_INDEX_REFRESH_INTERVAL']):
+        app.after_request(_refresh_after_write)
@@ -0,0 +1,32 @@
+from sqlalchemy import func, select
+
+from models import db, Collection, File, UserUsage
+from usage import quota_bytes
+
+# Per-user totals computed in one round trip. File count and bytes are read
+# from the trigger-maintained user_usage row; the rest are correlated
+# aggregates over an index that leads with user_id, so the cost grows with
+# the user's own rows, never with the whole table.
+
+
+def user_summary(user):
+    """{file_count, collection_count, total_bytes, quota_bytes, last_activity} for ``user``."""
+    # No usage row yet means the user has never owned a file
+    file_count = func.coalesce(select(UserUsage.file_count).where(UserUsage.user_id == user.id).scalar_subquery(), 0)
+    total_bytes = func.coalesce(select(UserUsage.total_bytes).where(UserUsage.user_id == user.id).scalar_subquery(), 0)
+    last_file = select(func.max(File.created_at)).where(File.user_id == user.id).scalar_subquery()
+    collection_count = select(func.count(Collection.id)).where(Collection.user_id == user.id).scalar_subquery()
+    last_collection = select(func.max(Collection.created_at)).where(Collection.user_id == user.id).scalar_subquery()
+
+    row = db.session.execute(
+        select(file_count, collection_count, total_bytes, last_file, last_collection)
+    ).one()
+    activity = [value for value in (user.created_at, row[3], row[4]) if value is not None]
+    return {
+        "user_id": user.id,
+        "file_count": row[0],
+        "collection_count": row[1],
+        "total_bytes": int(row[2]),
+        "quota_bytes": quota_bytes(),
+        "last_activity": max(activity).isoformat() if activity else None,
+    }
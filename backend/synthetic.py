@@ -0,0 +1,154 @@
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select
+
+from cache import bump_versions
+from models import db, Collection, File, FileTag, User, collection_files
+from tagging import resolve_tags
+
+# Synthetic dataset generator for load tests. Rows go in with executemany
+# Core inserts, one transaction per batch. Tag popularity and files per
+# owner follow Zipf distributions, like real tag clouds and power users.
+# Everything derives from one random.Random(seed) and a fixed clock, so the
+# same arguments on the same starting database give the same rows.
+
+EPOCH = datetime(2025, 1, 1)
+WORDS = (
+    'report', 'invoice', 'budget', 'notes', 'draft', 'summary', 'contract', 'photo', 'scan',
+    'dataset', 'backup', 'plan', 'minutes', 'slides', 'export', 'survey', 'design', 'archive',
+    'quarterly', 'annual', 'client', 'project', 'team', 'research', 'health', 'finance',
+)
+EXTENSIONS = ('pdf', 'txt', 'csv', 'docx', 'xlsx', 'png', 'jpg', 'json', 'md', 'zip')
+
+
+def parse_count(value):
+    """'10k' -> 10000, '1M' -> 1000000."""
+    value = str(value).strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    number = value[:-1] if scale != 1 else value
+    return int(float(number) * scale)
+
+
+def zipf_weights(n, s):
+    """Cumulative weights for ranks 1..n with P(k) proportional to 1 / k**s."""
+    return list(itertools.accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+
+
+def _batches(total, size):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def generate(users, files, tags, collections, seed=42, batch_size=5000,
+             tags_per_file=3, files_per_collection=20, zipf_s=1.1, echo=None):
+    """Append a synthetic dataset; returns the row counts inserted."""
+    rng = random.Random(seed)
+    echo = echo or (lambda message: None)
+    started = time.perf_counter()
+
+    # Users
+    first_user = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    for start, count in _batches(users, batch_size):
+        db.session.execute(insert(User), [
+            {'username': f'synth{seed}-user{first_user + start + i}', 'password': 'x',
+             'created_at': EPOCH + timedelta(minutes=start + i)}
+            for i in range(count)
+        ])
+        db.session.commit()
+    user_ids = list(db.session.scalars(select(User.id).where(User.id >= first_user).order_by(User.id)))
+    echo(f"users: {len(user_ids)}")
+
+    # Tags, most popular first
+    tag_ids = []
+    for start, count in _batches(tags, batch_size):
+        names = [f'synth{seed}-tag{start + i}' for i in range(count)]
+        by_name, _ = resolve_tags(names)
+        db.session.commit()
+        tag_ids.extend(by_name[name].id for name in names)
+    echo(f"tags: {len(tag_ids)}")
+
+    # Files with Zipf-distributed owners and tags
+    owner_weights = zipf_weights(len(user_ids), zipf_s) if user_ids else None
+    tag_weights = zipf_weights(len(tag_ids), zipf_s) if tag_ids else None
+    file_ids = []
+    span = 365 * 24 * 3600
+    for start, count in _batches(files if user_ids else 0, batch_size):
+        owners = rng.choices(user_ids, cum_weights=owner_weights, k=count)
+        rows = []
+        for i, owner in enumerate(owners):
+            words = rng.sample(WORDS, 3)
+            rows.append({
+                'filename': f"{'_'.join(words[:2])}_{start + i}.{rng.choice(EXTENSIONS)}",
+                'description': ' '.join(words),
+                'user_id': owner,
+                'created_at': EPOCH + timedelta(seconds=rng.randrange(span)),
+            })
+        ids = db.session.scalars(
+            insert(File).returning(File.id, sort_by_parameter_order=True), rows
+        ).all()
+        links = []
+        if tag_ids:
+            for file_id, owner in zip(ids, owners):
+                picked = set(rng.choices(tag_ids, cum_weights=tag_weights, k=rng.randint(0, tags_per_file * 2)))
+                links.extend({'file_id': file_id, 'tag_id': tag_id, 'added_by': owner} for tag_id in picked)
+        if links:
+            db.session.execute(insert(FileTag), links)
+        db.session.commit()
+        file_ids.extend(ids)
+        echo(f"files: {len(file_ids)}")
+
+    # Collections holding a random sample of files
+    created_collections = 0
+    for start, count in _batches(collections if user_ids else 0, batch_size):
+        rows = [
+            {'name': f'synth{seed}-collection{start + i}', 'user_id': rng.choice(user_ids),
+             'created_at': EPOCH + timedelta(seconds=rng.randrange(span))}
+            for i in range(count)
+        ]
+        ids = db.session.scalars(
+            insert(Collection).returning(Collection.id, sort_by_parameter_order=True), rows
+        ).all()
+        members = []
+        if file_ids:
+            for collection_id in ids:
+                k = min(len(file_ids), rng.randint(0, files_per_collection * 2))
+                members.extend({'collection_id': collection_id, 'file_id': file_id}
+                               for file_id in rng.sample(file_ids, k))
+        if members:
+            db.session.execute(insert(collection_files), members)
+        db.session.commit()
+        created_collections += len(ids)
+    echo(f"collections: {created_collections}")
+
+    bump_versions('files', 'tags', 'collections')
+    db.session.commit()
+    return {
+        'users': len(user_ids),
+        'tags': len(tag_ids),
+        'files': len(file_ids),
+        'collections': created_collections,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+@click.command('seed')
+@click.option('--users', default='100', help='Number of users (accepts 10k, 1M).')
+@click.option('--files', default='10k', help='Number of files.')
+@click.option('--tags', default='500', help='Number of distinct tags.')
+@click.option('--collections', default='1k', help='Number of collections.')
+@click.option('--seed', 'seed', default=42, show_default=True, help='Random seed.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per insert batch.')
+@click.option('--zipf', 'zipf_s', default=1.1, show_default=True, help='Zipf exponent for tags and owners.')
+@with_appcontext
+def seed_command(users, files, tags, collections, seed, batch_size, zipf_s):
+    """Generate a synthetic dataset with bulk inserts."""
+    counts = generate(
+        parse_count(users), parse_count(files), parse_count(tags), parse_count(collections),
+        seed=seed, batch_size=batch_size, zipf_s=zipf_s, echo=click.echo,
+    )
+    click.echo(f"seeded {counts}")
@@ -0,0 +1,89 @@
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Tag, FileTag, upsert_insert
+
+
+def normalize_tag_names(names):
+    """Strip, drop empties and de-duplicate while keeping first-seen order."""
+    stripped = (str(name).strip() for name in names or [])
+    return list(dict.fromkeys(name for name in stripped if name))
+
+
+def _insert_missing(names):
+    """Insert tags that may not exist yet; returns the names this call created."""
+    insert = upsert_insert(Tag.__table__)
+    if insert is not None:
+        stmt = (
+            insert
+            .values([{'name': name} for name in names])
+            .on_conflict_do_nothing(index_elements=['name'])
+            .returning(Tag.__table__.c.name)
+        )
+        return set(db.session.execute(stmt).scalars())
+
+    # Generic fallback: one savepoint per name so a concurrent insert only
+    # skips that name instead of aborting the surrounding transaction
+    created = set()
+    for name in names:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Tag(name=name))
+            created.add(name)
+        except IntegrityError:
+            pass
+    return created
+
+
+def resolve_tags(names):
+    """Map tag names to Tag rows, creating missing ones in bulk.
+
+    Existing tags are found with a single IN query and missing ones are
+    inserted with ON CONFLICT DO NOTHING, so concurrent writers creating
+    the same tag never trip the tags.name unique constraint. Returns
+    ``(tags_by_name, created_names)``; nothing is committed.
+    """
+    names = normalize_tag_names(names)
+    if not names:
+        return {}, set()
+
+    with db.session.no_autoflush:
+        tags = {t.name: t for t in Tag.query.filter(Tag.name.in_(names))}
+    missing = [name for name in names if name not in tags]
+    created = set()
+    if missing:
+        created = _insert_missing(missing)
+        with db.session.no_autoflush:
+            tags.update({t.name: t for t in Tag.query.filter(Tag.name.in_(missing))})
+    return tags, created
+
+
+def tag_items(tags_with_meta=None, names=None):
+    """(name, added_by) pairs from a tags_with_meta list or plain names.
+
+    Blank names are dropped and repeats keep their first entry, since a
+    repeated name would collide on the file_tags primary key.
+    """
+    if tags_with_meta is not None:
+        items = [((item.get('name') or '').strip(), item.get('added_by'))
+                 for item in tags_with_meta if isinstance(item, dict)]
+    else:
+        items = [(str(name).strip(), None) for name in names or []]
+    unique = {}
+    for name, added_by in items:
+        if name and name not in unique:
+            unique[name] = added_by
+    return list(unique.items())
+
+
+def set_file_tags(file, tags_with_meta=None, names=None):
+    """Replace a file's tag links from a tags_with_meta list or plain names.
+
+    All names are resolved in one batch. Autoflush stays off while the new
+    links are wired up so half-built FileTag rows are never flushed.
+    """
+    items = tag_items(tags_with_meta, names)
+    tags, _ = resolve_tags([name for name, _ in items])
+    with db.session.no_autoflush:
+        links = [FileTag(tag=tags[name], added_by=added_by) for name, added_by in items]
+        file.tag_links = links
+    return links
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+# Read when config is first imported. Background passes that write are left
+# off so they never hold the database lock during a test.
+os.environ['STORAGE_BACKEND'] = 'memory'
+os.environ['PROCESSING_EXECUTOR'] = 'off'
+os.environ['CHANGES_COMPACT_INTERVAL'] = '0'
+os.environ['BLOB_SWEEP_INTERVAL'] = '0'
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    """An app on its own throwaway SQLite database, one per test module."""
+    from app import create_app
+    from config import Config
+    from database import init_db
+
+    workdir = tmp_path_factory.mktemp('datahub')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{workdir / 'test.db'}")
+        app = create_app()
+    app.instance_path = str(workdir)
+    with app.app_context():
+        init_db()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    app.extensions['response_cache'].clear()
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def user(app):
+    """A new user for the test; returns its id."""
+    from models import db, User
+
+    with app.app_context():
+        count = db.session.query(User).count()
+        user = User(username=f'user{count}', password='x')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
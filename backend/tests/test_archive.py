@@ -0,0 +1,77 @@
+"""GET /collections/<id>/archive streams a valid ZIP of the member files."""
+import io
+import zipfile
+
+import pytest
+
+TEXT = b'plain text compresses well\n' * 200
+IMAGE = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 8
+
+
+def _upload(client, user_id, name, data):
+    response = client.post(
+        '/api/files', data={'user_id': str(user_id), 'file': (io.BytesIO(data), name)},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+@pytest.fixture
+def collection(client, user):
+    file_ids = [
+        _upload(client, user, 'notes.txt', TEXT),
+        _upload(client, user, 'photo.png', IMAGE),
+        _upload(client, user, 'notes.txt', b'same name, other bytes'),
+        # Metadata only: nothing to put in the archive
+        client.post('/api/files', json={'user_id': user, 'filename': 'remote.txt'}).get_json()['id'],
+    ]
+    response = client.post('/api/collections', json={'name': 'Field trip', 'user_id': user, 'file_ids': file_ids})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def _open_zip(response):
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="Field_trip.zip"'
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    assert archive.testzip() is None
+    return archive
+
+
+def test_deflated_archive(client, collection):
+    response = client.get(f'/api/collections/{collection}/archive')
+    # Deflated sizes are only known once streamed
+    assert 'Content-Length' not in response.headers
+    archive = _open_zip(response)
+    assert archive.namelist() == ['notes.txt', 'photo.png', 'notes (2).txt']
+    assert archive.read('notes.txt') == TEXT
+    assert archive.read('photo.png') == IMAGE
+    assert archive.read('notes (2).txt') == b'same name, other bytes'
+    methods = {info.filename: info.compress_type for info in archive.infolist()}
+    # Already-compressed formats are stored as they are
+    assert methods == {
+        'notes.txt': zipfile.ZIP_DEFLATED, 'photo.png': zipfile.ZIP_STORED, 'notes (2).txt': zipfile.ZIP_DEFLATED,
+    }
+    assert archive.getinfo('notes.txt').compress_size < len(TEXT)
+
+
+def test_stored_archive_has_content_length(client, collection):
+    response = client.get(f'/api/collections/{collection}/archive?compress=0')
+    assert response.headers['Content-Length'] == str(len(response.data))
+    archive = _open_zip(response)
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    assert archive.read('notes.txt') == TEXT
+    assert archive.read('photo.png') == IMAGE
+
+
+def test_empty_collection(client, user):
+    col = client.post('/api/collections', json={'name': 'Field trip', 'user_id': user}).get_json()['id']
+    response = client.get(f'/api/collections/{col}/archive?compress=0')
+    assert response.headers['Content-Length'] == str(len(response.data))
+    assert _open_zip(response).namelist() == []
+
+
+def test_missing_collection(client):
+    assert client.get('/api/collections/999999/archive').status_code == 404
@@ -0,0 +1,66 @@
+"""Uploads are stored once per content hash and reference counted."""
+import hashlib
+import io
+
+from models import db, Blob
+from storage import blob_key, blob_store
+
+
+def _upload(client, user_id, name, data):
+    return client.post(
+        '/api/files', data={'user_id': str(user_id), 'file': (io.BytesIO(data), name)},
+        content_type='multipart/form-data',
+    )
+
+
+def _ref_count(app, digest):
+    with app.app_context():
+        blob = db.session.get(Blob, digest)
+        return None if blob is None else blob.ref_count
+
+
+def test_equal_bytes_share_one_blob(app, client, user):
+    data = b'shared bytes\n' * 100
+    digest = hashlib.sha256(data).hexdigest()
+    first = _upload(client, user, 'a.txt', data)
+    second = _upload(client, user, 'b.txt', data)
+    assert first.status_code == second.status_code == 201
+    a, b = first.get_json(), second.get_json()
+    assert a['id'] != b['id']
+    assert a['blob_sha256'] == b['blob_sha256'] == digest
+    assert a['path'] == b['path'] == blob_key(digest)
+    assert (a['filename'], b['filename']) == ('a.txt', 'b.txt')
+    assert _ref_count(app, digest) == 2
+    with app.app_context():
+        assert [key for key, _ in blob_store().iter_keys()].count(blob_key(digest)) == 1
+
+    assert client.get(f"/api/files/{b['id']}/content").data == data
+
+
+def test_deletes_release_references(app, client, user):
+    data = b'released one file at a time'
+    digest = hashlib.sha256(data).hexdigest()
+    ids = [_upload(client, user, f'{n}.txt', data).get_json()['id'] for n in range(3)]
+    assert _ref_count(app, digest) == 3
+
+    assert client.delete(f'/api/files/{ids[0]}').status_code == 204
+    assert _ref_count(app, digest) == 2
+    response = client.post('/api/files/bulk-delete', json={'file_ids': ids[1:]})
+    assert response.status_code == 200
+    assert response.get_json() == {'deleted': 2}
+    # The row stays at zero until the sweeper reclaims it
+    assert _ref_count(app, digest) == 0
+
+    again = _upload(client, user, 'again.txt', data)
+    assert again.status_code == 201
+    assert _ref_count(app, digest) == 1
+    assert client.get(f"/api/files/{again.get_json()['id']}/content").data == data
+
+
+def test_different_bytes_get_their_own_blob(app, client, user):
+    a = _upload(client, user, 'same-name.txt', b'one').get_json()
+    b = _upload(client, user, 'same-name.txt', b'two').get_json()
+    assert a['blob_sha256'] != b['blob_sha256']
+    assert _ref_count(app, a['blob_sha256']) == _ref_count(app, b['blob_sha256']) == 1
+    assert client.get(f"/api/files/{a['id']}/content").data == b'one'
+    assert client.get(f"/api/files/{b['id']}/content").data == b'two'
@@ -0,0 +1,124 @@
+"""GET /changes: cursors, one entry per resource, and compaction's 410 horizon."""
+import time
+
+from changes import compact_changes
+from models import db
+
+
+def _cursor(client):
+    response = client.get('/api/changes')
+    assert response.status_code == 200
+    assert response.get_json()['changes'] == []
+    return response.get_json()['next_cursor']
+
+
+def _since(client, cursor, **params):
+    response = client.get('/api/changes', query_string={'since': cursor, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _create_file(client, user_id, name, **extra):
+    response = client.post('/api/files', json={'user_id': user_id, 'filename': name, **extra})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def test_feed_follows_writes(client, user):
+    start = _cursor(client)
+    file_id = _create_file(client, user, 'feed.txt', tags=['feed-tag'])
+    page = _since(client, start)
+    assert page['has_more'] is False
+    by_type = {entry['type']: entry for entry in page['changes']}
+    assert by_type['file']['id'] == file_id
+    assert by_type['file']['op'] == 'upsert'
+    assert by_type['file']['data']['filename'] == 'feed.txt'
+    assert by_type['tag']['data']['name'] == 'feed-tag'
+
+    after_create = page['next_cursor']
+    assert _since(client, after_create) == {'changes': [], 'next_cursor': after_create, 'has_more': False}
+
+    client.patch(f'/api/files/{file_id}', json={'description': 'edited'})
+    page = _since(client, after_create, types='file')
+    assert [(e['type'], e['id'], e['op']) for e in page['changes']] == [('file', file_id, 'upsert')]
+    assert page['changes'][0]['data']['description'] == 'edited'
+
+    # Updated then deleted within one page: only the tombstone is reported
+    assert client.delete(f'/api/files/{file_id}').status_code == 204
+    page = _since(client, after_create, types='file')
+    assert page['changes'] == [{'type': 'file', 'id': file_id, 'op': 'delete'}]
+
+
+def test_paging(client, user):
+    start = _cursor(client)
+    created = [_create_file(client, user, f'page-{n}.txt') for n in range(5)]
+    seen = []
+    cursor = start
+    while True:
+        page = _since(client, cursor, types='file', limit=2)
+        assert len(page['changes']) <= 2
+        seen.extend(entry['id'] for entry in page['changes'])
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            break
+    assert seen == created
+
+
+def test_bad_requests(client):
+    for cursor in ('abc', '-1', '3.x', '.5'):
+        assert client.get('/api/changes', query_string={'since': cursor}).status_code == 400
+    response = client.get('/api/changes?since=0&types=file,widget')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'unknown types: widget'}
+
+
+def test_compaction_and_horizon(app, client, user):
+    kept = _create_file(client, user, 'kept.txt')
+    for n in range(3):
+        client.patch(f'/api/files/{kept}', json={'description': f'v{n}'})
+    old_cursor = _since(client, 0)['next_cursor']
+    gone = _create_file(client, user, 'gone.txt')
+    assert client.delete(f'/api/files/{gone}').status_code == 204
+    before = _since(client, 0, limit=200)
+
+    time.sleep(0.01)
+    with app.app_context():
+        removed = compact_changes(batch_size=1000, retention_seconds=0)
+        db.session.commit()
+    assert removed > 0
+
+    # since=0 is still a full snapshot, one entry per live resource
+    after = _since(client, 0, limit=200)
+    assert [e for e in after['changes'] if e['op'] == 'upsert'] == \
+        [e for e in before['changes'] if e['op'] == 'upsert']
+    assert {'type': 'file', 'id': gone, 'op': 'delete'} not in after['changes']
+    kept_entries = [e for e in after['changes'] if e['type'] == 'file' and e['id'] == kept]
+    assert len(kept_entries) == 1
+    assert kept_entries[0]['data']['description'] == 'v2'
+
+    # A cursor from before the dropped tombstone may have missed that delete
+    expired = client.get('/api/changes', query_string={'since': old_cursor})
+    assert expired.status_code == 410
+    assert expired.get_json() == {'error': 'cursor expired; resync with since=0'}
+    assert _since(client, after['next_cursor'])['changes'] == []
+
+    # Paging the snapshot hands out cursors below the horizon; they keep working
+    cursor, paged = '0', []
+    while True:
+        page = _since(client, cursor, limit=1)
+        paged.extend(page['changes'])
+        cursor = page['next_cursor']
+        if not page['has_more']:
+            break
+    assert paged == after['changes']
+    assert cursor == after['next_cursor']
+
+    # Until compaction drops another tombstone after them
+    mid_snapshot = _since(client, 0, limit=1)['next_cursor']
+    gone_too = _create_file(client, user, 'gone-too.txt')
+    client.delete(f'/api/files/{gone_too}')
+    time.sleep(0.01)
+    with app.app_context():
+        compact_changes(batch_size=1000, retention_seconds=0)
+        db.session.commit()
+    assert client.get('/api/changes', query_string={'since': mid_snapshot}).status_code == 410
@@ -0,0 +1,108 @@
+"""Deleting files releases blobs; the sweeper reclaims what nothing refers to."""
+import io
+import time
+
+import cleanup
+import routes
+from cleanup import sweep_blobs
+from models import db, Blob
+from storage import blob_key, blob_store
+
+
+def _upload(client, user_id, name, data):
+    response = client.post(
+        '/api/files', data={'user_id': str(user_id), 'file': (io.BytesIO(data), name)},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def _sweep(app, grace_seconds=0):
+    time.sleep(0.01)
+    with app.app_context():
+        return sweep_blobs(blob_store(), batch_size=2, grace_seconds=grace_seconds)
+
+
+def _state(app, digest):
+    """(blob row ref_count or None, bytes still stored)."""
+    with app.app_context():
+        blob = db.session.get(Blob, digest)
+        return (None if blob is None else blob.ref_count), blob_store().exists(blob_key(digest))
+
+
+def test_sweep_reclaims_released_blobs(app, client, user):
+    only = _upload(client, user, 'only.txt', b'referenced once')
+    shared = _upload(client, user, 'shared.txt', b'referenced twice')
+    _upload(client, user, 'copy.txt', b'referenced twice')
+
+    assert client.delete(f"/api/files/{only['id']}").status_code == 204
+    assert client.delete(f"/api/files/{shared['id']}").status_code == 204
+    assert _state(app, only['blob_sha256']) == (0, True)
+
+    counts = _sweep(app)
+    assert counts['blobs'] >= 1
+    assert _state(app, only['blob_sha256']) == (None, False)
+    assert _state(app, shared['blob_sha256']) == (1, True)
+
+
+def test_grace_period_keeps_recent_blobs(app, client, user):
+    recent = _upload(client, user, 'recent.txt', b'deleted just now')
+    client.delete(f"/api/files/{recent['id']}")
+    assert _sweep(app, grace_seconds=3600)['blobs'] == 0
+    assert _state(app, recent['blob_sha256']) == (0, True)
+
+
+def test_orphaned_bytes_are_removed(app):
+    with app.app_context():
+        store = blob_store()
+        # Bytes stored by an upload whose transaction never committed
+        digest, _, key = store.put_stream(io.BytesIO(b'no row for me'))
+    assert _sweep(app)['orphans'] == 1
+    assert _state(app, digest) == (None, False)
+
+
+def test_blob_reused_during_sweep_is_kept(app, client, user, monkeypatch):
+    reused = _upload(client, user, 'reused.txt', b'acquired again mid-sweep')
+    client.delete(f"/api/files/{reused['id']}")
+    key = blob_key(reused['blob_sha256'])
+    checks = []
+    idle = cleanup._idle
+
+    def touched_after_first_check(store, checked_key, cutoff):
+        # An upload of the same bytes touches the blob between the sweeper's
+        # candidate scan and its delete
+        if checked_key == key:
+            checks.append(checked_key)
+            return len(checks) == 1
+        return idle(store, checked_key, cutoff)
+
+    monkeypatch.setattr(cleanup, '_idle', touched_after_first_check)
+    _sweep(app)
+    assert len(checks) == 2
+    assert _state(app, reused['blob_sha256']) == (0, True)
+
+    again = _upload(client, user, 'again.txt', b'acquired again mid-sweep')
+    assert _state(app, reused['blob_sha256']) == (1, True)
+    assert client.get(f"/api/files/{again['id']}/content").data == b'acquired again mid-sweep'
+
+
+def test_deletes_request_a_sweep(client, user, monkeypatch):
+    calls = []
+    monkeypatch.setattr(routes, 'request_sweep', lambda: calls.append(True))
+    single = _upload(client, user, 'single.txt', b'single delete')
+    bulk = _upload(client, user, 'bulk.txt', b'bulk delete')
+    assert client.delete(f"/api/files/{single['id']}").status_code == 204
+    assert len(calls) == 1
+    assert client.post('/api/files/bulk-delete', json={'file_ids': [bulk['id']]}).get_json() == {'deleted': 1}
+    assert len(calls) == 2
+
+
+def test_sweep_command(app, client, user):
+    doomed = _upload(client, user, 'doomed.txt', b'swept from the CLI')
+    client.delete(f"/api/files/{doomed['id']}")
+    time.sleep(0.01)
+    result = app.test_cli_runner().invoke(args=['sweep-blobs', '--grace', '0'])
+    assert result.exit_code == 0
+    assert result.output.startswith('removed {')
+    assert _state(app, doomed['blob_sha256']) == (None, False)
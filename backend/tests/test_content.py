@@ -0,0 +1,92 @@
+"""GET /files/<id>/content honours Range and conditional headers on every store."""
+import hashlib
+import io
+
+import pytest
+
+from storage import LocalStore, MemoryStore
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture(params=['memory', 'local'])
+def stored(request, app, client, user, tmp_path):
+    """A file uploaded to a store of each kind: (id, etag)."""
+    # A remote store (memory) streams ranged reads; a local one hands send_file a path
+    store = MemoryStore() if request.param == 'memory' else LocalStore(str(tmp_path))
+    previous = app.extensions.get('blob_store')
+    app.extensions['blob_store'] = store
+    response = client.post(
+        '/api/files', data={'user_id': str(user), 'file': (io.BytesIO(DATA), 'bytes.bin')},
+        content_type='multipart/form-data',
+    )
+    assert response.status_code == 201
+    yield response.get_json()['id'], f'"{hashlib.sha256(DATA).hexdigest()}"'
+    app.extensions['blob_store'] = previous
+
+
+def test_full_download(client, stored):
+    file_id, etag = stored
+    response = client.get(f'/api/files/{file_id}/content')
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers['ETag'] == etag
+    assert response.headers['Content-Length'] == str(len(DATA))
+
+
+@pytest.mark.parametrize('header, start, end', [
+    ('bytes=10-19', 10, 19),
+    ('bytes=1000-', 1000, len(DATA) - 1),
+    ('bytes=-24', len(DATA) - 24, len(DATA) - 1),
+    ('bytes=1020-5000', 1020, len(DATA) - 1),
+])
+def test_range(client, stored, header, start, end):
+    file_id, _ = stored
+    response = client.get(f'/api/files/{file_id}/content', headers={'Range': header})
+    assert response.status_code == 206
+    assert response.data == DATA[start:end + 1]
+    assert response.headers['Content-Range'] == f'bytes {start}-{end}/{len(DATA)}'
+    assert response.headers['Content-Length'] == str(end + 1 - start)
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_unsatisfiable_range(client, stored):
+    file_id, _ = stored
+    response = client.get(f'/api/files/{file_id}/content', headers={'Range': f'bytes={len(DATA)}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(DATA)}'
+
+
+def test_if_none_match(client, stored):
+    file_id, etag = stored
+    response = client.get(f'/api/files/{file_id}/content', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    stale = client.get(f'/api/files/{file_id}/content', headers={'If-None-Match': '"something-else"'})
+    assert stale.status_code == 200
+    assert stale.data == DATA
+
+
+def test_if_range(client, stored):
+    file_id, etag = stored
+    headers = {'Range': 'bytes=0-9'}
+    current = client.get(f'/api/files/{file_id}/content', headers={**headers, 'If-Range': etag})
+    assert current.status_code == 206
+    assert current.data == DATA[:10]
+    # The client's copy is out of date: send the whole thing
+    changed = client.get(f'/api/files/{file_id}/content', headers={**headers, 'If-Range': '"old"'})
+    assert changed.status_code == 200
+    assert changed.data == DATA
+
+
+def test_download_disposition(client, stored):
+    file_id, _ = stored
+    response = client.get(f'/api/files/{file_id}/content?download=1')
+    assert response.headers['Content-Disposition'] == 'attachment; filename=bytes.bin'
+
+
+def test_metadata_only_file_has_no_content(client, user):
+    created = client.post('/api/files', json={'user_id': user, 'filename': 'remote.txt'})
+    response = client.get(f"/api/files/{created.get_json()['id']}/content")
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'file has no stored content'}
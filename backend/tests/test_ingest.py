@@ -0,0 +1,71 @@
+"""POST /files/bulk: NDJSON ingest reports each bad line and keeps the rest."""
+import json
+
+from sqlalchemy import select
+
+from models import db, File
+
+
+def _ndjson(*records):
+    return '\n'.join(record if isinstance(record, str) else json.dumps(record) for record in records) + '\n'
+
+
+def _post(client, body, **params):
+    return client.post('/api/files/bulk', data=body, query_string=params, content_type='application/x-ndjson')
+
+
+def _filenames(app, user_id):
+    with app.app_context():
+        return sorted(db.session.scalars(select(File.filename).where(File.user_id == user_id)))
+
+
+def test_valid_records_are_inserted(app, client, user):
+    body = _ndjson(
+        {'filename': 'a.csv', 'user_id': user, 'tags': ['ingest-a', 'ingest-b']},
+        '',
+        {'filename': 'b.csv', 'user_id': user, 'tags': 'ingest-a', 'description': 'second'},
+        {'filename': 'c.csv', 'user_id': str(user), 'url': 'https://example.com/c.csv',
+         'tags_with_meta': [{'name': 'ingest-c', 'added_by': 'loader'}]},
+    )
+    response = _post(client, body, batch_size=2)
+    assert response.status_code == 201
+    assert response.get_json() == {'inserted': 3, 'failed': 0, 'errors': []}
+    assert _filenames(app, user) == ['a.csv', 'b.csv', 'c.csv']
+
+    files = client.get('/api/files?tags=ingest-a').get_json()
+    assert sorted(f['filename'] for f in files['items']) == ['a.csv', 'b.csv']
+
+
+def test_bad_lines_are_reported(app, client, user):
+    body = _ndjson(
+        {'filename': 'ok-1.csv', 'user_id': user},
+        '{not json',
+        '[1, 2]',
+        {'user_id': user},
+        {'filename': 'no-owner.csv'},
+        {'filename': 'ghost.csv', 'user_id': 999999},
+        {'filename': 'ok-2.csv', 'user_id': user},
+    )
+    response = _post(client, body, batch_size=3)
+    assert response.status_code == 201
+    report = response.get_json()
+    assert report['inserted'] == 2
+    assert report['failed'] == 5
+    errors = {error['line']: error['error'] for error in report['errors']}
+    assert errors[2].startswith('invalid JSON')
+    assert errors[3] == 'record must be a JSON object'
+    assert errors[4] == 'filename is required'
+    assert errors[5] == 'user_id is required'
+    assert errors[6] == 'unknown user_id'
+    assert _filenames(app, user) == ['ok-1.csv', 'ok-2.csv']
+
+
+def test_nothing_inserted_is_a_bad_request(client):
+    response = _post(client, _ndjson('nope', {'filename': 'x.csv'}))
+    assert response.status_code == 400
+    assert response.get_json()['inserted'] == 0
+    assert [error['line'] for error in response.get_json()['errors']] == [1, 2]
+
+    empty = _post(client, '')
+    assert empty.status_code == 400
+    assert empty.get_json() == {'inserted': 0, 'failed': 0, 'errors': []}
@@ -0,0 +1,82 @@
+"""Every API endpoint runs a fixed number of SQL queries at any data size.
+
+The database is grown through SIZES in turn; at each size every endpoint is
+called with the response cache cleared and the per-request query count
+recorded by querystats is checked against its budget. Reads must also run
+the same number of queries at every size.
+"""
+import pytest
+from flask import g
+from sqlalchemy import func, select
+
+from models import db, Collection, File, User
+from synthetic import generate
+
+SIZES = (10, 200, 2000)
+TAG_COUNT = 50
+SEED = 42
+
+# (method, path, json body, max queries)
+BUDGETS = {
+    'list users': ('GET', '/api/users', None, 1),
+    'user summary': ('GET', '/api/users/1/summary', None, 3),
+    'user files': ('GET', '/api/users/1/files', None, 5),
+    'user collections': ('GET', '/api/users/1/collections', None, 3),
+    'list tags': ('GET', '/api/tags', None, 2),
+    'tag facets': ('GET', '/api/tags/facets', None, 2),
+    # One query while the prefix index is cold, none once it is loaded
+    'suggest tags': ('GET', '/api/tags/suggest?prefix=SYNTH42-TAG1', None, 1),
+    'tag facets drill-down': ('GET', '/api/tags/facets?tags=synth42-tag1', None, 3),
+    'list files': ('GET', '/api/files', None, 4),
+    'list files by tags': ('GET', '/api/files?tags=synth42-tag1,synth42-tag2&match=any', None, 5),
+    'list files sparse': ('GET', '/api/files?fields=id,filename', None, 2),
+    'get file': ('GET', '/api/files/1', None, 3),
+    'search': ('GET', '/api/search?q=file', None, 5),
+    'list collections': ('GET', '/api/collections', None, 2),
+    'get collection': ('GET', '/api/collections/1', None, 1),
+    'collection files': ('GET', '/api/collections/1/files', None, 5),
+    'changes': ('GET', '/api/changes?since=0&types=file', None, 4),
+    'create file': ('POST', '/api/files', {'filename': 'new.txt', 'user_id': 1, 'tags': ['synth42-tag1', 'new']}, 11),
+    'update file': ('PATCH', '/api/files/1', {'description': 'changed', 'tags': ['synth42-tag2', 'synth42-tag3']}, 12),
+    'create tag': ('POST', '/api/tags', {'name': 'synth42-tag1'}, 3),
+    'add collection files': ('POST', '/api/collections/1/files', {'file_ids': [1, 2, 3]}, 4),
+    'remove collection files': ('DELETE', '/api/collections/1/files', {'file_ids': [2, 3]}, 4),
+    'bulk delete files': ('POST', '/api/files/bulk-delete', {'file_ids': [5, 6]}, 10),
+}
+
+
+def _count(model):
+    return db.session.scalar(select(func.count()).select_from(model))
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda size: f'{size}files')
+def seeded(request, app):
+    """Grow the database to ``size`` files with size // 10 users and collections."""
+    size = request.param
+    with app.app_context():
+        users = max(size // 10, 1)
+        generate(
+            users - _count(User), size - _count(File), TAG_COUNT, users - _count(Collection),
+            seed=SEED,
+        )
+    return size
+
+
+# Query count of each read at the first size measured
+read_counts = {}
+
+
+@pytest.mark.parametrize('name', BUDGETS)
+def test_query_budget(app, seeded, name):
+    method, path, body, budget = BUDGETS[name]
+    app.extensions['response_cache'].clear()
+    with app.test_client() as client:
+        response = client.open(path, method=method, json=body)
+        count = g.query_stats.count
+        statements = [' '.join(statement.split())[:200] for _, statement in g.query_stats.top()]
+    assert response.status_code < 400, f'{method} {path} returned {response.status_code}'
+    assert count <= budget, f'{count} queries, budget {budget}: {statements}'
+    # Writes may legitimately differ between sizes (new tags, no-op adds)
+    if method == 'GET':
+        expected = read_counts.setdefault(name, count)
+        assert count == expected, f'{count} queries at {seeded} files, {expected} at a smaller size'
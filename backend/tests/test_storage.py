@@ -0,0 +1,167 @@
+"""The blob store backends behave the same: memory, local disk and S3 (moto)."""
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+from storage import S3_MIN_PART_SIZE, LocalStore, MemoryStore, S3Store, blob_key
+
+BUCKET = 'datahub-test'
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip('moto')
+    for name, value in (('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'),
+                        ('AWS_DEFAULT_REGION', 'us-east-1')):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        store = S3Store(BUCKET, prefix='blobs', region='us-east-1', part_size=S3_MIN_PART_SIZE, concurrency=2)
+        store.client.create_bucket(Bucket=BUCKET)
+        yield store
+
+
+@pytest.fixture(params=['memory', 'local', 's3'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStore()
+    if request.param == 'local':
+        return LocalStore(str(tmp_path / 'uploads'), buffer_size=4096)
+    return request.getfixturevalue('s3')
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read(store, key, start=0, length=None):
+    with store.open_range(key, start, length) as src:
+        return src.read()
+
+
+def test_put_stream_is_content_addressed(store):
+    data = b'hello blob store\n' * 1000
+    digest, size, key = store.put_stream(io.BytesIO(data))
+    assert (digest, size, key) == (_digest(data), len(data), blob_key(_digest(data)))
+    assert store.exists(key)
+    assert store.stat(key).size == len(data)
+    assert _read(store, key) == data
+
+
+def test_open_range(store):
+    data = bytes(range(256)) * 64
+    _, _, key = store.put_stream(io.BytesIO(data))
+    assert _read(store, key, 100, 50) == data[100:150]
+    assert _read(store, key, len(data) - 10) == data[-10:]
+    assert _read(store, key, 0, 1) == data[:1]
+
+
+def test_put_file_moves_the_file_in(store, tmp_path):
+    data = b'from disk' * 500
+    for _ in range(2):
+        path = tmp_path / 'upload.part'
+        path.write_bytes(data)
+        digest, size, key = store.put_file(str(path))
+        assert not path.exists()
+    assert (digest, size) == (_digest(data), len(data))
+    assert _read(store, key) == data
+    assert [k for k, _ in store.iter_keys()] == [key]
+
+
+def test_duplicate_put_stores_one_copy(store):
+    first = store.put_stream(io.BytesIO(b'same bytes'))
+    second = store.put_stream(io.BytesIO(b'same bytes'))
+    assert first == second
+    assert [key for key, _ in store.iter_keys()] == [first[2]]
+
+
+def test_missing_blob(store):
+    key = blob_key(_digest(b'never stored'))
+    assert store.stat(key) is None
+    assert not store.exists(key)
+    store.delete(key)
+
+
+def test_delete(store):
+    _, _, key = store.put_stream(io.BytesIO(b'short-lived'))
+    store.delete(key)
+    assert not store.exists(key)
+    assert list(store.iter_keys()) == []
+
+
+def test_touch_bumps_mtime(store):
+    _, _, key = store.put_stream(io.BytesIO(b'touch me'))
+    before = store.stat(key).mtime
+    # S3 LastModified has one-second resolution
+    time.sleep(1.1)
+    store.touch(key)
+    assert store.stat(key).mtime > before
+    assert _read(store, key) == b'touch me'
+
+
+def test_local_copy(store):
+    data = b'needs a real file' * 100
+    _, _, key = store.put_stream(io.BytesIO(data))
+    with store.local_copy(key) as path:
+        with open(path, 'rb') as src:
+            assert src.read() == data
+    if store.local_path(key) is None:
+        assert not os.path.exists(path)
+
+
+def test_local_cleanup_tmp(tmp_path):
+    store = LocalStore(str(tmp_path))
+    store.put_stream(io.BytesIO(b'kept'))
+    tmp_dir = tmp_path / 'tmp'
+    stale, fresh = tmp_dir / 'stale', tmp_dir / 'fresh'
+    stale.write_bytes(b'abandoned')
+    fresh.write_bytes(b'in progress')
+    os.utime(stale, (time.time() - 3600,) * 2)
+    assert store.cleanup_tmp(time.time() - 60) == 1
+    assert not stale.exists() and fresh.exists()
+    assert len(list(store.iter_keys())) == 1
+
+
+def test_s3_multipart_put_stream(s3):
+    # Three parts, the last one short; the object ends up at its content key
+    data = os.urandom(2 * S3_MIN_PART_SIZE + 12345)
+    digest, size, key = s3.put_stream(io.BytesIO(data))
+    assert (digest, size, key) == (_digest(data), len(data), blob_key(_digest(data)))
+    assert _read(s3, key, S3_MIN_PART_SIZE - 10, 20) == data[S3_MIN_PART_SIZE - 10:S3_MIN_PART_SIZE + 10]
+    assert _read(s3, key) == data
+    listed = s3.client.list_objects_v2(Bucket=BUCKET)['Contents']
+    assert [obj['Key'] for obj in listed] == [f'blobs/{key}']
+    assert not s3.client.list_multipart_uploads(Bucket=BUCKET).get('Uploads')
+
+
+def test_s3_multipart_failure_aborts(s3):
+    class Broken(io.RawIOBase):
+        def __init__(self):
+            self.sent = 0
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            if self.sent > S3_MIN_PART_SIZE:
+                raise OSError('client went away')
+            n = len(buffer)
+            buffer[:n] = b'x' * n
+            self.sent += n
+            return n
+
+    with pytest.raises(OSError):
+        s3.put_stream(io.BufferedReader(Broken()))
+    assert not s3.client.list_multipart_uploads(Bucket=BUCKET).get('Uploads')
+    assert list(s3.iter_keys()) == []
+
+
+def test_s3_cleanup_tmp(s3):
+    s3.client.create_multipart_upload(Bucket=BUCKET, Key='blobs/tmp/abandoned')
+    s3.client.put_object(Bucket=BUCKET, Key='blobs/tmp/leftover', Body=b'x')
+    _, _, key = s3.put_stream(io.BytesIO(b'kept'))
+    assert s3.cleanup_tmp(time.time() + 60) == 2
+    assert not s3.client.list_multipart_uploads(Bucket=BUCKET).get('Uploads')
+    assert [obj['Key'] for obj in s3.client.list_objects_v2(Bucket=BUCKET)['Contents']] == [f'blobs/{key}']
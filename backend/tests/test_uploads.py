@@ -0,0 +1,93 @@
+"""Resumable uploads: chunks in any order, resume from the session, then complete."""
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+from models import db, UploadSession
+from storage import upload_root
+from uploads import part_path
+
+CHUNK = 1000
+DATA = bytes(range(256)) * 10 + b'tail'  # 2564 bytes: two full chunks and a short one
+
+
+def _open(client, user_id, **extra):
+    body = {'user_id': user_id, 'filename': 'big.bin', 'size': len(DATA), 'chunk_size': CHUNK, **extra}
+    response = client.post('/api/uploads', json=body)
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def _put(client, session_id, index, data=None):
+    if data is None:
+        data = DATA[index * CHUNK:(index + 1) * CHUNK]
+    return client.put(f'/api/uploads/{session_id}/chunks/{index}', data=data)
+
+
+def test_resume_and_complete(app, client, user):
+    session = _open(client, user, tags=['raw', 'scans'], description='chunked')
+    assert session['total_chunks'] == 3
+    assert session['received'] == []
+
+    # Out of order, with one chunk re-sent
+    for index in (2, 0, 2):
+        assert _put(client, session['id'], index).status_code == 200
+
+    # A client that lost track asks what arrived and sends only the rest
+    resumed = client.get(f"/api/uploads/{session['id']}")
+    assert resumed.status_code == 200
+    assert resumed.get_json()['received'] == [0, 2]
+
+    early = client.post(f"/api/uploads/{session['id']}/complete")
+    assert early.status_code == 409
+    assert early.get_json() == {'error': 'upload incomplete', 'missing': [1]}
+
+    assert _put(client, session['id'], 1).status_code == 200
+    done = client.post(f"/api/uploads/{session['id']}/complete")
+    assert done.status_code == 201
+    body = done.get_json()
+    assert body['filename'] == 'big.bin'
+    assert body['description'] == 'chunked'
+    assert body['size_bytes'] == len(DATA)
+    assert body['blob_sha256'] == hashlib.sha256(DATA).hexdigest()
+    assert sorted(tag['name'] for tag in body['tags']) == ['raw', 'scans']
+    assert client.get(f"/api/files/{body['id']}/content").data == DATA
+
+    # The session and its part file are gone once the file exists
+    assert client.get(f"/api/uploads/{session['id']}").status_code == 404
+    with app.app_context():
+        assert not os.path.exists(part_path(upload_root(), session['id']))
+
+
+def test_wrong_sized_chunks_are_refused(client, user):
+    session = _open(client, user)
+    assert _put(client, session['id'], 0, DATA[:CHUNK - 1]).status_code == 400
+    assert _put(client, session['id'], 2, DATA[2 * CHUNK:] + b'x').status_code == 400
+    out_of_range = _put(client, session['id'], 3, b'x')
+    assert out_of_range.status_code == 400
+    assert out_of_range.get_json() == {'error': 'chunk index out of range'}
+    assert client.get(f"/api/uploads/{session['id']}").get_json()['received'] == []
+
+
+def test_bad_session_requests(client, user):
+    assert client.post('/api/uploads', json={'user_id': user, 'filename': 'x.bin'}).status_code == 400
+    assert client.post('/api/uploads', json={'filename': 'x.bin', 'size': 1}).status_code == 400
+    assert client.get('/api/uploads/nosuchsession').status_code == 404
+
+
+def test_abort_drops_the_session(app, client, user):
+    session = _open(client, user)
+    assert _put(client, session['id'], 0).status_code == 200
+    assert client.delete(f"/api/uploads/{session['id']}").status_code == 204
+    assert client.get(f"/api/uploads/{session['id']}").status_code == 404
+    with app.app_context():
+        assert not os.path.exists(part_path(upload_root(), session['id']))
+
+
+def test_expired_session_is_gone(app, client, user):
+    session = _open(client, user)
+    with app.app_context():
+        db.session.get(UploadSession, session['id']).expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+    assert _put(client, session['id'], 0).status_code == 410
+    assert client.get(f"/api/uploads/{session['id']}").status_code == 404
@@ -0,0 +1,106 @@
+"""Per-user usage is kept by triggers; uploads over USER_QUOTA_BYTES get 413."""
+import io
+import json
+
+import pytest
+from sqlalchemy import update
+
+from models import db, File
+
+QUOTA = 1000
+
+
+def _upload(client, user_id, name, data, early=False):
+    return client.post(
+        '/api/files', query_string={'user_id': user_id} if early else None,
+        data={'user_id': str(user_id), 'file': (io.BytesIO(data), name)},
+        content_type='multipart/form-data',
+    )
+
+
+def _summary(app, client, user_id):
+    # Direct database writes in these tests bypass the cache versions
+    app.extensions['response_cache'].clear()
+    response = client.get(f'/api/users/{user_id}/summary')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def _usage(app, client, user_id):
+    summary = _summary(app, client, user_id)
+    return summary['file_count'], summary['total_bytes']
+
+
+@pytest.fixture
+def quota(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'USER_QUOTA_BYTES', QUOTA)
+    return QUOTA
+
+
+def test_triggers_track_files_and_bytes(app, client, user):
+    assert _usage(app, client, user) == (0, 0)
+    first = _upload(client, user, 'a.bin', b'a' * 100).get_json()
+    # Shared bytes still count against each file's owner
+    _upload(client, user, 'b.bin', b'a' * 100)
+    client.post('/api/files', json={'user_id': user, 'filename': 'remote.txt'})
+    assert _usage(app, client, user) == (3, 200)
+
+    ndjson = '\n'.join(json.dumps({'filename': f'bulk-{n}.csv', 'user_id': user}) for n in range(2))
+    client.post('/api/files/bulk', data=ndjson, content_type='application/x-ndjson')
+    assert _usage(app, client, user) == (5, 200)
+
+    assert client.delete(f"/api/files/{first['id']}").status_code == 204
+    assert _usage(app, client, user) == (4, 100)
+
+
+def test_triggers_follow_size_and_owner_changes(app, client, user):
+    other_id = client.post('/api/register', json={'username': 'usage-other', 'password': 'secret'}).get_json()['id']
+    file_id = client.post('/api/files', json={'user_id': user, 'filename': 'late.bin'}).get_json()['id']
+    with app.app_context():
+        # Processing records the size later; ownership can move
+        db.session.execute(update(File).where(File.id == file_id).values(size_bytes=300))
+        db.session.commit()
+    assert _usage(app, client, user) == (1, 300)
+    with app.app_context():
+        db.session.execute(update(File).where(File.id == file_id).values(user_id=other_id))
+        db.session.commit()
+    assert _usage(app, client, user) == (0, 0)
+    assert _usage(app, client, other_id) == (1, 300)
+
+
+def test_upload_over_quota(app, client, user, quota):
+    assert _upload(client, user, 'fits.bin', b'x' * 600).status_code == 201
+    response = _upload(client, user, 'too-much.bin', b'y' * 600)
+    assert response.status_code == 413
+    assert response.get_json() == {'error': 'storage quota exceeded', 'quota_bytes': QUOTA, 'used_bytes': 600}
+    assert _usage(app, client, user) == (1, 600)
+    summary = _summary(app, client, user)
+    assert summary['quota_bytes'] == QUOTA
+
+    # Exactly up to the limit is fine
+    assert _upload(client, user, 'rest.bin', b'z' * 400).status_code == 201
+    assert _usage(app, client, user) == (2, QUOTA)
+
+
+def test_oversized_upload_refused_before_reading(app, client, user, quota):
+    # Past the quota plus multipart slack on Content-Length alone
+    response = _upload(client, user, 'huge.bin', b'h' * (QUOTA + 20 * 1024), early=True)
+    assert response.status_code == 413
+    assert response.get_json()['used_bytes'] == 0
+    assert _usage(app, client, user) == (0, 0)
+
+
+def test_upload_sessions_respect_quota(app, client, user, quota):
+    too_big = client.post('/api/uploads', json={'user_id': user, 'filename': 'big.bin', 'size': QUOTA + 1})
+    assert too_big.status_code == 413
+
+    session = client.post('/api/uploads', json={'user_id': user, 'filename': 'ok.bin', 'size': 600}).get_json()
+    assert client.put(f"/api/uploads/{session['id']}/chunks/0", data=b's' * 600).status_code == 200
+    # Another upload uses the space up before this one completes
+    assert _upload(client, user, 'meanwhile.bin', b'm' * 500).status_code == 201
+    response = client.post(f"/api/uploads/{session['id']}/complete")
+    assert response.status_code == 413
+    assert response.get_json()['used_bytes'] == 500
+    # The session is kept so the client can retry after freeing space
+    assert client.get(f"/api/uploads/{session['id']}").get_json()['received'] == [0]
+    assert _usage(app, client, user) == (1, 500)
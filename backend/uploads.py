@@ -0,0 +1,110 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, UploadSession, UploadChunk, upsert_insert
+from storage import CHUNK_SIZE
+
+
+class ChunkSizeMismatch(ValueError):
+    pass
+
+
+def part_path(root, session_id):
+    return os.path.join(root, 'sessions', f"{session_id}.part")
+
+
+def open_session(root, user_id, filename, size_bytes, chunk_size=None, description=None, tags=None):
+    """Create a session and preallocate its part file at the final size."""
+    config = current_app.config
+    chunk_size = chunk_size or config['UPLOAD_CHUNK_SIZE']
+    chunk_size = max(1, min(int(chunk_size), config['UPLOAD_MAX_CHUNK_SIZE']))
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename,
+        description=description,
+        tags=tags,
+        size_bytes=size_bytes,
+        chunk_size=chunk_size,
+        expires_at=datetime.utcnow() + timedelta(seconds=config['UPLOAD_SESSION_TTL']),
+    )
+    path = part_path(root, session.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        if size_bytes and hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size_bytes)
+        else:
+            os.ftruncate(fd, size_bytes)
+    finally:
+        os.close(fd)
+    db.session.add(session)
+    return session
+
+
+def write_chunk(root, session, index, stream):
+    """Copy one chunk from ``stream`` straight to its offset in the part file.
+
+    Memory use is bounded by CHUNK_SIZE however large the chunk is. Raises
+    ChunkSizeMismatch if the body is not exactly the chunk's length; the
+    chunk is then not recorded and can simply be re-sent.
+    """
+    expected = session.chunk_length(index)
+    offset = index * session.chunk_size
+    written = 0
+    fd = os.open(part_path(root, session.id), os.O_WRONLY)
+    try:
+        while written <= expected:
+            data = stream.read(min(CHUNK_SIZE, expected - written + 1))
+            if not data:
+                break
+            if written + len(data) > expected:
+                raise ChunkSizeMismatch(index)
+            view = memoryview(data)
+            while view:
+                n = os.pwrite(fd, view, offset + written)
+                view = view[n:]
+                written += n
+    finally:
+        os.close(fd)
+    if written != expected:
+        raise ChunkSizeMismatch(index)
+
+    insert = upsert_insert(UploadChunk.__table__)
+    if insert is not None:
+        # Re-sent chunks are idempotent
+        db.session.execute(
+            insert.values(session_id=session.id, chunk_index=index).on_conflict_do_nothing()
+        )
+    else:
+        db.session.merge(UploadChunk(session_id=session.id, chunk_index=index))
+
+
+def received_chunks(session):
+    rows = db.session.query(UploadChunk.chunk_index).filter_by(session_id=session.id)
+    return sorted(index for (index,) in rows)
+
+
+def discard_session(root, session):
+    """Delete a session's rows and part file (the part may already be moved)."""
+    UploadChunk.query.filter_by(session_id=session.id).delete(synchronize_session=False)
+    db.session.delete(session)
+    path = part_path(root, session.id)
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def expire_sessions(root, batch_size=100):
+    """Drop up to ``batch_size`` sessions past their expiry."""
+    expired = (
+        UploadSession.query
+        .filter(UploadSession.expires_at < datetime.utcnow())
+        .limit(batch_size)
+        .all()
+    )
+    for session in expired:
+        discard_session(root, session)
+    return len(expired)
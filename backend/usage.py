@@ -0,0 +1,146 @@
+from flask import current_app
+from sqlalchemy import inspect, select
+
+from models import db, UserUsage
+
+# user_usage holds each owner's file count and stored bytes. Triggers on
+# files keep it current in the same transaction as every insert, delete,
+# owner change and size update, so quota checks and summaries are a
+# primary key read instead of a SUM over the user's files. A file counts
+# its own size even when its bytes are shared with another file's blob.
+
+SQLITE_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS files_usage_ai AFTER INSERT ON files BEGIN "
+    "INSERT INTO user_usage(user_id, file_count, total_bytes) VALUES (new.user_id, 1, coalesce(new.size_bytes, 0)) "
+    "ON CONFLICT(user_id) DO UPDATE SET file_count = file_count + 1, "
+    "total_bytes = total_bytes + excluded.total_bytes; END",
+    "CREATE TRIGGER IF NOT EXISTS files_usage_ad AFTER DELETE ON files BEGIN "
+    "UPDATE user_usage SET file_count = file_count - 1, total_bytes = total_bytes - coalesce(old.size_bytes, 0) "
+    "WHERE user_id = old.user_id; END",
+    "CREATE TRIGGER IF NOT EXISTS files_usage_au AFTER UPDATE OF size_bytes, user_id ON files "
+    "WHEN old.size_bytes IS NOT new.size_bytes OR old.user_id != new.user_id BEGIN "
+    "UPDATE user_usage SET file_count = file_count - 1, total_bytes = total_bytes - coalesce(old.size_bytes, 0) "
+    "WHERE user_id = old.user_id; "
+    "INSERT INTO user_usage(user_id, file_count, total_bytes) VALUES (new.user_id, 1, coalesce(new.size_bytes, 0)) "
+    "ON CONFLICT(user_id) DO UPDATE SET file_count = file_count + 1, "
+    "total_bytes = total_bytes + excluded.total_bytes; END",
+]
+
+POSTGRES_DDL = [
+    """CREATE OR REPLACE FUNCTION files_usage_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            UPDATE user_usage SET file_count = file_count - 1,
+                total_bytes = total_bytes - coalesce(OLD.size_bytes, 0)
+            WHERE user_id = OLD.user_id;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            INSERT INTO user_usage(user_id, file_count, total_bytes)
+            VALUES (NEW.user_id, 1, coalesce(NEW.size_bytes, 0))
+            ON CONFLICT (user_id) DO UPDATE
+            SET file_count = user_usage.file_count + 1,
+                total_bytes = user_usage.total_bytes + EXCLUDED.total_bytes;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS files_usage_aid ON files",
+    "CREATE TRIGGER files_usage_aid AFTER INSERT OR DELETE ON files "
+    "FOR EACH ROW EXECUTE FUNCTION files_usage_trg()",
+    "DROP TRIGGER IF EXISTS files_usage_au ON files",
+    "CREATE TRIGGER files_usage_au AFTER UPDATE OF size_bytes, user_id ON files FOR EACH ROW "
+    "WHEN (OLD.size_bytes IS DISTINCT FROM NEW.size_bytes OR OLD.user_id <> NEW.user_id) "
+    "EXECUTE FUNCTION files_usage_trg()",
+]
+
+# Sizes the processing pipeline has not recorded yet come from the blob,
+# then a recount from scratch; only run when the triggers are first installed
+BACKFILL = [
+    "UPDATE files SET size_bytes = (SELECT size_bytes FROM blobs WHERE blobs.sha256 = files.blob_sha256) "
+    "WHERE size_bytes IS NULL AND blob_sha256 IS NOT NULL",
+    "DELETE FROM user_usage",
+    "INSERT INTO user_usage(user_id, file_count, total_bytes) "
+    "SELECT user_id, count(*), coalesce(sum(size_bytes), 0) FROM files GROUP BY user_id",
+]
+
+DROP_SQLITE = [f"DROP TRIGGER IF EXISTS files_usage_{suffix}" for suffix in ('ai', 'ad', 'au')]
+DROP_POSTGRES = [
+    "DROP TRIGGER IF EXISTS files_usage_aid ON files",
+    "DROP TRIGGER IF EXISTS files_usage_au ON files",
+    "DROP FUNCTION IF EXISTS files_usage_trg()",
+]
+
+
+def _has_usage_triggers(connection):
+    if connection.dialect.name == 'sqlite':
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'files_usage_ai'"
+    else:
+        sql = "SELECT 1 FROM pg_trigger WHERE tgname = 'files_usage_aid'"
+    return connection.exec_driver_sql(sql).first() is not None
+
+
+def install_usage(connection):
+    """Create the usage triggers if missing and count the existing files."""
+    dialect = connection.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        return
+    # Databases that predate the table get it from the Alembic migration
+    if not inspect(connection).has_table('user_usage'):
+        return
+    if _has_usage_triggers(connection):
+        return
+    for statement in (SQLITE_DDL if dialect == 'sqlite' else POSTGRES_DDL):
+        connection.exec_driver_sql(statement)
+    for statement in BACKFILL:
+        connection.exec_driver_sql(statement)
+
+
+def uninstall_usage(connection):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        statements = DROP_SQLITE
+    elif dialect == 'postgresql':
+        statements = DROP_POSTGRES
+    else:
+        return
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+# A multipart Content-Length also counts the boundaries and the other form
+# fields; an upload within this much of the quota is left to the exact check
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, quota_bytes, used_bytes, incoming_bytes):
+        super().__init__(quota_bytes, used_bytes, incoming_bytes)
+        self.quota_bytes = quota_bytes
+        self.used_bytes = used_bytes
+        self.incoming_bytes = incoming_bytes
+
+
+def quota_bytes():
+    """Per-user storage limit, or None when uploads are unlimited."""
+    return current_app.config['USER_QUOTA_BYTES'] or None
+
+
+def used_bytes(user_id):
+    return db.session.scalar(select(UserUsage.total_bytes).where(UserUsage.user_id == user_id)) or 0
+
+
+def check_quota(user_id, incoming_bytes=0, counted=False):
+    """Raise QuotaExceeded if ``incoming_bytes`` more would take the user over quota.
+
+    Called with the upload's declared size before anything is stored, and
+    again with ``counted=True`` once the new File row is flushed: the
+    triggers have added its exact size by then, and on PostgreSQL they hold
+    the user's usage row locked until commit, so concurrent uploads by one
+    user cannot both slip under.
+    """
+    quota = quota_bytes()
+    if quota is None:
+        return
+    used = used_bytes(user_id) - (incoming_bytes if counted else 0)
+    if used + incoming_bytes > quota:
+        raise QuotaExceeded(quota, used, incoming_bytes)
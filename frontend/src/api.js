@@ -35,11 +35,14 @@ const api = {
       method: "PATCH", 
       body: JSON.stringify(data) 
     }),
-  delete: (endpoint) => request(endpoint, { method: "DELETE" }),
+  delete: (endpoint, data) =>
+    request(endpoint, data === undefined
+      ? { method: "DELETE" }
+      : { method: "DELETE", body: JSON.stringify(data) }),
   
   // Specific API methods
   files: {
-    getAll: () => api.get('/files'),
+    getAll: (cursor) => api.get(cursor ? `/files?cursor=${encodeURIComponent(cursor)}` : '/files'),
     getById: (id) => api.get(`/files/${id}`),
     create: (formData) => api.post('/files', formData, true),
     update: (id, data) => api.patch(`/files/${id}`, data),
@@ -48,13 +51,16 @@ const api = {
   },
   
   collections: {
-    getAll: () => api.get('/collections'),
-    create: (data) => api.post('/collections', data)
+    getAll: (cursor) => api.get(cursor ? `/collections?cursor=${encodeURIComponent(cursor)}` : '/collections'),
+    create: (data) => api.post('/collections', data),
+    addFiles: (id, fileIds) => api.post(`/collections/${id}/files`, { file_ids: fileIds }),
+    removeFiles: (id, fileIds) => api.delete(`/collections/${id}/files`, { file_ids: fileIds })
   },
   
   tags: {
     getAll: () => api.get('/tags'),
-    create: (data) => api.post('/tags', data)
+    create: (data) => api.post('/tags', data),
+    suggest: (prefix, limit = 8) => api.get(`/tags/suggest?prefix=${encodeURIComponent(prefix)}&limit=${limit}`)
   },
   
   users: {
@@ -62,7 +68,40 @@ const api = {
     create: (data) => api.post('/users', data)
   },
   
+  changes: {
+    // Current cursor only; load lists after this, then poll with it
+    head: () => api.get('/changes'),
+    since: (cursor, types) => api.get(`/changes?since=${encodeURIComponent(cursor)}&types=${types}`)
+  },
+
   health: () => api.get('/health')
 };
 
+// Fetch every change after `cursor`; returns { changes, cursor }
+export async function pullChanges(cursor, types) {
+  const changes = []
+  let page
+  do {
+    page = await api.changes.since(cursor, types)
+    changes.push(...page.changes)
+    cursor = page.next_cursor
+  } while (page.has_more)
+  return { changes, cursor }
+}
+
+// Apply feed entries to a newest-first list. Rows older than the loaded
+// pages are left for "Load more" to bring in.
+export function applyChanges(items, changes, hasMore) {
+  const byId = new Map(items.map((item) => [item.id, item]))
+  const oldest = items[items.length - 1]
+  for (const change of changes) {
+    if (change.op === 'delete') {
+      byId.delete(change.id)
+    } else if (byId.has(change.id) || !hasMore || !oldest || change.data.created_at >= oldest.created_at) {
+      byId.set(change.id, change.data)
+    }
+  }
+  return [...byId.values()].sort((a, b) => b.created_at.localeCompare(a.created_at) || b.id - a.id)
+}
+
 export default api;
@@ -0,0 +1,42 @@
+import { useEffect, useId, useState } from 'react'
+import api from '../api'
+
+// Comma-separated tags with suggestions for the tag being typed. Each option
+// is the whole field with that tag completed, since a datalist matches the
+// full input value.
+export default function TagsInput({ value, onChange, ...props }) {
+  const listId = useId()
+  const [options, setOptions] = useState([])
+
+  useEffect(() => {
+    const parts = value.split(',')
+    const prefix = parts[parts.length - 1].trim()
+    if (!prefix) {
+      setOptions([])
+      return
+    }
+    let cancelled = false
+    const head = parts.slice(0, -1).map((t) => t.trim()).filter(Boolean)
+    api.tags
+      .suggest(prefix)
+      .then((tags) => {
+        if (cancelled) return
+        setOptions(tags.filter((t) => !head.includes(t.name)).map((t) => [...head, t.name].join(', ')))
+      })
+      .catch(() => {})
+    return () => {
+      cancelled = true
+    }
+  }, [value])
+
+  return (
+    <>
+      <input {...props} value={value} onChange={onChange} list={listId} autoComplete="off" />
+      <datalist id={listId}>
+        {options.map((option) => (
+          <option key={option} value={option} />
+        ))}
+      </datalist>
+    </>
+  )
+}
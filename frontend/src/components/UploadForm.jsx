@@ -2,6 +2,7 @@ import { useState } from 'react'
 import { Formik, Form, Field, ErrorMessage } from 'formik'
 import * as Yup from 'yup'
 import api from '../api'
+import TagsInput from './TagsInput'
 import { useAuth } from '../context/AuthContext'
 
 const UploadSchema = Yup.object().shape({
@@ -33,7 +34,8 @@ export default function UploadForm({ onSuccess }) {
           form.append('filename', values.filename)
           if (values.file) form.append('file', values.file)
 
-          await api.post('/files', form, true)
+          // user_id in the query lets the server check the quota before reading the body
+          await api.post(`/files?user_id=${encodeURIComponent(values.user_id)}`, form, true)
           resetForm()
           onSuccess?.()
         } catch (e) {
@@ -60,7 +62,7 @@ export default function UploadForm({ onSuccess }) {
 
           <label>
             Tags (comma separated)
-            <Field name="tags" placeholder="finance, q3" />
+            <Field name="tags" as={TagsInput} placeholder="finance, q3" />
           </label>
 
           <label>
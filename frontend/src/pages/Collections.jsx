@@ -1,21 +1,52 @@
 import { useEffect, useState } from 'react'
-import api from '../api'
+import api, { applyChanges, pullChanges } from '../api'
 import { useAuth } from '../context/AuthContext'
 
 export default function Collections() {
   const [collections, setCollections] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
+  const [changeCursor, setChangeCursor] = useState(null)
   const [name, setName] = useState('')
   const { user } = useAuth()
   const [userId, setUserId] = useState(user?.id || 1)
   const [error, setError] = useState('')
   const [editing, setEditing] = useState(null)
-  const [form, setForm] = useState({ name: '', file_ids: '' })
+  const [form, setForm] = useState({ name: '', add: '', remove: '' })
 
   const load = async () => {
     try {
       setError('')
+      // Cursor first, so nothing written during the load is missed
+      const head = await api.changes.head()
       const data = await api.get('/collections')
-      setCollections(data)
+      setCollections(data.items)
+      setNextCursor(data.next_cursor)
+      setChangeCursor(head.next_cursor)
+    } catch (e) {
+      setError(e.message)
+    }
+  }
+
+  // Fetch only what changed since the last load or refresh
+  const refresh = async () => {
+    if (!changeCursor) return load()
+    try {
+      setError('')
+      const { changes, cursor } = await pullChanges(changeCursor, 'collection')
+      setCollections((prev) => applyChanges(prev, changes, Boolean(nextCursor)))
+      setChangeCursor(cursor)
+    } catch (e) {
+      // Expired cursor (410) or any other failure: start over
+      load()
+    }
+  }
+
+  const loadMore = async () => {
+    try {
+      setError('')
+      const data = await api.get(`/collections?cursor=${encodeURIComponent(nextCursor)}`)
+      setCollections((prev) => [...prev, ...data.items])
+      setNextCursor(data.next_cursor)
     } catch (e) {
       setError(e.message)
     }
@@ -30,7 +61,7 @@ export default function Collections() {
     try {
       await api.post('/collections', { name, user_id: Number(userId), file_ids: [] })
       setName('')
-      load()
+      refresh()
     } catch (e) {
       setError(e.message)
     }
@@ -38,24 +69,29 @@ export default function Collections() {
 
   const startEdit = (c) => {
     setEditing(c.id)
-    setForm({
-      name: c.name || '',
-      file_ids: (c.files || []).map((f) => f.id).join(', '),
-    })
+    setForm({ name: c.name || '', add: '', remove: '' })
   }
 
   const cancelEdit = () => {
     setEditing(null)
-    setForm({ name: '', file_ids: '' })
+    setForm({ name: '', add: '', remove: '' })
   }
 
+  const parseIds = (value) =>
+    value
+      .split(',')
+      .filter((x) => String(x).trim())
+      .map((x) => Number(String(x).trim()))
+      .filter((n) => Number.isFinite(n))
+
   const save = async (id) => {
     try {
-      const file_ids = form.file_ids
-        .split(',')
-        .map((x) => Number(String(x).trim()))
-        .filter((n) => Number.isFinite(n))
-      const updated = await api.patch(`/collections/${id}`, { name: form.name, file_ids })
+      // Send only the membership changes, never the full file list
+      const add = parseIds(form.add)
+      const removeIds = parseIds(form.remove)
+      if (add.length) await api.collections.addFiles(id, add)
+      if (removeIds.length) await api.collections.removeFiles(id, removeIds)
+      const updated = await api.patch(`/collections/${id}`, { name: form.name })
       setCollections((prev) => prev.map((c) => (c.id === id ? updated : c)))
       cancelEdit()
     } catch (e) {
@@ -99,8 +135,12 @@ export default function Collections() {
                     <input value={form.name} onChange={(e) => setForm({ ...form, name: e.target.value })} />
                   </label>
                   <label>
-                    File IDs (comma separated)
-                    <input value={form.file_ids} onChange={(e) => setForm({ ...form, file_ids: e.target.value })} />
+                    Add file IDs (comma separated)
+                    <input value={form.add} onChange={(e) => setForm({ ...form, add: e.target.value })} />
+                  </label>
+                  <label>
+                    Remove file IDs (comma separated)
+                    <input value={form.remove} onChange={(e) => setForm({ ...form, remove: e.target.value })} />
                   </label>
                   <div style={{ display: 'flex', gap: 8 }}>
                     <button onClick={() => save(c.id)}>Save</button>
@@ -112,7 +152,7 @@ export default function Collections() {
               <>
                 <div>
                   <strong>{c.name}</strong>
-                  <small> — {c.files?.length || 0} files</small>
+                  <small> — {c.file_count || 0} files</small>
                 </div>
                 <div style={{ display: 'flex', gap: 8 }}>
                   <button onClick={() => startEdit(c)}>Edit</button>
@@ -123,6 +163,7 @@ export default function Collections() {
           </li>
         ))}
       </ul>
+      {nextCursor && <button onClick={loadMore}>Load more</button>}
     </div>
   )
 }
@@ -1,8 +1,11 @@
 import { useEffect, useState } from 'react'
-import api from '../api'
+import api, { applyChanges, pullChanges } from '../api'
+import TagsInput from '../components/TagsInput'
 
 export default function Dashboard() {
   const [files, setFiles] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
+  const [changeCursor, setChangeCursor] = useState(null)
   const [error, setError] = useState('')
   const [editing, setEditing] = useState(null)
   const [form, setForm] = useState({ filename: '', description: '', tags: '' })
@@ -10,8 +13,37 @@ export default function Dashboard() {
   const load = async () => {
     try {
       setError('')
+      // Cursor first, so nothing written during the load is missed
+      const head = await api.changes.head()
       const data = await api.get('/files')
-      setFiles(data)
+      setFiles(data.items)
+      setNextCursor(data.next_cursor)
+      setChangeCursor(head.next_cursor)
+    } catch (e) {
+      setError(e.message)
+    }
+  }
+
+  // Fetch only what changed since the last load or refresh
+  const refresh = async () => {
+    if (!changeCursor) return load()
+    try {
+      setError('')
+      const { changes, cursor } = await pullChanges(changeCursor, 'file')
+      setFiles((prev) => applyChanges(prev, changes, Boolean(nextCursor)))
+      setChangeCursor(cursor)
+    } catch (e) {
+      // Expired cursor (410) or any other failure: start over
+      load()
+    }
+  }
+
+  const loadMore = async () => {
+    try {
+      setError('')
+      const data = await api.get(`/files?cursor=${encodeURIComponent(nextCursor)}`)
+      setFiles((prev) => [...prev, ...data.items])
+      setNextCursor(data.next_cursor)
     } catch (e) {
       setError(e.message)
     }
@@ -66,7 +98,7 @@ export default function Dashboard() {
     <div className="page">
       <h2>Files</h2>
       {error && <div className="error">{error}</div>}
-      <button onClick={load}>Refresh</button>
+      <button onClick={refresh}>Refresh</button>
       <ul className="list">
         {files.map((f) => (
           <li key={f.id} className="list-item">
@@ -83,7 +115,7 @@ export default function Dashboard() {
                   </label>
                   <label>
                     Tags (comma separated)
-                    <input value={form.tags} onChange={(e) => setForm({ ...form, tags: e.target.value })} />
+                    <TagsInput value={form.tags} onChange={(e) => setForm({ ...form, tags: e.target.value })} />
                   </label>
                   <div style={{ display: 'flex', gap: 8 }}>
                     <button onClick={() => save(f.id)}>Save</button>
@@ -109,6 +141,7 @@ export default function Dashboard() {
           </li>
         ))}
       </ul>
+      {nextCursor && <button onClick={loadMore}>Load more</button>}
     </div>
   )
 }